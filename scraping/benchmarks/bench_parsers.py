@@ -0,0 +1,230 @@
+"""
+Benchmark of the extractors and parser backends, on the whole page vs on the fragments the
+extractors need.
+
+Every (page type, backend, full page/fragments) combination reports pages per second and the
+peak memory allocated per page. The pages come from the fixture corpus, or from the on-disk
+response cache of a previous crawl :
+    python -m benchmarks.bench_parsers
+    python -m benchmarks.bench_parsers --cache-dir ../data/.http_cache
+
+Throughputs can be compared to a baseline recorded on the same machine, the run fails if one
+of them dropped by more than the tolerance :
+    python -m benchmarks.bench_parsers --save-baseline
+    python -m benchmarks.bench_parsers --check --tolerance 0.25
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import gc
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from src.cache import ResponseCache, DEFAULT_CACHE_DIR
+from src.parsing import available_parsers, make_soup
+from src.get_tt_races import parse_race, RACE_FRAGMENTS
+from src.get_tt_results import parse_results, RESULTS_FRAGMENTS
+from src.get_tt_specialists import parse_rankings, parse_rider, RANKINGS_FRAGMENTS, RIDER_FRAGMENTS
+from tests.fixtures import pages as fixture_pages
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCE = 0.25
+
+# page type -> (URL pattern, fragments, extractor)
+PAGE_TYPES = {
+    "race" : (
+        re.compile(r"/race/"),
+        RACE_FRAGMENTS,
+        lambda url, soup: parse_race(soup, verbose=False)
+    ),
+    "results" : (
+        re.compile(r"/rider/[^/]+/results/"),
+        RESULTS_FRAGMENTS,
+        lambda url, soup: parse_results(url, soup, verbose=False)
+    ),
+    "rider" : (
+        re.compile(r"/rider/[^/]+$"),
+        RIDER_FRAGMENTS,
+        lambda url, soup: parse_rider("RIDER Name", soup, verbose=False)
+    ),
+    "rankings" : (
+        re.compile(r"/rankings\.php"),
+        RANKINGS_FRAGMENTS,
+        lambda url, soup: parse_rankings(soup)
+    ),
+}
+
+def pages_from_fixtures() -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Returns:
+        Dict[str, List[Tuple[str, str]]]: page type -> [(url, html)] of the fixture corpus.
+    """
+    return {page_type : fixture_pages(page_type) for page_type in PAGE_TYPES}
+
+def pages_from_cache(cache : ResponseCache, limit : int) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Collects up to limit cached pages per page type.
+    Returns:
+        Dict[str, List[Tuple[str, str]]]: page type -> [(url, html)]
+    """
+    pages = {page_type : [] for page_type in PAGE_TYPES}
+    for url in list(cache._index): # pylint: disable=protected-access
+        for page_type, (pattern, _, _) in PAGE_TYPES.items():
+            if pattern.search(url) and len(pages[page_type]) < limit:
+                html = cache.get(url)
+                if html is not None:
+                    pages[page_type].append((url, html))
+                break
+    return pages
+
+def pages_per_second(
+    pages : List[Tuple[str, str]],
+    parse : Callable[[str, str], object],
+    repeat : int = 20
+    ) -> float:
+    """
+    Each page is timed repeat times and only its fastest run is kept, with the garbage collector
+    disabled like timeit does : the minimum is the measure least sensitive to other processes
+    competing for the CPU, which keeps the figures comparable from one run to the next.
+    Returns:
+        float: Pages parsed and extracted per second.
+    """
+    total = 0.0
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for url, html in pages:
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                parse(url, html)
+                best = min(best, time.perf_counter() - start)
+            total += best
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return len(pages) / total
+
+def peak_allocations(pages : List[Tuple[str, str]], parse : Callable[[str, str], object]) -> float:
+    """
+    Returns:
+        float: Average peak of the memory allocated while parsing one page, in KiB.
+    """
+    total = 0
+    tracemalloc.start()
+    try:
+        for url, html in pages:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            parse(url, html)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(pages) / 1024
+
+def run(pages : Dict[str, List[Tuple[str, str]]], repeat : int = 20) -> Dict[str, Dict]:
+    """
+    Benchmarks every (page type, backend, full page/fragments) combination, and checks that
+    every combination extracts the same data.
+    Args:
+        pages (Dict[str, List[Tuple[str, str]]]): page type -> [(url, html)]
+        repeat (int): Number of timed runs per page, the fastest one is kept. Defaults to 20.
+    Returns:
+        Dict[str, Dict]: "page_type/parser/mode" -> {"pages_per_second", "peak_kib"}
+    """
+    measures = {}
+    for page_type, (_, fragments, extract) in PAGE_TYPES.items():
+        if not pages[page_type]:
+            continue
+        reference = None
+        for parser in reversed(available_parsers()):
+            for only in (None, fragments):
+                def parse(url, html, parser=parser, only=only, extract=extract):
+                    return extract(url, make_soup(html, parser, only))
+                output = [parse(url, html) for url, html in pages[page_type]]
+                if reference is None:
+                    reference = output
+                elif output != reference:
+                    raise AssertionError(f"{page_type} : {parser} {only} gives a different output")
+                mode = "fragments" if only else "full"
+                throughput = pages_per_second(pages[page_type], parse, repeat)
+                measures[f"{page_type}/{parser}/{mode}"] = {
+                    "pages_per_second" : round(throughput, 1),
+                    "peak_kib" : round(peak_allocations(pages[page_type], parse), 1),
+                }
+    return measures
+
+def regressions(
+    measures : Dict[str, Dict],
+    baseline : Dict[str, Dict],
+    tolerance : float = DEFAULT_TOLERANCE
+    ) -> List[str]:
+    """
+    Args:
+        measures (Dict[str, Dict]): Output of run.
+        baseline (Dict[str, Dict]): Output of a previous run.
+        tolerance (float): Accepted relative drop of throughput. Defaults to 0.25.
+    Returns:
+        List[str]: Combinations whose throughput dropped by more than the tolerance.
+    """
+    slower = []
+    for key, measure in measures.items():
+        if key in baseline:
+            floor = (1 - tolerance) * baseline[key]["pages_per_second"]
+            if measure["pages_per_second"] < floor:
+                slower.append(key)
+    return slower
+
+def report(measures : Dict[str, Dict], baseline : Optional[Dict[str, Dict]] = None):
+    """
+    Prints the measures, relative to the baseline if given.
+    """
+    for key, measure in measures.items():
+        page_type, parser, mode = key.split("/")
+        line = (
+            f"{page_type:9} {parser:12} {mode:10} {measure['pages_per_second']:9.1f} pages/s"
+            f"  {measure['peak_kib']:8.1f} KiB/page"
+        )
+        if baseline and key in baseline:
+            ratio = measure["pages_per_second"] / baseline[key]["pages_per_second"]
+            line += f"  x{ratio:.2f} vs baseline"
+        print(line)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument(
+        "--cache-dir", help=f"read the pages from a response cache, e.g. {DEFAULT_CACHE_DIR}"
+    )
+    arg_parser.add_argument("--limit", type=int, default=50, help="cached pages per page type")
+    arg_parser.add_argument("--repeat", type=int, default=20, help="timed runs per page")
+    arg_parser.add_argument("--baseline", default=BASELINE_PATH)
+    arg_parser.add_argument("--save-baseline", action="store_true")
+    arg_parser.add_argument("--check", action="store_true", help="fail on a regression")
+    arg_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = arg_parser.parse_args()
+
+    if args.cache_dir:
+        corpus = pages_from_cache(ResponseCache(args.cache_dir, offline=True), args.limit)
+    else:
+        corpus = pages_from_fixtures()
+    results = run(corpus, args.repeat)
+
+    stored = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+    report(results, stored)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+    if args.check:
+        if stored is None:
+            sys.exit(f"No baseline at {args.baseline}, run with --save-baseline first")
+        slower = regressions(results, stored, args.tolerance)
+        if slower:
+            sys.exit(f"Throughput dropped by more than {args.tolerance:.0%} : {', '.join(slower)}")
+        print(f"No regression beyond {args.tolerance:.0%}")
@@ -0,0 +1,224 @@
+"""
+Benchmark of the startup of the pcs-chrono command line.
+
+Every command runs in a fresh interpreter with -X importtime : it reports the wall time, the
+time spent importing modules and the heavy dependencies it imported. Quick commands (the help
+and argument checks of every subcommand) must import none of them and start within the budget.
+Quick runs (a query, an estimate and an export on a small sample dataset) may import pandas and
+numpy, never the crawler's network and parsing stack, and must finish within the run budget.
+The full import graph of the crawler is given for comparison :
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --check --budget 0.5
+"""
+
+from typing import Dict, List, Sequence
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_PATH = os.path.join(ROOT, "pcs_chrono.py")
+DEFAULT_BUDGET = 0.5
+DEFAULT_RUN_BUDGET = 1.0
+HEAVY_MODULES = ("pandas", "numpy", "aiohttp", "bs4", "requests", "tqdm", "sklearn")
+SUBCOMMANDS = ("crawl", "update", "race", "export", "assets", "query", "predict")
+QUICK_COMMANDS = [["--help"]] + [[subcommand, "--help"] for subcommand in SUBCOMMANDS] \
+    + [["query"], ["predict", "forecast"]]
+# Modules the quick runs need, the other HEAVY_MODULES belong to the crawler or to training
+RUN_MODULES = ("pandas", "numpy")
+SAMPLE_RACES = 20
+FEATURE_VALUES = {
+    "distance" : 30, "vertical_meters" : 200, "startlist_quality" : 900, "profile_score" : 15
+}
+
+def write_sample_dataset(data_dir : str, races : int = SAMPLE_RACES):
+    """
+    Writes a small dataset for the quick runs, with the standard library only.
+    Args:
+        data_dir (str): Directory of the CSV files, created if needed.
+        races (int): Number of races, each one with 3 results. Defaults to SAMPLE_RACES.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    base = "https://www.procyclingstats.com/"
+    riders = [(f"Rider{i}", f"NAME{i}", f"{base}rider/rider-{i}") for i in range(5)]
+    tables = {
+        "riders" : [
+            {"first_name" : first, "last_name" : last, "full_name" : f"{last} {first}",
+             "url" : url}
+            for first, last, url in riders
+        ],
+        "races" : [
+            {"race_title" : f"Race {i} (ITT)", "date" : f"2024-{i % 12 + 1:02}-{i % 28 + 1:02}",
+             "class" : "2.1", "distance" : 10 + i, "vertical_meters" : 20 * i,
+             "startlist_quality" : 500 + 10 * i, "profile_score" : i % 7,
+             "winner_time" : 60 * (10 + i) * 60 // (45 + i % 5),
+             "winner_speed" : 45 + i % 5, "url" : f"{base}race/race-{i}/2024/result"}
+            for i in range(races)
+        ],
+    }
+    tables["results"] = [
+        {"rider_url" : f"{riders[(i + rank) % len(riders)][2]}/results/last-tt-results",
+         "result" : rank + 1, "pnt" : 0, "seconds_lost" : 5 * rank, "race_url" : race["url"]}
+        for i, race in enumerate(tables["races"]) for rank in range(3)
+    ]
+    for table, rows in tables.items():
+        with open(os.path.join(data_dir, f"{table}.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+def quick_runs(directory : str) -> Dict[str, List[str]]:
+    """
+    Writes the sample dataset, its index and a model to a directory, the setup not being
+    measured.
+    Args:
+        directory (str): Working directory of the runs.
+    Returns:
+        Dict[str, List[str]]: Arguments of each quick run, by name.
+    """
+    data_dir = os.path.join(directory, "data")
+    index_dir = os.path.join(directory, "index")
+    models_dir = os.path.join(directory, "models")
+    write_sample_dataset(data_dir)
+    for setup in (
+        ["query", "build", "--data-dir", data_dir, "--index-dir", index_dir],
+        ["predict", "train", "--data-dir", data_dir, "--models-dir", models_dir],
+    ):
+        subprocess.run(
+            [sys.executable, CLI_PATH, *setup], cwd=ROOT, capture_output=True, check=True
+        )
+    features = [
+        argument for name, value in FEATURE_VALUES.items()
+        for argument in ("--feature", f"{name}={value}")
+    ]
+    return {
+        "query races" : [
+            "query", "races", "--index-dir", index_dir, "--top", "5", "--by", "winner_speed"
+        ],
+        "predict estimate" : ["predict", "estimate", "--models-dir", models_dir, *features],
+        "export --format csv" : [
+            "export", "--format", "csv", "--data-dir", data_dir,
+            "--output", os.path.join(directory, "export")
+        ],
+    }
+
+def import_profile(stderr : str) -> Dict:
+    """
+    Args:
+        stderr (str): Standard error of an interpreter run with -X importtime.
+    Returns:
+        Dict: import_ms, the time spent importing modules, and heavy, the HEAVY_MODULES
+            imported.
+    """
+    total = 0
+    heavy = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Top level imports are the only ones not indented, their times include the others
+        if not name.startswith("  "):
+            total += int(cumulative)
+        root = name.strip().split(".")[0]
+        if root in HEAVY_MODULES:
+            heavy.add(root)
+    return {"import_ms" : round(total / 1000, 1), "heavy" : sorted(heavy)}
+
+def measure(args : Sequence[str], repeat : int = 5, module : bool = False) -> Dict:
+    """
+    Args:
+        args (Sequence[str]): Arguments of the command line, or name of the module to import.
+        repeat (int): Runs, the median one is reported. Defaults to 5.
+        module (bool): Whether to import a module rather than run the command line.
+    Returns:
+        Dict: seconds (wall time), import_ms and heavy, see import_profile, and returncode.
+    """
+    command = [sys.executable, "-X", "importtime"]
+    command += ["-c", f"import {args[0]}"] if module else [CLI_PATH, *args]
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=False)
+        runs.append((time.perf_counter() - start, process.stderr, process.returncode))
+    seconds, stderr, returncode = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+    return {"seconds" : round(seconds, 3), **import_profile(stderr), "returncode" : returncode}
+
+def run(repeat : int = 5) -> Dict[str, Dict]:
+    """
+    Args:
+        repeat (int): Runs of each command. Defaults to 5.
+    Returns:
+        Dict[str, Dict]: Measures of the quick commands by command line, then of the quick runs
+            by name, flagged run, see measure.
+    """
+    measures = {" ".join(args) : measure(args, repeat) for args in QUICK_COMMANDS}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, args in quick_runs(directory).items():
+            measures[name] = {**measure(args, repeat), "run" : True}
+    return measures
+
+def failures(
+    measures : Dict[str, Dict],
+    budget : float = DEFAULT_BUDGET,
+    run_budget : float = DEFAULT_RUN_BUDGET
+    ) -> List[str]:
+    """
+    Args:
+        measures (Dict[str, Dict]): Measures, see run.
+        budget (float): Seconds a quick command may take. Defaults to DEFAULT_BUDGET.
+        run_budget (float): Seconds a quick run may take. Defaults to DEFAULT_RUN_BUDGET.
+    Returns:
+        List[str]: The commands over budget or importing a heavy module, RUN_MODULES being
+            allowed in the quick runs, and the quick runs that failed.
+    """
+    slow = []
+    for command, measure in measures.items():
+        allowed = RUN_MODULES if measure.get("run") else ()
+        heavy = [module for module in measure["heavy"] if module not in allowed]
+        if measure["seconds"] > (run_budget if measure.get("run") else budget) or heavy \
+                or (measure.get("run") and measure["returncode"] != 0):
+            slow.append(command)
+    return slow
+
+def report(measures : Dict[str, Dict]):
+    """
+    Prints the measures.
+    """
+    print(f"{'command':<30} {'seconds':>8} {'imports ms':>11}  heavy modules")
+    for command, measure in measures.items():
+        print(
+            f"{command:<30} {measure['seconds']:>8.3f} {measure['import_ms']:>11.1f}  "
+            + (", ".join(measure["heavy"]) or "-")
+        )
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--repeat", type=int, default=5, help="runs per command")
+    arg_parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="seconds")
+    arg_parser.add_argument(
+        "--run-budget", type=float, default=DEFAULT_RUN_BUDGET, help="seconds of a quick run"
+    )
+    arg_parser.add_argument("--check", action="store_true", help="fail on a slow quick command")
+    args = arg_parser.parse_args()
+
+    measures = run(args.repeat)
+    report(measures)
+    print("\nFull import graph, for comparison :")
+    report({
+        f"import {module}" : measure([module], args.repeat, module=True)
+        for module in ("main", "src.query", "src.prediction", "src.get_tt_races")
+    })
+    if args.check:
+        slow = failures(measures, args.budget, args.run_budget)
+        if slow:
+            sys.exit(f"Over budget or importing heavy modules : {slow}")
+        print(
+            f"\nEvery quick command started within {args.budget} s, every quick run finished"
+            f" within {args.run_budget} s"
+        )
@@ -0,0 +1,140 @@
+"""
+End-to-end load test : runs main.py against the mock PCS server and reports requests per second,
+end-to-end time and peak memory.
+
+    python -m benchmarks.load_test --riders 5000 --races 20000 --latency 0.05 --rate-429 0.01
+
+The crawl runs in its own process, pointed to the mock server through PCS_BASE_URL, in a
+temporary working directory so that its CSV files and response cache start empty.
+"""
+
+from typing import Dict, Optional
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import pandas as pd
+from benchmarks.mock_pcs import STATS, MockConfig, base_url, start_server
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+SEASONS = (2020, 2024)
+
+def _rows(path : str) -> int:
+    return len(pd.read_csv(path)) if os.path.exists(path) else 0
+
+async def run_load_test(
+    config : MockConfig,
+    concurrency : int = 32,
+    workdir : Optional[str] = None,
+    strategy : str = "rider"
+    ) -> Dict:
+    """
+    Crawls the mock server with main.py, every rider of the server being discovered.
+    Args:
+        config (MockConfig): Scale and behaviour of the mock server.
+        concurrency (int): Pages processed at once per stage of the crawl. Defaults to 32.
+        workdir (str, optional): Working directory of the crawl. Defaults to a temporary one.
+        strategy (str): Crawl strategy, see src.pipeline.STRATEGIES. Defaults to "rider".
+    Returns:
+        Dict: Figures of the run.
+    """
+    if workdir is None:
+        with tempfile.TemporaryDirectory() as tmp:
+            return await run_load_test(config, concurrency, tmp, strategy)
+
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    runner = await start_server(config)
+    stats = runner.app[STATS]
+    seasons = SEASONS[1] - SEASONS[0] + 1
+    # Consecutive seasons rank disjoint blocks of season_shift riders
+    top_n = min(config.riders, config.season_shift)
+    try:
+        with open(os.path.join(workdir, "crawl.log"), "w", encoding="utf-8") as log:
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, MAIN_PATH,
+                "--years", str(SEASONS[0]), str(SEASONS[1]),
+                "--top-n", str(top_n),
+                "--concurrency", str(concurrency),
+                "--strategy", strategy,
+                cwd=workdir,
+                env=dict(os.environ, PCS_BASE_URL=base_url(runner)),
+                stdout=log,
+                stderr=log
+            )
+            returncode = await process.wait()
+            elapsed = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+
+    # ru_maxrss is in KiB on Linux : largest resident set of the crawl and its workers
+    peak_kib = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    errors_path = os.path.join(workdir, "data", "errors.json")
+    failures = 0
+    if os.path.exists(errors_path):
+        with open(errors_path, encoding="utf-8") as f:
+            failures = len(json.load(f))
+    # Written by the crawl itself, see src.metrics
+    metrics_path = os.path.join(workdir, "data", "metrics.json")
+    stage_seconds = {}
+    if os.path.exists(metrics_path):
+        with open(metrics_path, encoding="utf-8") as f:
+            stage_seconds = json.load(f)["stage_seconds"]
+    results = _rows(os.path.join(workdir, "data", "results.csv"))
+    return {
+        "returncode" : returncode,
+        "seasons" : seasons,
+        "top_n" : top_n,
+        "concurrency" : concurrency,
+        "strategy" : strategy,
+        "elapsed_s" : round(elapsed, 2),
+        "requests" : stats.requests,
+        "requests_per_s" : round(stats.requests / elapsed, 1),
+        "statuses" : stats.statuses,
+        "mib_served" : round(stats.bytes_sent / 2**20, 1),
+        "peak_rss_mib" : round(peak_kib / 1024, 1),
+        "riders" : _rows(os.path.join(workdir, "data", "riders.csv")),
+        "results" : results,
+        "results_per_request" : round(results / max(stats.requests, 1), 2),
+        "races" : _rows(os.path.join(workdir, "data", "races.csv")),
+        "failed_pages" : failures,
+        "stage_seconds" : stage_seconds,
+    }
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--riders", type=int, default=MockConfig.riders)
+    arg_parser.add_argument("--races", type=int, default=MockConfig.races)
+    arg_parser.add_argument("--results-per-rider", type=int, default=MockConfig.results_per_rider)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    arg_parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503s")
+    arg_parser.add_argument("--rate-429", type=float, default=0.0, help="share of 429s")
+    arg_parser.add_argument("--concurrency", type=int, default=32)
+    arg_parser.add_argument("--strategy", choices=("rider", "race"), default="rider")
+    arg_parser.add_argument("--workdir", help="keep the crawl output there")
+    arg_parser.add_argument("--output", help="also write the figures to this JSON file")
+    args = arg_parser.parse_args()
+
+    figures = asyncio.run(run_load_test(
+        MockConfig(
+            riders=args.riders,
+            races=args.races,
+            results_per_rider=args.results_per_rider,
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            rate_429=args.rate_429
+        ),
+        concurrency=args.concurrency,
+        workdir=args.workdir,
+        strategy=args.strategy
+    ))
+    print(json.dumps(figures, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(figures, f, indent=4)
@@ -0,0 +1,349 @@
+"""
+Local stand-in for ProCyclingStats : serves synthetic rankings, rider, results and race pages in
+the PCS markup the extractors read, and the images they link to, at any scale, with configurable
+latency and failures.
+
+    python -m benchmarks.mock_pcs --riders 5000 --races 20000 --latency 0.05 --error-rate 0.01
+    PCS_BASE_URL=http://127.0.0.1:8080/ python main.py
+
+Pages are generated on the fly and deterministically from their URL, so any scale costs no
+memory on the server side.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import argparse
+import asyncio
+import hashlib
+import random
+import struct
+import zlib
+from aiohttp import web
+
+DEFAULT_PORT = 8080
+FIRST_SEASON = 2000
+CLASSES = ("2.UWT", "2.Pro", "2.1", "WC", "NC", "Olympics")
+MONTHS = (
+    "January", "February", "March", "April", "May", "June", "July", "August", "September",
+    "October", "November", "December"
+)
+
+@dataclass
+class MockConfig:
+    """
+    Scale and behaviour of the mock server.
+    """
+    riders : int = 500
+    races : int = 2000
+    results_per_rider : int = 20
+    # Riders of each season's rankings are shifted by this much from the previous season, so
+    # that crawling several seasons discovers more riders. Defaults to riders / 5.
+    season_shift : Optional[int] = None
+    # Seconds added to every response, uniformly drawn within +/- jitter
+    latency : float = 0.0
+    jitter : float = 0.0
+    # Share of the requests answered with a 503, and with a 429 and its Retry-After header
+    error_rate : float = 0.0
+    rate_429 : float = 0.0
+    retry_after : int = 1
+    seed : int = 0
+
+    def __post_init__(self):
+        if self.season_shift is None:
+            self.season_shift = max(1, self.riders // 5)
+
+@dataclass
+class MockStats:
+    """
+    Counters of the requests served.
+    """
+    requests : int = 0
+    bytes_sent : int = 0
+    statuses : Dict[int, int] = field(default_factory=dict)
+
+    def count(self, status : int, size : int = 0):
+        """
+        Records one response.
+        """
+        self.requests += 1
+        self.bytes_sent += size
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+STATS = web.AppKey("stats", MockStats)
+
+def _page(title : str, content : str) -> str:
+    return (
+        f"<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\"><title>{title}</title>"
+        "<link rel=\"stylesheet\" href=\"css/global.css\"></head><body>"
+        "<div class=\"header\"><ul class=\"menu\"><li><a href=\"races.php\">Races</a></li>"
+        "<li><a href=\"rankings.php\">Rankings</a></li></ul></div>"
+        f"<div class=\"wrapper\"><div class=\"content\">{content}</div></div>"
+        "<div class=\"footer\"><p>Mock ProCyclingStats</p></div></body></html>"
+    )
+
+def _rider_name(index : int) -> str:
+    return f"RIDER{index} Mock"
+
+def _race_path(index : int) -> str:
+    return f"race/mock-race-{index}/{2020 + index % 6}/result"
+
+def rankings_page(config : MockConfig, season : int, offset : int) -> str:
+    """
+    Returns:
+        str: Page of the time trial rankings of a season, 100 riders from offset.
+    """
+    first = (season - FIRST_SEASON) * config.season_shift
+    rows = "".join(
+        f"<tr><td>{rank + 1}</td><td>{rank + 1}</td><td><span class=\"flag xx\"></span></td>"
+        f"<td><a href=\"rider/rider-{(first + rank) % config.riders}\">"
+        f"{_rider_name((first + rank) % config.riders)}</a></td>"
+        f"<td><a href=\"team/mock-team\">Mock team</a></td><td>{5000 - rank}</td></tr>"
+        for rank in range(offset, min(offset + 100, config.riders))
+    )
+    return _page("Time trial ranking", (
+        "<div class=\"page-content\"><div><div class=\"filters\"></div><div class=\"mt10\"></div>"
+        "<div class=\"pagination\"></div><div><table class=\"basic\"><thead><tr><th>#</th>"
+        f"</tr></thead><tbody>{rows}</tbody></table></div></div></div>"
+    ))
+
+def rider_page(config : MockConfig, index : int) -> str:
+    """
+    Returns:
+        str: Profile page of a rider.
+    """
+    rng = random.Random(config.seed * 1_000_003 + index)
+    birth_year = rng.randint(1985, 2004)
+    specialties = "".join(
+        f"<li><div class=\"xvalue ac\">{rng.randint(0, 6000)}</div>"
+        f"<div class=\"xtitle\">{name}</div></li>"
+        for name in ("Onedayraces", "GC", "Time trial", "Sprint", "Climber", "Hills")
+    )
+    info = (
+        "<div><h3>Team</h3></div>"
+        "<div><ul class=\"list\"><li><div>Date of birth:</div><div>1st January</div>"
+        f"<div>{birth_year}</div><div>{birth_year}</div></li></ul></div>"
+        "<div><ul class=\"list\"><li><div>Nationality:</div><div class=\"flag xx\"></div>"
+        "<div><a href=\"nation/mockland\">Mockland</a></div></li></ul></div>"
+        f"<div><ul class=\"list\"><li><div>Weight:</div><div>{rng.randint(55, 90)}</div>"
+        f"<div>kg</div><div>Height:</div><div>{rng.randint(165, 200) / 100}</div><div>m</div>"
+        "</li></ul></div>"
+        f"<div><ul class=\"pps\">{specialties}</ul></div>"
+    )
+    return _page(_rider_name(index), (
+        "<div class=\"page-content\"><div><div class=\"borderbox left w40 mb_w100\">"
+        f"<div class=\"borderbox left w30 mr5\"><div><a href=\"rider/rider-{index}\">"
+        f"<img src=\"images/riders/rider-{index}.png\"></a></div></div>"
+        f"<div class=\"borderbox left w65\">{info}</div></div></div></div>"
+    ))
+
+def results_page(config : MockConfig, index : int) -> str:
+    """
+    Returns:
+        str: Time trial results page of a rider, newest first. Every race of the server is in
+            the results of at least one rider as long as riders * results_per_rider >= races.
+    """
+    rng = random.Random(config.seed * 1_000_003 + index)
+    rows = []
+    for k in range(config.results_per_rider):
+        race = (index * config.results_per_rider + k) % config.races
+        year = 2025 - k * 6 // config.results_per_rider
+        rows.append(
+            f"<tr><td>{year}-{12 - k % 12:02d}-{1 + k % 28:02d}</td>"
+            f"<td><a href=\"{_race_path(race)}\">Mock race {race}</a></td>"
+            f"<td>{rng.randint(1, 25)}</td><td>{CLASSES[race % len(CLASSES)]}</td>"
+            f"<td>{20 + race % 30}</td><td>{rng.randint(0, 3)}:{rng.randint(0, 59):02d}</td></tr>"
+        )
+    return _page(f"{_rider_name(index)} results", (
+        "<div class=\"page-content\"><div><div class=\"mt10\"><table class=\"basic\">"
+        f"<thead><tr><th>Date</th></tr></thead><tbody>{''.join(rows)}</tbody></table>"
+        "</div></div></div>"
+    ))
+
+def race_page(config : MockConfig, index : int) -> str:
+    """
+    Returns:
+        str: Results page of a race.
+    """
+    rng = random.Random(config.seed * 1_000_003 + index)
+    values = [
+        f"{rng.randint(1, 28)} {MONTHS[index % 12]} {2020 + index % 6}", "14:00", "",
+        CLASSES[index % len(CLASSES)], "ME - Men Elite", f"{20 + index % 30}.{index % 10} km",
+        "", "", "", "ITT", str(rng.randint(0, 80)), str(rng.randint(0, 900)), "Start", "Finish",
+        str(rng.randint(1, 300)), str(rng.randint(0, 1500)), "Time Trial",
+        f"{rng.randint(5, 35)} °C" if index % 3 else "",
+    ]
+    info = "".join(
+        f"<li><div class=\"title\">Info:</div><div class=\"value\">{value}</div></li>"
+        for value in values
+    )
+    # Rnk | BIB | Rider | Team | Pnt | Time, the winner's time then the gaps to it
+    rows = "".join(
+        f"<tr><td>{rank}</td><td>{rank * 7}</td><td class=\"ridername\">"
+        f"<a href=\"rider/rider-{(index + rank) % config.riders}\">"
+        f"{_rider_name((index + rank) % config.riders)}</a></td>"
+        f"<td class=\"cu600\"><a href=\"team/mock-team-{rank % 20}\">Team {rank % 20}</a></td>"
+        f"<td class=\"fs11\">{max(0, 100 - 8 * rank)}</td><td class=\"time ar\">"
+        + (
+            "<span class=\"hide\">30:01</span>30:01" if rank == 1
+            else f"<span class=\"hide\">+{rank // 60}:{rank % 60:02d}</span>"
+            f"{rank // 60}:{rank % 60:02d}"
+        )
+        + "</td></tr>"
+        for rank in range(1, 31)
+    )
+    return _page(f"Mock race {index} results", (
+        "<div class=\"page-content\"><div class=\"borderbox w68 left mb_w100\">"
+        f"<div id=\"resultsCont\"><table class=\"results\"><tbody>{rows}</tbody></table></div>"
+        "</div><div class=\"borderbox w30 right mb_w100\">"
+        f"<ul class=\"list keyvalueList lineh16 fs12\">{info}</ul>"
+        f"<div class=\"mt10\"><img src=\"images/profiles/mock-{index}.jpg\"></div></div></div>"
+    ))
+
+def image_bytes(config : MockConfig, kind : str, index : int) -> bytes:
+    """
+    Args:
+        kind (str): "rider" for a rider photo, "profile" for a race profile.
+        index (int): Index of the rider or race.
+    Returns:
+        bytes: The image, a PNG of a single colour. One rider out of five has the placeholder
+            photo, the same image being served at several URLs as on PCS.
+    """
+    width, height = (60, 80) if kind == "rider" else (240, 120)
+    key = "placeholder" if kind == "rider" and index % 5 == 0 else f"{kind}-{index}"
+    rng = random.Random(f"{config.seed}/{key}")
+    colour = bytes(rng.randrange(256) for _ in range(3))
+    pixels = b"".join(b"\x00" + colour * width for _ in range(height))
+
+    def chunk(tag : bytes, data : bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return b"\x89PNG\r\n\x1a\n" + chunk(
+        b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    ) + chunk(b"IDAT", zlib.compress(pixels)) + chunk(b"IEND", b"")
+
+def make_app(config : MockConfig, stats : Optional[MockStats] = None) -> web.Application:
+    """
+    Args:
+        config (MockConfig): Scale and behaviour of the server.
+        stats (MockStats, optional): Counters updated by every request.
+    Returns:
+        web.Application: The mock server.
+    """
+    stats = stats if stats is not None else MockStats()
+    rng = random.Random(config.seed)
+
+    def index_of(request : web.Request, limit : int) -> int:
+        index = int(request.match_info["index"])
+        if index >= limit:
+            stats.count(404)
+            raise web.HTTPNotFound()
+        return index
+
+    async def respond(render, content_type : str = "text/html", headers=None) -> web.Response:
+        if config.latency or config.jitter:
+            await asyncio.sleep(max(0.0, config.latency + rng.uniform(-1, 1) * config.jitter))
+        draw = rng.random()
+        if draw < config.rate_429:
+            stats.count(429)
+            return web.Response(status=429, headers={"Retry-After": str(config.retry_after)})
+        if draw < config.rate_429 + config.error_rate:
+            stats.count(503)
+            return web.Response(status=503)
+        body = render()
+        stats.count(200, len(body))
+        if isinstance(body, bytes):
+            return web.Response(body=body, content_type=content_type, headers=headers)
+        return web.Response(text=body, content_type=content_type, headers=headers)
+
+    async def rankings(request : web.Request) -> web.Response:
+        season = int(request.query.get("date", "2024-12-31")[:4]) + 1
+        offset = int(request.query.get("offset", 0))
+        return await respond(lambda: rankings_page(config, season, offset))
+
+    async def rider(request : web.Request) -> web.Response:
+        index = index_of(request, config.riders)
+        return await respond(lambda: rider_page(config, index))
+
+    async def results(request : web.Request) -> web.Response:
+        index = index_of(request, config.riders)
+        return await respond(lambda: results_page(config, index))
+
+    async def race(request : web.Request) -> web.Response:
+        index = index_of(request, config.races)
+        return await respond(lambda: race_page(config, index))
+
+    async def image(request : web.Request, kind : str, limit : int) -> web.Response:
+        body = image_bytes(config, kind, index_of(request, limit))
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if request.headers.get("If-None-Match") == etag:
+            stats.count(304)
+            return web.Response(status=304, headers={"ETag" : etag})
+        return await respond(lambda: body, "image/png", {"ETag" : etag})
+
+    async def photo(request : web.Request) -> web.Response:
+        return await image(request, "rider", config.riders)
+
+    async def profile(request : web.Request) -> web.Response:
+        return await image(request, "profile", config.races)
+
+    app = web.Application()
+    app[STATS] = stats
+    app.add_routes([
+        web.get("/rankings.php", rankings),
+        web.get(r"/rider/rider-{index:\d+}", rider),
+        web.get(r"/rider/rider-{index:\d+}/results/last-tt-results", results),
+        web.get(r"/race/mock-race-{index:\d+}/{year:\d+}/result", race),
+        web.get(r"/images/riders/rider-{index:\d+}.png", photo),
+        web.get(r"/images/profiles/mock-{index:\d+}.jpg", profile),
+    ])
+    return app
+
+async def start_server(
+    config : MockConfig,
+    host : str = "127.0.0.1",
+    port : int = 0
+    ) -> web.AppRunner:
+    """
+    Starts the mock server in the running event loop.
+    Args:
+        config (MockConfig): Scale and behaviour of the server.
+        host (str): Interface to listen on. Defaults to 127.0.0.1.
+        port (int): Port to listen on. Defaults to 0 (any free port).
+    Returns:
+        web.AppRunner: Runner of the server, runner.addresses gives the actual port and
+            runner.app[STATS] the request counters. Stop it with await runner.cleanup().
+    """
+    runner = web.AppRunner(make_app(config), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+def base_url(runner : web.AppRunner) -> str:
+    """
+    Returns:
+        str: Base URL of a started mock server, to give to the scraper as PCS_BASE_URL.
+    """
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}/"
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument("--riders", type=int, default=MockConfig.riders)
+    arg_parser.add_argument("--races", type=int, default=MockConfig.races)
+    arg_parser.add_argument("--results-per-rider", type=int, default=MockConfig.results_per_rider)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    arg_parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503s")
+    arg_parser.add_argument("--rate-429", type=float, default=0.0, help="share of 429s")
+    args = arg_parser.parse_args()
+    web.run_app(make_app(MockConfig(
+        riders=args.riders,
+        races=args.races,
+        results_per_rider=args.results_per_rider,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_429=args.rate_429
+    )), host=args.host, port=args.port, access_log=None)
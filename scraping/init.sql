@@ -4,34 +4,36 @@ CREATE TABLE IF NOT EXISTS rider (
     last_name VARCHAR(50) NOT NULL,
     full_name VARCHAR(100) NOT NULL,
     nationality VARCHAR(50) NOT NULL,
-    height INT NOT NULL,
+    height DECIMAL(3,2) NOT NULL,
     weight_ INT NOT NULL,
     birth_year INT NOT NULL,
+    onedayraces INT NOT NULL,
     gc INT NOT NULL,
     tt INT NOT NULL,
     sprint INT NOT NULL,
     climber INT NOT NULL,
     hills INT NOT NULL,
-    url_ VARCHAR(255) NOT NULL,
+    url_ VARCHAR(255) NOT NULL UNIQUE,
     image_url VARCHAR(255) NOT NULL
 );
 
 CREATE TABLE IF NOT EXISTS race (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name VARCHAR(255) NOT NULL UNIQUE,
+    name VARCHAR(255) NOT NULL,
     date_ DATE NOT NULL,
     departure VARCHAR(100),
     arrival VARCHAR(100),
     class VARCHAR(50) NOT NULL,
     distance DECIMAL(5,2) NOT NULL,
-    altitude_gain INT NOT NULL,
-    startlist_quality VARCHAR(50) NOT NULL,
-    profile_score INT NOT NULL,
+    -- Missing on some PCS race pages
+    altitude_gain INT,
+    startlist_quality INT,
+    profile_score INT,
     temperature INT,
-    race_ranking INT NOT NULL,
+    race_ranking INT,
     winner_time INT NOT NULL,
     winner_speed DECIMAL(5,3) NOT NULL,
-    url_ VARCHAR(255) NOT NULL,
+    url_ VARCHAR(255) NOT NULL UNIQUE,
     profile_image_url VARCHAR(255)
 );
 
@@ -43,5 +45,10 @@ CREATE TABLE IF NOT EXISTS result (
     seconds_lost INT NOT NULL,
     pnt INT NOT NULL,
     FOREIGN KEY (rider_id) REFERENCES rider(id),
-    FOREIGN KEY (race_id) REFERENCES race(id)
-);
\ No newline at end of file
+    FOREIGN KEY (race_id) REFERENCES race(id),
+    UNIQUE (rider_id, race_id)
+);
+
+CREATE INDEX IF NOT EXISTS result_rider_id ON result(rider_id);
+CREATE INDEX IF NOT EXISTS result_race_id ON result(race_id);
+CREATE INDEX IF NOT EXISTS race_date ON race(date_);
@@ -2,82 +2,250 @@
 Main script for scraping
 """
 
+from typing import Iterable, Optional
+from contextlib import nullcontext
+import argparse
 import asyncio
-import aiohttp
+import os
 import pandas as pd
-from tqdm.asyncio import tqdm
-from src.get_tt_specialists import get_all_tt_specialists, process_rider
-from src.get_tt_results import process_results
-from src.get_tt_races import process_race
+from src.cache import ResponseCache, DEFAULT_CACHE_DIR
+from src.client import ClientConfig, ConnectionStats, create_session
+from src.tasks import FailureReport, RetryPolicy
+from src.workers import ParsePool
+from src.pipeline import CrawlPipeline
+from src.incremental import IncrementalState, mark_refreshed
+from src.storage import SQLiteStorage
+from src.dataset import write_dataset
+from src.features import refresh_features
+from src.ratings import refresh_ratings
+from src.query import build_index
+from src.assets import asset_urls, sync_assets
+from src.conversion import convert_races, convert_results
+from src.journal import DISCOVERY, CheckpointJournal
+from src.metrics import DEFAULT_METRICS_PATH, DEFAULT_PROMETHEUS_PATH, Metrics, live_summary
+from src.get_tt_specialists import get_all_tt_specialists_async
+from src.constants import DEFAULT_JOURNAL_PATH, DEFAULT_YEARS, MIN_YEAR
+from pcs_chrono import add_crawl_arguments
 
-async def main(to_csv=True):
+ERRORS_PATH = "data/errors.json"
+
+async def main(
+    to_csv=True,
+    cache : ResponseCache = None,
+    policy : RetryPolicy = None,
+    concurrency : int = 32,
+    parse_workers : Optional[int] = None,
+    incremental : bool = False,
+    years : Iterable[int] = DEFAULT_YEARS,
+    top_n : int = 50,
+    db_path : Optional[str] = None,
+    metrics : Optional[Metrics] = None,
+    live_interval : Optional[float] = None,
+    journal : Optional[CheckpointJournal] = None,
+    strategy : str = "rider",
+    min_year : int = MIN_YEAR,
+    assets : bool = False
+    ) -> FailureReport:
     """
     Main function to orchestrate the scraping of time trial specialists, their results, and
     the races they participated in.
     Args:
-        to_csv (bool): Whether to save the results to CSV files. Defaults to True.
+        to_csv (bool): Whether to save the results to CSV files, along with typed Parquet
+            files if pyarrow is installed. Defaults to True.
+        cache (ResponseCache, optional): On-disk response cache, pages still fresh in it are not
+            downloaded again, closed by the caller. Defaults to None (no caching).
+        policy (RetryPolicy, optional): Timeout and retry policy of every page. Defaults to
+            RetryPolicy().
+        concurrency (int): Number of pages processed at once per stage. Defaults to 32.
+        parse_workers (int, optional): Number of worker processes parsing the pages, so that
+            downloads and parsing overlap on every core. Defaults to None (parsing on the event
+            loop).
+        incremental (bool): If True, only the results and races missing from data/*.csv are
+            fetched, rider profiles are only fetched again when stale, and the new data is
+            merged into the stored data. Defaults to False (full crawl).
+        years (Iterable[int]): Seasons whose time trial rankings give the riders to crawl.
+            Defaults to 2020 to 2024.
+        top_n (int): Number of riders taken from the top of each season's rankings.
+            Defaults to 50.
+        db_path (str, optional): If given, the data is also upserted into this SQLite database.
+        metrics (Metrics, optional): If given, fetch and parse times, statuses, bytes, queue
+            depths and stage timings are measured, see src.metrics. They are written to
+            data/metrics.json and data/metrics.prom along with the CSV files.
+        live_interval (float, optional): If given with metrics, a summary of the measures is
+            printed every live_interval seconds.
+        journal (CheckpointJournal, optional): If given, the discovered riders and every
+            completed page are journaled as they finish. With a journal opened with resume=True,
+            what it holds is replayed instead of being fetched again, and the crawl continues
+            with the remaining pages. The journal is compacted at the end of a successful crawl,
+            and closed by the caller.
+        strategy (str): "rider" to take the top 20 finishes of each rider's results page, "race"
+            to take the whole result table of each race page and also fetch the profiles of the
+            riders seen there, see src.pipeline. Defaults to "rider".
+        min_year (int): First season of the results collected. Defaults to MIN_YEAR (2020).
+        assets (bool): Whether to download the rider photos and race profiles to the asset
+            store, see src.assets. Defaults to False.
+    Returns:
+        FailureReport: The pages that could not be processed, the crawl goes on without them.
     """
-    # Collecting all time trial specialists
-    all_riders = get_all_tt_specialists()
-    print()
+    report = FailureReport()
+    known = {}
+    state = IncrementalState.load() if incremental else None
+    if state is not None:
+        known = {
+            "known_results" : state.known_results(),
+            "known_races" : state.known_races(),
+            "fresh_riders" : state.fresh_riders()
+        }
 
-    async with aiohttp.ClientSession() as session:
-        # Process all riders concurrently with progress bar
-        riders_tasks = [
-            process_rider(name, url, session, verbose=False) for name, url in all_riders
-        ]
-        riders_data = await tqdm.gather(*riders_tasks, desc="Processing riders")
-        # Filter out None results
-        riders_data = [rider for rider in riders_data if rider]
-        # Process all results concurrently with progress bar
-        results_tasks = [
-            process_results(
-                rider["url"] + "/results/last-tt-results",
-                session,
-                verbose=False
-            )
-            for rider in riders_data
-        ]
-        print()
-        results_data = await tqdm.gather(*results_tasks, desc="Processing results")
-        # Flatten the list of lists and filter out None results
-        results_data = [result for sublist in results_data if sublist for result in sublist]
+    def stage(name : str):
+        return metrics.stage(name) if metrics is not None else nullcontext()
 
-        # Collect all unique race URLs
-        race_urls = set()
-        for result in results_data:
-            race_urls.add(result["race_url"])
+    live = None
+    if metrics is not None and live_interval:
+        live = asyncio.create_task(live_summary(metrics, live_interval))
 
-        # Process all races concurrently with progress bar
-        races_tasks = [process_race(url, session, verbose=False) for url in list(race_urls)]
-        print()
-        races_data = await tqdm.gather(*races_tasks, desc="Processing races", )
-        # Filter out None results
-        races_data = [race for race in races_data if race]
+    pool = ParsePool(parse_workers) if parse_workers else None
+    # Every stage keeps up to concurrency pages in flight, all of them on the PCS host
+    client = ClientConfig(pool_size=3 * concurrency, per_host=3 * concurrency)
+    connections = ConnectionStats()
+    try:
+        async with create_session(client, connections) as session:
+            # Collecting all time trial specialists, every rankings page at once
+            all_riders = journal.take(*DISCOVERY) if journal is not None else None
+            if all_riders is None:
+                with stage("discovery"):
+                    all_riders = await get_all_tt_specialists_async(
+                        session, years, top_n, cache=cache, policy=policy, report=report,
+                        metrics=metrics
+                    )
+                if journal is not None:
+                    journal.record(*DISCOVERY, sorted(all_riders))
+            all_riders = {tuple(rider) for rider in all_riders}
+            print(f"Found {len(all_riders)} time trial specialists\n")
+            if state is not None:
+                all_riders = state.riders_to_crawl(all_riders)
 
-    # Save data to CSV files
-    riders_df = pd.DataFrame(riders_data)
-    riders_df = riders_df.sort_values(["last_name","first_name"])
+            # Riders, results and races are processed as one streaming pipeline, with one progress
+            # bar per stage
+            # The numeric fields are captured as raw strings and converted column by column below
+            pipeline = CrawlPipeline(
+                session, report, policy, concurrency, cache=cache, pool=pool, metrics=metrics,
+                raw=True, journal=journal, strategy=strategy, min_year=min_year, **known
+            )
+            with stage("crawl"):
+                riders_data, results_data, races_data = await pipeline.run(all_riders)
+    finally:
+        # The worker processes and the live summary are stopped even when the crawl raises
+        if pool is not None:
+            pool.close()
+        if live is not None:
+            live.cancel()
+    if journal is not None and journal.replayed:
+        print(f"\n{journal.replayed} pages replayed from the checkpoint journal")
 
-    results_df = pd.DataFrame(results_data)
-    results_df = results_df.sort_values(["rider_url","race_url"])
+    riders_df = riders_data.to_frame()
+    refreshed = riders_df["url"].tolist()
+    results_df = convert_results(results_data.to_frame())
+    races_df = convert_races(races_data.to_frame())
+    if not races_df.empty:
+        races_df["date"] = pd.to_datetime(races_df["date"])
+    # Only the fetched rows go to the feature store on an incremental crawl, if it is saved
+    fetched = (riders_df, results_df, races_df)
+    if state is not None:
+        print(
+            f"\nFetched {len(riders_df)} rider profiles, {len(results_df)} new results"
+            f" and {len(races_df)} new races"
+        )
+        riders_df, results_df, races_df = state.merge(riders_df, results_df, races_df)
 
-    races_df = pd.DataFrame(races_data)
-    races_df["date"] = pd.to_datetime(races_df["date"])
+    # Save data to CSV and Parquet files
+    riders_df = riders_df.sort_values(["last_name","first_name"])
+    results_df = results_df.sort_values(["rider_url","race_url"])
     races_df = races_df.sort_values(
         by=["date","race_title"],
         ascending=[False,True]
     )
 
-    if to_csv:
-        riders_df.to_csv("data/riders.csv",index=False)
-        results_df.to_csv("data/results.csv",index=False)
-        races_df.to_csv("data/races.csv",index=False)
+    with stage("write"):
+        if to_csv:
+            write_dataset(riders_df, results_df, races_df)
+            mark_refreshed(refreshed)
+            _, written = refresh_features(
+                riders_df, results_df, races_df, fetched=fetched if state is not None else None
+            )
+            print(f"Feature store : {written} rows written")
+            _, rated = refresh_ratings(results_df, races_df)
+            print(f"Ratings : {rated} races rated")
+            build_index(riders_df, results_df, races_df)
+        if db_path is not None:
+            with SQLiteStorage(db_path) as storage:
+                storage.write(riders_df, results_df, races_df)
+
+    if assets:
+        with stage("assets"):
+            synced = await sync_assets(
+                asset_urls(riders_df, races_df), workers=parse_workers, policy=policy,
+                report=report
+            )
+        print(f"Assets : {synced}")
 
     print(
         f"\nSuccessfully collected {len(riders_df)} riders, {len(results_df)} results,"
         f" and {len(races_df)} races !\n "
     )
+    if journal is not None:
+        journal.compact()
+    print(f"Connections : {connections}")
+    if cache is not None:
+        print(f"Response cache : {cache.stats}")
+    if report:
+        print(f"{len(report)} pages failed : {report.by_stage()}")
+        if to_csv:
+            report.to_json(ERRORS_PATH)
+            print(f"Failure report written to {ERRORS_PATH}")
+    if metrics is not None:
+        print(metrics.summary())
+        if to_csv:
+            metrics.to_json(DEFAULT_METRICS_PATH)
+            metrics.write_prometheus(DEFAULT_PROMETHEUS_PATH)
+            print(f"Metrics written to {DEFAULT_METRICS_PATH} and {DEFAULT_PROMETHEUS_PATH}")
+    return report
+
+def run(args : argparse.Namespace) -> FailureReport:
+    """
+    Runs a crawl from the command line arguments, with the response cache, parse workers,
+    metrics and checkpoint journal of a full run. The cache and the journal are closed even when
+    the crawl raises, so that a --resume does not fetch their pages again.
+    Args:
+        args (argparse.Namespace): incremental, years, top_n, min_year, concurrency, db,
+            live_metrics, strategy, resume and assets, see pcs_chrono.add_crawl_arguments.
+    Returns:
+        FailureReport: Pages that still failed after their retries.
+    """
+    with ResponseCache(DEFAULT_CACHE_DIR) as cache, \
+            CheckpointJournal(DEFAULT_JOURNAL_PATH, resume=args.resume) as journal:
+        return asyncio.run(main(
+            cache=cache,
+            concurrency=args.concurrency,
+            parse_workers=os.cpu_count(),
+            incremental=args.incremental,
+            years=range(args.years[0], args.years[1] + 1),
+            top_n=args.top_n,
+            db_path=args.db,
+            metrics=Metrics(),
+            live_interval=args.live_metrics,
+            journal=journal,
+            strategy=args.strategy,
+            min_year=args.min_year,
+            assets=args.assets
+        ))
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Scrape time trial data from ProCyclingStats")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only fetch the results and races missing from data/*.csv"
+    )
+    add_crawl_arguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,198 @@
+"""
+PCS Chrono command line : a single entry point for the crawls, single race fetches, exports,
+image downloads, queries and predictions.
+
+Only the standard library and the shared defaults of src.constants are imported at startup.
+Each subcommand imports the modules it needs when it runs, so the help and the argument checks
+start at once, and a command never pays for the dependencies of the others (pandas, aiohttp,
+BeautifulSoup, tqdm...).
+
+    python pcs_chrono.py crawl --years 2020 2024
+    python pcs_chrono.py update --resume
+    python pcs_chrono.py race race/tour-de-romandie/2023/stage-3
+    python pcs_chrono.py export --format sqlite --output data/export.sqlite
+    python pcs_chrono.py assets --revalidate
+    python pcs_chrono.py query races --class 2.UWT --top 10 --by winner_speed
+    python pcs_chrono.py predict estimate --feature distance=30 --feature vertical_meters=200 \\
+        --feature startlist_quality=900 --feature profile_score=15
+"""
+
+from typing import List, Optional
+import argparse
+import json
+import sys
+from src.constants import (
+    DATA_DIR, DEFAULT_ASSETS_DIR, DEFAULT_DB_PATH, DEFAULT_INDEX_DIR, DEFAULT_JOURNAL_PATH,
+    DEFAULT_MODELS_DIR, DEFAULT_PORT, DEFAULT_YEARS, EXPORT_FORMATS, MIN_YEAR, STRATEGIES
+)
+
+# Errors of the quick commands' input (missing dataset or model, bad feature), reported in a line
+INPUT_ERRORS = (FileNotFoundError, KeyError, ValueError)
+
+def _crawl(args : argparse.Namespace):
+    from main import run
+    run(args)
+
+def _race(args : argparse.Namespace):
+    from src.get_tt_races import process_race_sync
+    from src.utils import BASE_URL
+    url = args.url if args.url.startswith("http") else BASE_URL + args.url.lstrip("/")
+    print(json.dumps(process_race_sync(url, verbose=False), indent=2, default=str))
+
+def _export(args : argparse.Namespace):
+    from src.dataset import export_dataset
+    counts = export_dataset(args.output, args.format, args.data_dir)
+    print(
+        f"Exported {counts['riders']} riders, {counts['results']} results and {counts['races']}"
+        f" races to {args.output}"
+    )
+
+def _assets(args : argparse.Namespace):
+    from src.assets import run
+    run(args)
+
+def _query(args : argparse.Namespace):
+    from src.query import run
+    run(args)
+
+def _predict(args : argparse.Namespace):
+    from src.prediction import run
+    run(args)
+
+def add_crawl_arguments(parser : argparse.ArgumentParser):
+    """
+    Adds the arguments of a crawl, shared by the crawl and update subcommands and main.py.
+    Args:
+        parser (argparse.ArgumentParser): Parser of the command line.
+    """
+    parser.add_argument(
+        "--years", type=int, nargs=2, default=(DEFAULT_YEARS.start, DEFAULT_YEARS.stop - 1),
+        metavar=("FIRST", "LAST"),
+        help="seasons whose rankings give the riders to crawl"
+    )
+    parser.add_argument("--top-n", type=int, default=50, help="riders taken per season")
+    parser.add_argument(
+        "--min-year", type=int, default=MIN_YEAR, help="first season of the results collected"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=32, help="pages processed at once per stage"
+    )
+    parser.add_argument(
+        "--db", nargs="?", const=DEFAULT_DB_PATH,
+        help=f"also write to a SQLite database ({DEFAULT_DB_PATH} if no path is given)"
+    )
+    parser.add_argument(
+        "--live-metrics", type=float, metavar="SECONDS",
+        help="print a summary of the fetch and parse times every SECONDS seconds"
+    )
+    parser.add_argument(
+        "--strategy", choices=STRATEGIES, default="rider",
+        help="take the results from each rider's page (top 20) or from each race's full table"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help=f"resume an interrupted crawl from its checkpoint journal ({DEFAULT_JOURNAL_PATH})"
+    )
+    parser.add_argument(
+        "--assets", action="store_true",
+        help="also download the rider photos and race profiles to the asset store"
+    )
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Returns:
+        argparse.ArgumentParser: Parser of the command line, each subcommand setting the
+            handler that runs it.
+    """
+    parser = argparse.ArgumentParser(prog="pcs-chrono", description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="subcommand", required=True, metavar="COMMAND")
+
+    crawl = subparsers.add_parser(
+        "crawl", help="crawl the riders, their results and races, and rewrite data/"
+    )
+    add_crawl_arguments(crawl)
+    crawl.set_defaults(handler=_crawl, incremental=False)
+
+    update = subparsers.add_parser(
+        "update", help="only fetch the results and races missing from data/*.csv"
+    )
+    add_crawl_arguments(update)
+    update.set_defaults(handler=_crawl, incremental=True)
+
+    race = subparsers.add_parser("race", help="fetch a single race and print it as JSON")
+    race.add_argument(
+        "url", help="URL of the race, or its path, e.g. race/giro-d-italia/2024/stage-7"
+    )
+    race.set_defaults(handler=_race)
+
+    export = subparsers.add_parser("export", help="copy the datasets to CSV, Parquet or SQLite")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export.add_argument(
+        "--output", required=True, help="directory of the CSV or Parquet files, or SQLite file"
+    )
+    export.add_argument("--data-dir", default=DATA_DIR)
+    export.set_defaults(handler=_export)
+
+    assets = subparsers.add_parser(
+        "assets", help="download the rider photos and race profiles, with thumbnails"
+    )
+    assets.add_argument("--data-dir", default=DATA_DIR)
+    assets.add_argument("--assets-dir", default=DEFAULT_ASSETS_DIR)
+    assets.add_argument("--concurrency", type=int, default=8, help="images downloaded at once")
+    assets.add_argument(
+        "--revalidate", action="store_true",
+        help="ask the stored images again, only downloading the changed ones"
+    )
+    assets.add_argument("--no-thumbnails", action="store_true")
+    assets.set_defaults(handler=_assets)
+
+    query = subparsers.add_parser("query", help="query the integer index of the datasets")
+    query.add_argument("command", choices=("build", "results", "races"))
+    query.add_argument("--data-dir", default=DATA_DIR)
+    query.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    query.add_argument("--rider", help="part of a name, or a profile URL")
+    query.add_argument("--since", help="YYYY-MM-DD")
+    query.add_argument("--until", help="YYYY-MM-DD")
+    query.add_argument("--min-distance", type=float, help="km")
+    query.add_argument("--max-distance", type=float, help="km")
+    query.add_argument("--min-climb", type=float, help="vertical meters")
+    query.add_argument("--max-climb", type=float, help="vertical meters")
+    query.add_argument("--class", dest="classes", action="append", help="repeatable")
+    query.add_argument("--top", type=int, help="keep the k best rows")
+    query.add_argument("--by", help="column ranking the rows for --top")
+    query.add_argument("--ascending", action="store_true", help="smallest values first")
+    query.set_defaults(handler=_query)
+
+    predict = subparsers.add_parser("predict", help="train, serve or use winner speed models")
+    predict.add_argument("command", choices=("train", "serve", "estimate"))
+    predict.add_argument("--data-dir", default=DATA_DIR)
+    predict.add_argument("--models-dir", default=DEFAULT_MODELS_DIR)
+    predict.add_argument("--version", type=int, help="model to use, defaults to the latest")
+    predict.add_argument("--host", default="127.0.0.1")
+    predict.add_argument("--port", type=int, default=DEFAULT_PORT)
+    predict.add_argument("--max-delay", type=float, default=0.0, help="seconds")
+    predict.add_argument(
+        "--feature", action="append", metavar="NAME=VALUE",
+        help="feature of the race to estimate, repeatable"
+    )
+    predict.set_defaults(handler=_predict)
+    return parser
+
+def main(argv : Optional[List[str]] = None):
+    """
+    Runs the command line. The input errors of the quick commands (export, predict estimate)
+    exit with a message, any other error, e.g. of a crawl, raises with its traceback.
+    Args:
+        argv (List[str], optional): Arguments. Defaults to sys.argv[1:].
+    """
+    args = build_parser().parse_args(argv)
+    quick = args.subcommand == "export" or getattr(args, "command", None) == "estimate"
+    try:
+        args.handler(args)
+    except INPUT_ERRORS as error:
+        if not quick:
+            raise
+        sys.exit(f"pcs-chrono {args.subcommand}: {type(error).__name__}: {error}")
+
+if __name__ == "__main__":
+    main()
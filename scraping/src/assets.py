@@ -0,0 +1,356 @@
+"""
+Asset store : the rider photos and race profiles the datasets link to, downloaded into a local
+content-addressed store, with thumbnails, so that they are not hotlinked from PCS.
+
+Images are streamed to disk in chunks while being hashed, and stored under their SHA-256 : an
+image served at several URLs is stored once. A manifest maps each URL to the hash of its image
+and to the validators of its response (ETag, Last-Modified). Syncing again skips the URLs already
+stored, or revalidates them with conditional requests, so that only new or changed images are
+transferred.
+
+    python -m src.assets
+    python -m src.assets --revalidate --concurrency 16
+"""
+
+from typing import Dict, Iterable, List, Optional
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import hashlib
+import importlib.util
+import io
+import json
+import mimetypes
+import os
+import tempfile
+import aiohttp
+import pandas as pd
+from src.client import ClientConfig, create_session
+from src.constants import DATA_DIR, DEFAULT_ASSETS_DIR
+from src.dataset import load_dataset
+from src.tasks import FailureReport, RetryPolicy, gather_stage
+from src.workers import ParsePool
+
+MANIFEST_FILE = "manifest.json"
+CHUNK_SIZE = 64 * 1024
+# Thumbnails fit in a THUMBNAIL_SIZE box, and are compressed until they weigh THUMBNAIL_MAX_BYTES
+THUMBNAIL_SIZE = (160, 160)
+THUMBNAIL_MAX_BYTES = 16 * 1024
+THUMBNAIL_QUALITIES = (85, 70, 55, 40)
+# Columns of the datasets holding image URLs
+ASSET_COLUMNS = {"riders" : "photo_url", "races" : "profile_image_url"}
+
+def thumbnails_available() -> bool:
+    """
+    Returns:
+        bool: Whether an imaging library (Pillow) is installed to make thumbnails.
+    """
+    return importlib.util.find_spec("PIL") is not None
+
+def make_thumbnail(
+    source : str,
+    target : str,
+    size : tuple = THUMBNAIL_SIZE,
+    max_bytes : int = THUMBNAIL_MAX_BYTES
+    ) -> int:
+    """
+    Writes a JPEG thumbnail of an image, meant to run in a worker process.
+    Args:
+        source (str): Path of the image.
+        target (str): Path of the thumbnail.
+        size (tuple): (width, height) box the thumbnail fits in. Defaults to THUMBNAIL_SIZE.
+        max_bytes (int): Size the thumbnail is compressed down to, as far as the lowest of
+            THUMBNAIL_QUALITIES allows. Defaults to THUMBNAIL_MAX_BYTES.
+    Returns:
+        int: Size of the thumbnail in bytes.
+    """
+    from PIL import Image # pylint: disable=import-outside-toplevel
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+    image.thumbnail(size)
+    for quality in THUMBNAIL_QUALITIES:
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality, optimize=True)
+        if buffer.tell() <= max_bytes:
+            break
+    _write_atomic(target, buffer.getvalue())
+    return buffer.tell()
+
+def _write_atomic(path : str, data : bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+@dataclass
+class Asset:
+    """
+    Entry of the manifest : the image last downloaded from a URL.
+    Attributes:
+        hash (str): SHA-256 of the image, its key in the store.
+        extension (str): File extension, from the content type.
+        size (int): Size in bytes.
+        content_type (str): Content type of the response.
+        etag (str): ETag of the response, if any.
+        last_modified (str): Last-Modified header of the response, if any.
+        fetched_at (str): ISO timestamp of the download, or of the last revalidation.
+    """
+    hash : str
+    extension : str = ""
+    size : int = 0
+    content_type : str = ""
+    etag : Optional[str] = None
+    last_modified : Optional[str] = None
+    fetched_at : str = ""
+
+class AssetStore:
+    """
+    Content-addressed store of images : objects/<h[:2]>/<hash><extension>, thumbnails/<h[:2]>/
+    <hash>.jpg, and the manifest of the URLs.
+    """
+
+    def __init__(self, directory : str = DEFAULT_ASSETS_DIR):
+        """
+        Args:
+            directory (str): Directory of the store, created if needed. Defaults to
+                data/assets.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest : Dict[str, Asset] = {}
+        path = os.path.join(directory, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.manifest = {url : Asset(**entry) for url, entry in json.load(f).items()}
+        # Bytes of the images downloaded by this instance
+        self.transferred = 0
+
+    def object_path(self, asset : Asset) -> str:
+        """
+        Returns:
+            str: Path of the image of an entry.
+        """
+        return os.path.join(
+            self.directory, "objects", asset.hash[:2], asset.hash + asset.extension
+        )
+
+    def thumbnail_path(self, asset : Asset) -> str:
+        """
+        Returns:
+            str: Path of the thumbnail of an entry.
+        """
+        return os.path.join(self.directory, "thumbnails", asset.hash[:2], f"{asset.hash}.jpg")
+
+    def get(self, url : str) -> Optional[Asset]:
+        """
+        Args:
+            url (str): URL of an image.
+        Returns:
+            Asset: Its entry, None if it is not stored.
+        """
+        asset = self.manifest.get(url)
+        return asset if asset is not None and os.path.exists(self.object_path(asset)) else None
+
+    def save(self):
+        """
+        Writes the manifest.
+        """
+        manifest = {url : asdict(asset) for url, asset in sorted(self.manifest.items())}
+        _write_atomic(
+            os.path.join(self.directory, MANIFEST_FILE),
+            json.dumps(manifest, indent=2).encode("utf-8")
+        )
+
+    async def fetch(
+        self,
+        url : str,
+        session : aiohttp.ClientSession,
+        revalidate : bool = False
+        ) -> str:
+        """
+        Downloads an image unless it is stored, and records it in the manifest.
+        Args:
+            url (str): URL of the image.
+            session (aiohttp.ClientSession): Session of the downloads.
+            revalidate (bool): If True, a stored image is asked again with a conditional
+                request, and downloaded only if it changed. Defaults to False (stored images are
+                skipped without a request).
+        Returns:
+            str: "skipped", "unchanged", "new", "changed" (another image than the stored one)
+                or "duplicate" (a new URL of an image already stored).
+        Raises:
+            ValueError: If the response is not an image, e.g. an error page.
+        """
+        stored = self.get(url)
+        if stored is not None and not revalidate:
+            return "skipped"
+        headers = {}
+        if stored is not None:
+            if stored.etag:
+                headers["If-None-Match"] = stored.etag
+            if stored.last_modified:
+                headers["If-Modified-Since"] = stored.last_modified
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+        async with session.get(url, headers=headers) as response:
+            if stored is not None and response.status == 304:
+                stored.fetched_at = now
+                return "unchanged"
+            response.raise_for_status()
+            content_type = response.content_type
+            if not content_type.startswith("image/"):
+                raise ValueError(f"{url} is not an image but {content_type}")
+            objects = os.path.join(self.directory, "objects")
+            os.makedirs(objects, exist_ok=True)
+            # Streamed to a temporary file, the store only ever holds complete images
+            fd, tmp = tempfile.mkstemp(dir=objects, suffix=".tmp")
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+                self.transferred += size
+                asset = Asset(
+                    hash=digest.hexdigest(),
+                    extension=mimetypes.guess_extension(content_type) or "",
+                    size=size,
+                    content_type=content_type,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                    fetched_at=now
+                )
+                path = self.object_path(asset)
+                duplicate = os.path.exists(path)
+                if not duplicate:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+        self.manifest[url] = asset
+        if stored is not None:
+            return "unchanged" if stored.hash == asset.hash else "changed"
+        return "duplicate" if duplicate else "new"
+
+def asset_urls(riders : pd.DataFrame, races : pd.DataFrame) -> List[str]:
+    """
+    Args:
+        riders (pd.DataFrame): Riders.
+        races (pd.DataFrame): Races.
+    Returns:
+        List[str]: The image URLs of the riders and races, each one once.
+    """
+    urls = []
+    for table, df in (("riders", riders), ("races", races)):
+        column = ASSET_COLUMNS[table]
+        if column in df:
+            urls.extend(df[column].dropna().astype(str))
+    return list(dict.fromkeys(url for url in urls if url))
+
+async def sync_assets(
+    urls : Iterable[str],
+    directory : str = DEFAULT_ASSETS_DIR,
+    concurrency : int = 8,
+    revalidate : bool = False,
+    thumbnails : bool = True,
+    workers : Optional[int] = None,
+    policy : Optional[RetryPolicy] = None,
+    report : Optional[FailureReport] = None
+    ) -> Dict[str, int]:
+    """
+    Brings the store up to date with a list of image URLs, then makes the missing thumbnails
+    in worker processes.
+    Args:
+        urls (Iterable[str]): URLs of the images.
+        directory (str): Directory of the store. Defaults to data/assets.
+        concurrency (int): Images downloaded at once. Defaults to 8.
+        revalidate (bool): Whether to ask the stored images again with conditional requests,
+            see AssetStore.fetch. Defaults to False.
+        thumbnails (bool): Whether to make thumbnails. Defaults to True, ignored if Pillow is
+            not installed.
+        workers (int, optional): Worker processes making the thumbnails. Defaults to the number
+            of CPUs.
+        policy (RetryPolicy, optional): Timeout and retry policy. Defaults to RetryPolicy().
+        report (FailureReport, optional): Collects the failed downloads ("assets" stage) and
+            thumbnails ("thumbnails" stage).
+    Returns:
+        Dict[str, int]: Number of URLs per outcome of AssetStore.fetch, of "failed" ones, of
+            "bytes" downloaded and of "thumbnails" made.
+    """
+    store = AssetStore(directory)
+    report = report if report is not None else FailureReport()
+    failed = len(report)
+    urls = list(dict.fromkeys(urls))
+    client = ClientConfig(pool_size=concurrency, per_host=concurrency)
+    try:
+        async with create_session(client) as session:
+            outcomes = await gather_stage(
+                "assets",
+                [(url, lambda url=url: store.fetch(url, session, revalidate)) for url in urls],
+                report, policy, concurrency, desc="Assets"
+            )
+    finally:
+        store.save()
+    counts = {
+        outcome : outcomes.count(outcome)
+        for outcome in ("new", "changed", "duplicate", "unchanged", "skipped")
+    }
+    counts["failed"] = len(report) - failed
+    counts["bytes"] = store.transferred
+    counts["thumbnails"] = 0
+
+    if thumbnails and thumbnails_available():
+        # One thumbnail per image, whatever the number of its URLs
+        missing = {}
+        for url in urls:
+            asset = store.get(url)
+            if asset is not None and not os.path.exists(store.thumbnail_path(asset)):
+                missing.setdefault(asset.hash, (url, asset))
+        made = []
+        if missing:
+            async with ParsePool(workers) as pool:
+                made = await asyncio.gather(*(
+                    pool.run(make_thumbnail, store.object_path(asset), store.thumbnail_path(asset))
+                    for _, asset in missing.values()
+                ), return_exceptions=True)
+        # An image Pillow cannot read is reported, the other thumbnails are kept
+        for (url, _), result in zip(missing.values(), made):
+            if isinstance(result, Exception):
+                report.add("thumbnails", url, result)
+        counts["thumbnails"] = sum(not isinstance(result, Exception) for result in made)
+    return counts
+
+def run(args : argparse.Namespace):
+    """
+    Runs the command line : syncs the images of the datasets and prints the outcome.
+    Args:
+        args (argparse.Namespace): directories, concurrency, revalidation and thumbnails, see
+            the arguments below.
+    """
+    dataset = load_dataset(data_dir=args.data_dir)
+    synced = asyncio.run(sync_assets(
+        asset_urls(dataset["riders"], dataset["races"]),
+        args.assets_dir,
+        concurrency=args.concurrency,
+        revalidate=args.revalidate,
+        thumbnails=not args.no_thumbnails
+    ))
+    print(f"Assets : {synced}")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--data-dir", default=DATA_DIR)
+    arg_parser.add_argument("--assets-dir", default=DEFAULT_ASSETS_DIR)
+    arg_parser.add_argument("--concurrency", type=int, default=8, help="images downloaded at once")
+    arg_parser.add_argument(
+        "--revalidate", action="store_true",
+        help="ask the stored images again, only downloading the changed ones"
+    )
+    arg_parser.add_argument("--no-thumbnails", action="store_true")
+    run(arg_parser.parse_args())
@@ -0,0 +1,405 @@
+"""
+Sharded backfill : the seasons to collect are split into shards of consecutive seasons, crawled
+by worker processes, each one with its own session and concurrency budget, into its own output
+directory. The shards are then merged in a deterministic order.
+
+The crawl runs in phases, so that every page is fetched once across the shards : the riders are
+dealt evenly to the shards, which fetch their profiles and results pages and only collect the
+URLs of their races. The coordinator deduplicates these URLs and gives each race to the shard
+of its season. With the "race" strategy, the riders first seen in the race tables are then
+deduplicated and dealt to the shards too, for their profiles.
+
+    python -m src.backfill --years 2000 2024 --shard-size 5 --workers 4
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+import argparse
+import asyncio
+import multiprocessing
+import os
+import re
+import time
+import pandas as pd
+from src.cache import DEFAULT_CACHE_DIR, ResponseCache
+from src.client import ClientConfig, create_session
+from src.conversion import convert_races, convert_results
+from src.dataset import DATA_DIR, to_typed, write_dataset
+from src.features import read_table, table_path, write_table
+from src.constants import MIN_YEAR, STRATEGIES
+from src.get_tt_specialists import get_all_tt_specialists_async
+from src.pipeline import CrawlPipeline
+from src.tasks import FailureReport, RetryPolicy
+
+DEFAULT_BACKFILL_DIR = os.path.join(DATA_DIR, "backfill")
+TABLES = ("riders", "results", "races")
+# Phases of a backfill, run one after the other, see the module docstring
+PHASES = ("riders", "races", "profiles")
+# Keys of the rows kept once, and sort order of the merged tables (the keys break the ties)
+KEYS = {"riders" : ["url"], "results" : ["rider_url", "race_url"], "races" : ["url"]}
+ORDER = {
+    "riders" : (["last_name", "first_name", "url"], True),
+    "results" : (["rider_url", "race_url"], True),
+    "races" : (["date", "race_title", "url"], [False, True, True]),
+}
+# Season of a race, from its URL, e.g. race/tour-de-france/2024/stage-21
+RACE_SEASON = re.compile(r"/race/[^/]+/(\d{4})(?:/|$)")
+
+@dataclass
+class Shard:
+    """
+    Work of one worker process in each phase.
+    Attributes:
+        first (int): First season of its races.
+        last (int): Last season of its races.
+        riders (List[Tuple[str, str]]): (name, profile URL) of the riders it crawls.
+        races (List[str]): URLs of the races it fetches, those of its seasons.
+        profiles (List[Tuple[str, str]]): (name, profile URL) of the riders first seen in a
+            race table, whose profile it fetches ("race" strategy).
+    """
+    first : int
+    last : int
+    riders : List[Tuple[str, str]] = field(default_factory=list)
+    races : List[str] = field(default_factory=list)
+    profiles : List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the shard, and of its output directory.
+        """
+        return f"{self.first}-{self.last}"
+
+def make_shards(first : int, last : int, size : int = 1) -> List[Shard]:
+    """
+    Args:
+        first (int): First season.
+        last (int): Last season.
+        size (int): Seasons per shard. Defaults to 1.
+    Returns:
+        List[Shard]: The shards, latest seasons first, without work yet.
+    """
+    return [
+        Shard(max(first, end - size + 1), end) for end in range(last, first - 1, -size)
+    ]
+
+def _deal(riders : Iterable[Tuple[str, str]], count : int) -> List[List[Tuple[str, str]]]:
+    """
+    Deals riders to count hands of the same size, give or take one, each rider once.
+    """
+    unique = sorted(dict((url, name) for name, url in riders).items())
+    return [[(name, url) for url, name in unique[i::count]] for i in range(count)]
+
+def assign_riders(shards : List[Shard], by_season : Dict[int, Iterable[Tuple[str, str]]]):
+    """
+    Deals the riders evenly to the shards, each one to a single shard : a rider's results page
+    holds every season, and a season's rankings mostly hold the riders of the next one.
+    Args:
+        shards (List[Shard]): The shards, see make_shards.
+        by_season (Dict[int, Iterable[Tuple[str, str]]]): Riders ranked in each season.
+    """
+    hands = _deal((rider for riders in by_season.values() for rider in riders), len(shards))
+    for shard, riders in zip(shards, hands):
+        shard.riders = riders
+
+def race_season(url : str) -> Optional[int]:
+    """
+    Returns:
+        int: Season of a race, from its URL. None if the URL holds none.
+    """
+    match = RACE_SEASON.search(url)
+    return int(match.group(1)) if match else None
+
+def assign_races(shards : List[Shard], urls : Iterable[str]):
+    """
+    Gives each race, once, to the shard of its season. Races before the first season go to the
+    oldest shard, the others outside the shards (e.g. the current season) to the latest one.
+    Args:
+        shards (List[Shard]): The shards, latest seasons first, see make_shards.
+        urls (Iterable[str]): URLs of the races, duplicates included.
+    """
+    for shard in shards:
+        shard.races = []
+    for url in sorted(set(urls)):
+        season = race_season(url)
+        if season is None:
+            shard = shards[0]
+        else:
+            shard = next((shard for shard in shards if shard.first <= season), shards[-1])
+        shard.races.append(url)
+
+def assign_profiles(shards : List[Shard], riders : Iterable[Tuple[str, str]]):
+    """
+    Deals the riders first seen in the race tables evenly to the shards, each one once.
+    Args:
+        shards (List[Shard]): The shards.
+        riders (Iterable[Tuple[str, str]]): (name, profile URL) of the riders, duplicates
+            included.
+    """
+    for shard, riders in zip(shards, _deal(riders, len(shards))):
+        shard.profiles = riders
+
+async def discover_by_season(
+    seasons : List[int],
+    top_n : int = 50,
+    policy : Optional[RetryPolicy] = None
+    ) -> Dict[int, Set[Tuple[str, str]]]:
+    """
+    Args:
+        seasons (List[int]): Seasons whose rankings give the riders.
+        top_n (int): Number of riders taken from the top of each season's rankings.
+        policy (RetryPolicy, optional): Timeout and retry policy. Defaults to RetryPolicy().
+    Returns:
+        Dict[int, Set[Tuple[str, str]]]: (name, profile URL) of the riders ranked each season.
+    """
+    async with create_session() as session:
+        riders = await asyncio.gather(*(
+            get_all_tt_specialists_async(session, [season], top_n, policy=policy)
+            for season in seasons
+        ))
+    return dict(zip(seasons, riders))
+
+async def _crawl_shard(
+    shard : Shard,
+    phase : str,
+    min_year : int,
+    concurrency : int,
+    strategy : str,
+    cache : Optional[ResponseCache]
+    ) -> Tuple[Dict[str, pd.DataFrame], FailureReport, CrawlPipeline]:
+    report = FailureReport()
+    client = ClientConfig(pool_size=3 * concurrency, per_host=3 * concurrency)
+    async with create_session(client) as session:
+        # The races and new riders are left to the coordinator, to be fetched once
+        pipeline = CrawlPipeline(
+            session, report, RetryPolicy(), concurrency, cache=cache, progress=False, raw=True,
+            strategy=strategy, min_year=min_year, follow_races=False, follow_profiles=False
+        )
+        if phase == "riders":
+            riders, results, races = await pipeline.run(shard.riders)
+        elif phase == "races":
+            riders, results, races = await pipeline.run_races(shard.races)
+        else:
+            riders, results, races = await pipeline.run_profiles(shard.profiles)
+    races = convert_races(races.to_frame())
+    if not races.empty:
+        races["date"] = pd.to_datetime(races["date"])
+    tables = {
+        "riders" : riders.to_frame(),
+        "results" : convert_results(results.to_frame()),
+        "races" : races
+    }
+    return tables, report, pipeline
+
+def run_shard(
+    shard : Shard,
+    phase : str = "riders",
+    output_dir : str = DEFAULT_BACKFILL_DIR,
+    min_year : int = MIN_YEAR,
+    concurrency : int = 16,
+    strategy : str = "rider",
+    cache_dir : Optional[str] = None
+    ) -> Dict:
+    """
+    Runs a phase of a shard and writes its tables to output_dir/<shard name>/<phase>, meant to
+    run in a worker process.
+    Args:
+        shard (Shard): The shard.
+        phase (str): "riders" to crawl shard.riders and their results pages, "races" to fetch
+            shard.races, "profiles" to fetch shard.profiles, see PHASES. Defaults to "riders".
+        output_dir (str): Directory of the shards. Defaults to data/backfill.
+        min_year (int): First season of the results collected. Defaults to MIN_YEAR.
+        concurrency (int): Pages processed at once per stage. Defaults to 16.
+        strategy (str): See src.pipeline.STRATEGIES. Defaults to "rider".
+        cache_dir (str, optional): If given, the shard caches responses in its own
+            subdirectory, a cache being owned by a single process.
+    Returns:
+        Dict: Directory, row counts, failed pages and duration of the phase, with race_urls,
+            the races seen in the results, and new_riders, the riders first seen in the race
+            tables, for the coordinator to share out.
+    """
+    start = time.perf_counter()
+    cache = ResponseCache(os.path.join(cache_dir, shard.name)) if cache_dir else None
+    try:
+        tables, report, pipeline = asyncio.run(_crawl_shard(
+            shard, phase, min_year, concurrency, strategy, cache
+        ))
+    finally:
+        if cache is not None:
+            cache.close()
+    directory = os.path.join(output_dir, shard.name, phase)
+    os.makedirs(directory, exist_ok=True)
+    for table, df in tables.items():
+        write_table(df, table_path(directory, table))
+    if report:
+        report.to_json(os.path.join(directory, "errors.json"))
+    return {
+        "directory" : directory,
+        **{table : len(df) for table, df in tables.items()},
+        "failures" : len(report),
+        "seconds" : round(time.perf_counter() - start, 3),
+        "race_urls" : sorted(pipeline.seen_races),
+        "new_riders" : pipeline.new_riders
+    }
+
+def merge_shards(directories : List[str]) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Merges shards : rows found by several shards are kept once, from the first of the given
+    directories holding them, the tables are typed, see src.dataset.SCHEMAS, and sorted as
+    main.py writes them.
+    Args:
+        directories (List[str]): Output directories of the shards.
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]: riders, results and races.
+    """
+    merged = []
+    for table in TABLES:
+        frames = [
+            df for df in (read_table(table_path(directory, table)) for directory in directories)
+            if not df.empty
+        ]
+        if not frames:
+            merged.append(pd.DataFrame())
+            continue
+        # Typed again, the categories of the shards differing
+        df = to_typed(pd.concat(frames, ignore_index=True), table).drop_duplicates(KEYS[table])
+        by, ascending = ORDER[table]
+        merged.append(df.sort_values(
+            by=by, ascending=ascending, kind="stable", ignore_index=True
+        ))
+    return tuple(merged)
+
+def _run_phase(
+    executor : Executor,
+    shards : List[Shard],
+    phase : str,
+    verbose : bool,
+    **kwargs
+    ) -> List[Dict]:
+    """
+    Runs a phase of the shards having work in it, see run_shard.
+    """
+    shards = [shard for shard in shards if getattr(shard, phase)]
+    futures = [executor.submit(run_shard, shard, phase, **kwargs) for shard in shards]
+    summaries = [future.result() for future in futures]
+    if verbose:
+        for shard, summary in zip(shards, summaries):
+            counts = {
+                key : value for key, value in summary.items()
+                if key not in ("race_urls", "new_riders")
+            }
+            print(f"Shard {shard.name}, {phase} : {counts}")
+    return summaries
+
+def backfill(
+    first : int,
+    last : int,
+    shard_size : int = 1,
+    workers : Optional[int] = None,
+    concurrency : int = 16,
+    top_n : int = 50,
+    min_year : Optional[int] = None,
+    strategy : str = "rider",
+    output_dir : str = DEFAULT_BACKFILL_DIR,
+    cache_dir : Optional[str] = None,
+    to_csv : bool = True,
+    verbose=True
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Collects the riders ranked from season first to season last and their results from
+    min_year, in worker processes, each page being fetched by a single shard.
+    Args:
+        first (int): First season.
+        last (int): Last season.
+        shard_size (int): Seasons of races per shard. Defaults to 1.
+        workers (int, optional): Number of worker processes. Defaults to the number of cores.
+        concurrency (int): Pages processed at once per stage, in each shard. Defaults to 16.
+        top_n (int): Number of riders taken from each season's rankings. Defaults to 50.
+        min_year (int, optional): First season of the results collected. Defaults to first.
+        strategy (str): See src.pipeline.STRATEGIES. Defaults to "rider".
+        output_dir (str): Directory of the shards. Defaults to data/backfill.
+        cache_dir (str, optional): See run_shard. Defaults to None (no caching).
+        to_csv (bool): Whether to write the merged dataset to data/, see
+            src.dataset.write_dataset. Defaults to True.
+        verbose (bool): Whether to print progress messages. Defaults to True.
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]: riders, results and races.
+    """
+    options = {
+        "output_dir" : output_dir,
+        "min_year" : min_year if min_year is not None else first,
+        "concurrency" : concurrency,
+        "strategy" : strategy,
+        "cache_dir" : cache_dir
+    }
+    shards = make_shards(first, last, shard_size)
+    by_season = asyncio.run(discover_by_season(list(range(first, last + 1)), top_n))
+    assign_riders(shards, by_season)
+    if verbose:
+        print(
+            f"{sum(len(shard.riders) for shard in shards)} riders in {len(shards)} shards : "
+            + ", ".join(f"{shard.name} ({len(shard.riders)})" for shard in shards)
+        )
+
+    # Spawned rather than forked : each worker starts its own event loop from a clean state
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(), mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        summaries = _run_phase(executor, shards, "riders", verbose, **options)
+        assign_races(shards, (url for summary in summaries for url in summary["race_urls"]))
+        if verbose:
+            print(
+                f"{sum(len(shard.races) for shard in shards)} races : "
+                + ", ".join(f"{shard.name} ({len(shard.races)})" for shard in shards)
+            )
+        race_summaries = _run_phase(executor, shards, "races", verbose, **options)
+        summaries += race_summaries
+        crawled = {url for shard in shards for _, url in shard.riders}
+        assign_profiles(shards, (
+            rider for summary in race_summaries for rider in summary["new_riders"]
+            if rider[1] not in crawled
+        ))
+        summaries += _run_phase(executor, shards, "profiles", verbose, **options)
+
+    riders, results, races = merge_shards([summary["directory"] for summary in summaries])
+    if to_csv:
+        write_dataset(riders, results, races)
+    if verbose:
+        print(
+            f"Backfilled {len(riders)} riders, {len(results)} results and {len(races)} races"
+        )
+    return riders, results, races
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument(
+        "--years", type=int, nargs=2, required=True, metavar=("FIRST", "LAST"),
+        help="seasons whose rankings give the riders, and whose results are collected"
+    )
+    arg_parser.add_argument(
+        "--shard-size", type=int, default=1, help="seasons of races per shard"
+    )
+    arg_parser.add_argument("--workers", type=int, help="worker processes, one per core")
+    arg_parser.add_argument(
+        "--concurrency", type=int, default=16, help="pages processed at once per stage and shard"
+    )
+    arg_parser.add_argument("--top-n", type=int, default=50, help="riders taken per season")
+    arg_parser.add_argument(
+        "--min-year", type=int, help="first season of the results collected, defaults to FIRST"
+    )
+    arg_parser.add_argument("--strategy", choices=STRATEGIES, default="rider")
+    arg_parser.add_argument("--output-dir", default=DEFAULT_BACKFILL_DIR)
+    arg_parser.add_argument("--no-cache", action="store_true", help="do not cache responses")
+    args = arg_parser.parse_args()
+    backfill(
+        args.years[0], args.years[1],
+        shard_size=args.shard_size,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        top_n=args.top_n,
+        min_year=args.min_year,
+        strategy=args.strategy,
+        output_dir=args.output_dir,
+        cache_dir=None if args.no_cache else DEFAULT_CACHE_DIR
+    )
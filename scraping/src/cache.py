@@ -0,0 +1,264 @@
+"""
+Persistent on-disk HTTP response cache used by fetch and fetch_async.
+"""
+
+from typing import Dict, List, Optional, Pattern, Tuple
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_CACHE_DIR = "data/.http_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# The index is written every INDEX_FLUSH_EVERY stores and on close, not on every store : it
+# holds every URL, so writing it each time made a crawl quadratic in its number of pages
+INDEX_FLUSH_EVERY = 256
+# Eviction goes below the size budget by this share, so that it does not run on every store
+EVICTION_SLACK = 0.1
+
+DAY = 24 * 3600
+# Time to live (in seconds) per class of URL, the first matching pattern wins.
+# None means the page never expires : past race pages do not change anymore.
+DEFAULT_TTLS = [
+    (re.compile(r"/race/"), None),
+    (re.compile(r"/rider/[^/]+/results/"), DAY // 2),
+    (re.compile(r"/rider/"), DAY),
+    (re.compile(r"rankings\.php"), DAY),
+]
+DEFAULT_TTL = DAY
+
+
+class ResponseCache:
+    """
+    URL-keyed response cache stored on disk.
+
+    Bodies are stored as one file per URL, metadata (validators, timestamps, sizes) lives in a
+    JSON index. Entries expire according to per URL class TTLs, expired entries keep their
+    ETag / Last-Modified validators so they can be revalidated with a conditional request.
+    The total size of the stored bodies is bounded, least recently used entries are evicted first.
+    The index is written in batches and on close, a crash loses at most the last batch of
+    entries (their bodies are simply downloaded again).
+    """
+
+    def __init__(
+        self,
+        directory : str = DEFAULT_CACHE_DIR,
+        max_bytes : int = DEFAULT_MAX_BYTES,
+        ttls : List[Tuple[Pattern, Optional[int]]] = None,
+        default_ttl : Optional[int] = DEFAULT_TTL,
+        offline : bool = False
+        ):
+        """
+        Args:
+            directory (str): Directory where the cache is stored. Created if needed.
+            max_bytes (int): Maximum total size of the stored bodies.
+            ttls (List[Tuple[Pattern, Optional[int]]]): (URL pattern, TTL in seconds) pairs.
+                Defaults to DEFAULT_TTLS.
+            default_ttl (Optional[int]): TTL for URLs matching no pattern.
+            offline (bool): If True, entries never expire, useful to re-run parsers offline.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.offline = offline
+        self.stats = {"hits": 0, "misses": 0, "revalidations": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._unsaved_stores = 0
+        os.makedirs(directory, exist_ok=True)
+        self._index = self._load_index()
+        self._total = sum(entry["size"] for entry in self._index.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    def _body_path(self, url : str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key + ".html")
+
+    def _load_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self):
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+        self._dirty = False
+        self._unsaved_stores = 0
+
+    def ttl_for(self, url : str) -> Optional[int]:
+        """
+        Gives the time to live of a URL, according to the first matching pattern.
+        Args:
+            url (str): URL
+        Returns:
+            Optional[int]: TTL in seconds, None if the page never expires.
+        """
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def _is_fresh(self, url : str, entry : Dict) -> bool:
+        if self.offline:
+            return True
+        ttl = self.ttl_for(url)
+        return ttl is None or time.time() - entry["stored_at"] < ttl
+
+    def _read_body(self, url : str) -> Optional[str]:
+        try:
+            with open(self._body_path(url), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            entry = self._index.pop(url, None)
+            if entry is not None:
+                self._total -= entry["size"]
+            self._dirty = True
+            return None
+
+    def get(self, url : str) -> Optional[str]:
+        """
+        Gives the cached body of a URL if it is present and fresh.
+        Args:
+            url (str): URL
+        Returns:
+            Optional[str]: Cached body, None on a miss or if the entry expired.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            body = None
+            if entry is not None and self._is_fresh(url, entry):
+                body = self._read_body(url)
+            if body is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            entry["last_access"] = time.time()
+            self._dirty = True
+            return body
+
+    def conditional_headers(self, url : str) -> Dict[str, str]:
+        """
+        Gives the headers to revalidate an expired entry with a conditional request.
+        Args:
+            url (str): URL
+        Returns:
+            Dict[str, str]: If-None-Match / If-Modified-Since headers, empty if nothing is cached.
+        """
+        entry = self._index.get(url)
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def revalidate(self, url : str, headers=None) -> Optional[str]:
+        """
+        Marks an entry as fresh again after a 304 Not Modified response.
+        Args:
+            url (str): URL
+            headers (Mapping, optional): Headers of the 304 response, may carry new validators.
+        Returns:
+            Optional[str]: The cached body, None if the entry disappeared in the meantime.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            body = self._read_body(url) if entry is not None else None
+            if body is None:
+                return None
+            now = time.time()
+            entry["stored_at"] = now
+            entry["last_access"] = now
+            if headers:
+                entry["etag"] = headers.get("ETag", entry.get("etag"))
+                entry["last_modified"] = headers.get("Last-Modified", entry.get("last_modified"))
+            self.stats["revalidations"] += 1
+            self._dirty = True
+            return body
+
+    def store(self, url : str, body : str, headers=None):
+        """
+        Stores a response body, then evicts least recently used entries if the cache is too big.
+        Args:
+            url (str): URL
+            body (str): Response body.
+            headers (Mapping, optional): Response headers, used to keep the validators.
+        """
+        headers = headers or {}
+        path = self._body_path(url)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(body)
+            now = time.time()
+            previous = self._index.get(url)
+            if previous is not None:
+                self._total -= previous["size"]
+            self._index[url] = {
+                "stored_at" : now,
+                "last_access" : now,
+                "size" : os.path.getsize(path),
+                "etag" : headers.get("ETag"),
+                "last_modified" : headers.get("Last-Modified"),
+            }
+            self._total += self._index[url]["size"]
+            self.stats["stores"] += 1
+            if self._total > self.max_bytes:
+                self._evict()
+            self._dirty = True
+            self._unsaved_stores += 1
+            if self._unsaved_stores >= INDEX_FLUSH_EVERY:
+                self._save_index()
+
+    def _evict(self):
+        target = (1 - EVICTION_SLACK) * self.max_bytes
+        by_last_access = sorted(self._index.items(), key=lambda item: item[1]["last_access"])
+        for url, entry in by_last_access:
+            if self._total <= target:
+                break
+            try:
+                os.remove(self._body_path(url))
+            except FileNotFoundError:
+                pass
+            del self._index[url]
+            self._total -= entry["size"]
+            self.stats["evictions"] += 1
+
+    def size(self) -> int:
+        """
+        Returns:
+            int: Total size in bytes of the stored bodies.
+        """
+        return self._total
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, url : str) -> bool:
+        return url in self._index
+
+    def close(self):
+        """
+        Writes the pending changes (new entries, access times of the hits) to the index.
+        """
+        with self._lock:
+            if self._dirty:
+                self._save_index()
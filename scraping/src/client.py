@@ -0,0 +1,179 @@
+"""
+Shared HTTP clients : a single factory for the aiohttp session of the async crawl and the
+requests session of the *_sync functions, with the same connection pool, keep-alive,
+compression, User-Agent and timeout settings, and connection reuse statistics.
+"""
+
+from typing import Dict, Optional
+from dataclasses import dataclass
+import functools
+import importlib.util
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_USER_AGENT = "pcs-chrono/1.0 (time trial data scraper)"
+# Both clients decode brotli bodies only when a brotli package is installed
+ACCEPT_ENCODING = "gzip, deflate" + (
+    ", br" if any(importlib.util.find_spec(name) for name in ("brotli", "brotlicffi")) else ""
+)
+
+@dataclass
+class ClientConfig:
+    """
+    Settings of an HTTP client.
+    Attributes:
+        pool_size (int): Maximum number of open connections.
+        per_host (int): Maximum number of open connections to a single host. PCS being a
+            single host, it bounds the requests in flight.
+        keepalive (float): Seconds an idle connection is kept open for reuse (async client,
+            the sync client keeps it until the server closes it).
+        dns_ttl (int): Seconds a DNS resolution is cached (async client).
+        connect_timeout (float): Timeout in seconds to open a connection.
+        read_timeout (float): Timeout in seconds between two reads of a response.
+        user_agent (str): User-Agent header of every request.
+    """
+    pool_size : int = 100
+    per_host : int = 64
+    keepalive : float = 30.0
+    dns_ttl : int = 300
+    connect_timeout : float = 10.0
+    read_timeout : float = 30.0
+    user_agent : str = DEFAULT_USER_AGENT
+
+    def headers(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Headers sent with every request.
+        """
+        return {"User-Agent" : self.user_agent, "Accept-Encoding" : ACCEPT_ENCODING}
+
+@dataclass
+class ConnectionStats:
+    """
+    Connection reuse counters of a client.
+    Attributes:
+        requests (int): Requests sent.
+        connections (int): Connections opened, each one costing a TCP (and TLS) handshake.
+        dns_hits (int): DNS resolutions served from the cache (async client).
+        dns_misses (int): DNS resolutions done (async client).
+    """
+    requests : int = 0
+    connections : int = 0
+    dns_hits : int = 0
+    dns_misses : int = 0
+
+    @property
+    def reused(self) -> int:
+        """
+        Requests sent on an already open connection.
+        """
+        return max(self.requests - self.connections, 0)
+
+    def __str__(self) -> str:
+        share = self.reused / self.requests if self.requests else 0.0
+        return (
+            f"{self.requests} requests on {self.connections} connections"
+            f" ({share:.0%} on a reused connection)"
+        )
+
+def _trace_config(stats : ConnectionStats) -> aiohttp.TraceConfig:
+    def count(counter : str):
+        async def on_event(session, context, params): # pylint: disable=unused-argument
+            setattr(stats, counter, getattr(stats, counter) + 1)
+        return on_event
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(count("requests"))
+    trace.on_connection_create_end.append(count("connections"))
+    trace.on_dns_cache_hit.append(count("dns_hits"))
+    trace.on_dns_cache_miss.append(count("dns_misses"))
+    return trace
+
+def create_session(
+    config : Optional[ClientConfig] = None,
+    stats : Optional[ConnectionStats] = None
+    ) -> aiohttp.ClientSession:
+    """
+    Creates the aiohttp session of the async crawl, to be used as an async context manager
+    from the running event loop.
+    Args:
+        config (ClientConfig, optional): Client settings. Defaults to ClientConfig().
+        stats (ConnectionStats, optional): If given, updated by every request.
+    Returns:
+        aiohttp.ClientSession: The session.
+    """
+    config = config or ClientConfig()
+    connector = aiohttp.TCPConnector(
+        limit=config.pool_size,
+        limit_per_host=config.per_host,
+        keepalive_timeout=config.keepalive,
+        ttl_dns_cache=config.dns_ttl
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=config.headers(),
+        timeout=aiohttp.ClientTimeout(
+            total=None, sock_connect=config.connect_timeout, sock_read=config.read_timeout
+        ),
+        trace_configs=[_trace_config(stats)] if stats is not None else None
+    )
+
+class _PoolAdapter(HTTPAdapter):
+    """
+    Transport adapter giving every request the configured timeouts and counting the connections
+    its pools open.
+    """
+
+    def __init__(self, config : ClientConfig, stats : Optional[ConnectionStats]):
+        self.timeout = (config.connect_timeout, config.read_timeout)
+        self.stats = stats
+        super().__init__(pool_connections=config.pool_size, pool_maxsize=config.per_host)
+
+    def _opened(self) -> int:
+        pools = self.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def send(self, request, **kwargs): # pylint: disable=arguments-differ
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        if self.stats is None:
+            return super().send(request, **kwargs)
+        opened = self._opened()
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            self.stats.requests += 1
+            self.stats.connections += self._opened() - opened
+
+def create_sync_session(
+    config : Optional[ClientConfig] = None,
+    stats : Optional[ConnectionStats] = None
+    ) -> requests.Session:
+    """
+    Creates a requests session for the *_sync functions.
+    Args:
+        config (ClientConfig, optional): Client settings. Defaults to ClientConfig().
+        stats (ConnectionStats, optional): If given, updated by every request.
+    Returns:
+        requests.Session: The session, its connections are kept open between requests.
+    """
+    config = config or ClientConfig()
+    session = requests.Session()
+    session.headers.update(config.headers())
+    adapter = _PoolAdapter(config, stats)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Connection reuse of the shared sync session
+SYNC_STATS = ConnectionStats()
+
+@functools.lru_cache(maxsize=None)
+def shared_sync_session() -> requests.Session:
+    """
+    Returns:
+        requests.Session: Session shared by the fetches that are not given one, see
+            src.utils.fetch. Its statistics are SYNC_STATS.
+    """
+    return create_sync_session(stats=SYNC_STATS)
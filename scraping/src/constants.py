@@ -0,0 +1,27 @@
+"""
+Constants shared by the crawler, the datasets and the command lines. Only the standard library
+is imported here, so that parsing the arguments of pcs_chrono.py and the quick commands
+(queries, predictions, exports) do not load the crawler to read them.
+"""
+
+import os
+
+DATA_DIR = "data"
+# Path of a rider's results page from the rider's profile URL, the results are keyed by it
+RESULTS_PATH = "/results/last-tt-results"
+# Seasons whose rankings give the riders to crawl
+DEFAULT_YEARS = range(2020, 2025)
+# First season collected by default, a backfill goes further back, see src.backfill
+MIN_YEAR = 2020
+# "rider" : the results come from each rider's results page, top 20 finishes only
+# "race" : the rider pages give the races to crawl, and the results come from the full result
+# table of each race page, the profiles of the riders seen there being fetched too
+STRATEGIES = ("rider", "race")
+EXPORT_FORMATS = ("csv", "parquet", "sqlite")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "pcs_chrono.sqlite")
+DEFAULT_JOURNAL_PATH = os.path.join(DATA_DIR, "crawl.journal")
+DEFAULT_INDEX_DIR = os.path.join(DATA_DIR, "index")
+DEFAULT_MODELS_DIR = os.path.join(DATA_DIR, "models")
+DEFAULT_ASSETS_DIR = os.path.join(DATA_DIR, "assets")
+# Port of the prediction server, see src.serving
+DEFAULT_PORT = 8081
@@ -0,0 +1,215 @@
+"""
+Vectorized conversion of the raw strings captured by the parsers into typed columns.
+
+With raw=True, parse_race and parse_results keep the text of their numeric fields, and whole
+columns are converted here at once with pyarrow compute kernels instead of one to_numeric /
+minutes_to_seconds call per cell. Every function gives the same values as its per-value
+counterpart, and the same column dtypes as a DataFrame built from the per-value outputs (int64
+if every value is an integer, float64 if some are floats or missing, object if all are missing).
+Without pyarrow, the per-value helpers are applied to each cell.
+"""
+
+from typing import Callable, Optional
+import importlib.util
+import numpy as np
+import pandas as pd
+from src.get_tt_races import handle_startlist_quality
+from src.utils import minutes_to_seconds, to_numeric
+
+ARROW = importlib.util.find_spec("pyarrow") is not None
+if ARROW:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+# Columns of each dataset left as raw strings by the parsers with raw=True
+RAW_COLUMNS = {
+    "results" : ("seconds_lost",),
+    "races" : (
+        "distance", "vertical_meters", "startlist_quality", "profile_score", "temperature",
+        "race_ranking", "winner_time"
+    ),
+}
+# Strings read as missing values by src.utils.to_numeric
+NULL_TOKENS = ("", "n/a", "N/A", "NaN", "nan", "None")
+# What int() and, when there is a ".", float() accept once stripped
+_INTEGER = r"^[+-]?[0-9]+$"
+_DECIMAL = r"^[+-]?([0-9]+\.[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?$"
+
+def _typed(values : np.ndarray, is_int : np.ndarray, index : pd.Index) -> pd.Series:
+    """
+    Gives a column the dtype pandas infers from the equivalent Python values : int where
+    is_int, float elsewhere, None where values is NaN.
+    """
+    missing = np.isnan(values)
+    if missing.all():
+        return pd.Series([None] * len(values), index=index, dtype=object)
+    if not missing.any() and is_int.all():
+        return pd.Series(values.astype(np.int64), index=index)
+    return pd.Series(values, index=index)
+
+def _per_value(raw : pd.Series, convert : Callable) -> pd.Series:
+    """
+    Fallback without pyarrow : converts each cell, None if the conversion fails.
+    """
+    def safe(value):
+        try:
+            return convert(value)
+        except (AttributeError, IndexError, TypeError, ValueError):
+            return None
+    return pd.Series([safe(value) for value in raw.tolist()], index=raw.index)
+
+def _strings(raw : pd.Series) -> "pa.Array":
+    return pa.array(raw.astype(object), type=pa.string(), from_pandas=True)
+
+def _mask(condition : "pa.Array") -> np.ndarray:
+    return pc.fill_null(condition, False).to_numpy(zero_copy_only=False)
+
+def _element(lists : "pa.ListArray", i : int) -> "pa.Array":
+    """
+    i-th element of each list, null where the list is shorter.
+    """
+    offsets = lists.offsets.to_numpy()
+    positions = pa.array(offsets[:-1] + i, mask=np.diff(offsets) <= i)
+    return pc.take(lists.values, positions)
+
+def _numbers(text : "pa.Array", pattern : str) -> np.ndarray:
+    """
+    Float values of the strings matching pattern, NaN for the others.
+    """
+    valid = pc.match_substring_regex(text, pattern)
+    return pc.cast(pc.if_else(valid, text, None), pa.float64()).to_numpy(zero_copy_only=False)
+
+def _numeric(text : "pa.Array", index : pd.Index) -> pd.Series:
+    text = pc.utf8_trim_whitespace(text)
+    text = pc.if_else(pc.is_in(text, value_set=pa.array(NULL_TOKENS)), None, text)
+    is_float = _mask(pc.match_substring(text, "."))
+    integers = _numbers(text, _INTEGER)
+    decimals = _numbers(text, _DECIMAL)
+    values = np.where(is_float, decimals, integers)
+    return _typed(values, ~is_float, index)
+
+def numeric_column(raw : pd.Series) -> pd.Series:
+    """
+    Vectorized src.utils.to_numeric : integers, floats (if there is a "."), None for the null
+    tokens and the invalid values.
+    Args:
+        raw (pd.Series): Raw strings, missing values are allowed.
+    Returns:
+        pd.Series: Numeric column.
+    """
+    if not ARROW:
+        return _per_value(raw, to_numeric)
+    return _numeric(_strings(raw), raw.index)
+
+def first_token_numeric(raw : pd.Series) -> pd.Series:
+    """
+    Numeric value of the first word of each string, e.g. "33.7 km" -> 33.7, None if blank.
+    """
+    if not ARROW:
+        return _per_value(raw, lambda value: to_numeric(value.split()[0]))
+    return _numeric(_element(pc.utf8_split_whitespace(_strings(raw)), 0), raw.index)
+
+def startlist_quality_column(raw : pd.Series) -> pd.Series:
+    """
+    Vectorized get_tt_races.handle_startlist_quality : "123" -> 123, "123 (45)" -> 45, None
+    otherwise.
+    """
+    if not ARROW:
+        return _per_value(raw, handle_startlist_quality)
+    tokens = pc.utf8_split_whitespace(_strings(raw))
+    count = pc.list_value_length(tokens)
+    second = pc.replace_substring_regex(_element(tokens, 1), r"[()]", "")
+    value = pc.if_else(
+        pc.equal(count, 1), _element(tokens, 0), pc.if_else(pc.equal(count, 2), second, None)
+    )
+    return _numeric(value, raw.index)
+
+def time_column(raw : pd.Series, sep : Optional[str] = ":") -> pd.Series:
+    """
+    Vectorized src.utils.minutes_to_seconds : "MM:SS" or "HH:MM:SS" in seconds. The "."
+    separator drops the milliseconds after ",", e.g. "45.24,57" -> 2724.
+    Args:
+        raw (pd.Series): Raw strings.
+        sep (str, optional): ":" or ".". None picks it per value, ":" if the value contains one,
+            like parse_race does for the winner's time. Defaults to ":".
+    Returns:
+        pd.Series: Seconds, None where the value is not a time.
+    """
+    if not ARROW:
+        def convert(value):
+            return minutes_to_seconds(value, sep or (":" if ":" in value else "."))
+        return _per_value(raw, convert)
+    text = _strings(raw)
+    if sep == ".":
+        dotted = pa.array(np.ones(len(text), dtype=bool))
+    else:
+        dotted = pc.invert(pc.match_substring(text, ":")) if sep is None else None
+    if dotted is not None:
+        colons = pc.replace_substring(pc.replace_substring_regex(text, r"(?s),.*", ""), ".", ":")
+        text = pc.if_else(dotted, colons, text)
+
+    parts = pc.split_pattern(text, ":")
+    count = np.diff(parts.offsets.to_numpy())
+    # int() accepts surrounding whitespace
+    values = _numbers(pc.utf8_trim_whitespace(parts.values), _INTEGER)
+    starts = parts.offsets.to_numpy()[:-1]
+    values = np.append(values, np.nan)
+
+    def part(i : int) -> np.ndarray:
+        return values[np.where(count > i, starts + i, len(values) - 1)]
+
+    # A third part means hours : minutes : seconds, and only when there are exactly three
+    seconds = np.where(
+        count == 3, part(0) * 3600 + part(1) * 60 + part(2), part(0) * 60 + part(1)
+    )
+    return _typed(seconds, np.ones(len(seconds), dtype=bool), raw.index)
+
+def round_like_python(values : np.ndarray, ndigits : int) -> np.ndarray:
+    """
+    Rounds like the round builtin. numpy rounds x * 10**ndigits, which differs from Python's
+    correctly rounded result on some exact ties, so those few values are rounded by Python.
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    ties = np.flatnonzero(np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6)
+    rounded[ties] = [round(float(value), ndigits) for value in values[ties]]
+    return rounded
+
+def convert_races(races : pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the raw races of parse_race(raw=True) to the output of parse_race.
+    Args:
+        races (pd.DataFrame): One row per race, numeric fields as raw strings.
+    Returns:
+        pd.DataFrame: Converted copy, with the winner's speed computed (None if the distance
+            or the time is missing).
+    """
+    if races.empty:
+        return races
+    races = races.copy()
+    races["distance"] = first_token_numeric(races["distance"])
+    races["temperature"] = first_token_numeric(races["temperature"])
+    for column in ("vertical_meters", "profile_score", "race_ranking"):
+        races[column] = numeric_column(races[column])
+    races["startlist_quality"] = startlist_quality_column(races["startlist_quality"])
+    races["winner_time"] = time_column(races["winner_time"], sep=None)
+    distance = races["distance"].to_numpy(dtype=float)
+    winner_time = races["winner_time"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(winner_time > 0, 3600 * distance / winner_time, np.nan)
+    races["winner_speed"] = round_like_python(speed, 3) # in km/h
+    return races
+
+def convert_results(results : pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the raw results of parse_results(raw=True) to the output of parse_results.
+    Args:
+        results (pd.DataFrame): One row per result, the time lost as a raw string.
+    Returns:
+        pd.DataFrame: Converted copy.
+    """
+    if results.empty:
+        return results
+    results = results.copy()
+    results["seconds_lost"] = time_column(results["seconds_lost"])
+    return results
@@ -0,0 +1,209 @@
+"""
+Typed datasets : explicit dtypes for riders, results and races, Parquet files next to the CSV
+files, and a memoized loader.
+"""
+
+from typing import Dict, Optional, Tuple, Union
+import importlib.util
+import os
+import pandas as pd
+from src.constants import DATA_DIR, EXPORT_FORMATS
+
+TABLES = ("riders", "results", "races")
+
+# Repeated strings are categorical, counts are nullable integers since PCS leaves some blank
+SCHEMAS = {
+    "riders" : {
+        "first_name" : "string",
+        "last_name" : "string",
+        "full_name" : "string",
+        "nationality" : "category",
+        "birth_year" : "Int16",
+        "height" : "float64",
+        "weight" : "float64",
+        "onedayraces" : "Int32",
+        "gc" : "Int32",
+        "tt" : "Int32",
+        "sprint" : "Int32",
+        "climber" : "Int32",
+        "hills" : "Int32",
+        "photo_url" : "string",
+        "url" : "string",
+    },
+    "results" : {
+        "rider_url" : "category",
+        "result" : "Int8",
+        "pnt" : "Int16",
+        "seconds_lost" : "Int32",
+        "race_url" : "category",
+    },
+    "races" : {
+        "race_title" : "string",
+        "date" : "datetime64[ns]",
+        "departure" : "category",
+        "arrival" : "category",
+        "class" : "category",
+        "distance" : "float64",
+        "vertical_meters" : "Int32",
+        "startlist_quality" : "Int32",
+        "profile_score" : "Int32",
+        "temperature" : "Int16",
+        "race_ranking" : "Int32",
+        "winner_time" : "Int32",
+        "winner_speed" : "float64",
+        "profile_image_url" : "string",
+        "url" : "string",
+    },
+}
+
+_memo : Dict[str, Tuple[Tuple, pd.DataFrame]] = {}
+
+def parquet_available() -> bool:
+    """
+    Returns:
+        bool: Whether a Parquet engine (pyarrow) is installed.
+    """
+    return importlib.util.find_spec("pyarrow") is not None
+
+def to_typed(df : pd.DataFrame, table : str) -> pd.DataFrame:
+    """
+    Casts the columns of a dataset to their declared dtypes.
+    Args:
+        df (pd.DataFrame): Dataset, as scraped or as read from CSV.
+        table (str): "riders", "results" or "races".
+    Returns:
+        pd.DataFrame: Typed copy of the dataset, unknown columns are left as they are.
+    """
+    schema = SCHEMAS[table]
+    dtypes = {column : dtype for column, dtype in schema.items() if column in df.columns}
+    typed = df.copy()
+    if "date" in dtypes:
+        typed["date"] = pd.to_datetime(typed["date"])
+        del dtypes["date"]
+    return typed.astype(dtypes)
+
+def write_dataset(
+    riders : pd.DataFrame,
+    results : pd.DataFrame,
+    races : pd.DataFrame,
+    data_dir : str = DATA_DIR,
+    parquet : bool = True
+    ):
+    """
+    Writes the three datasets as CSV files and, if possible, typed Parquet files.
+    Args:
+        riders (pd.DataFrame): Riders.
+        results (pd.DataFrame): Results.
+        races (pd.DataFrame): Races.
+        data_dir (str): Output directory. Defaults to "data".
+        parquet (bool): Whether to also write Parquet files. Defaults to True, ignored if
+            pyarrow is not installed.
+    """
+    for table, df in zip(TABLES, (riders, results, races)):
+        df.to_csv(os.path.join(data_dir, f"{table}.csv"), index=False)
+        if parquet and parquet_available():
+            to_typed(df, table).to_parquet(os.path.join(data_dir, f"{table}.parquet"), index=False)
+
+def _read(table : str, data_dir : str) -> pd.DataFrame:
+    """
+    Reads a dataset from its Parquet file if it is at least as recent as the CSV file,
+    from the CSV file with the declared dtypes otherwise.
+    """
+    csv_path = os.path.join(data_dir, f"{table}.csv")
+    parquet_path = os.path.join(data_dir, f"{table}.parquet")
+    if (
+        os.path.exists(parquet_path)
+        and parquet_available()
+        and (
+            not os.path.exists(csv_path)
+            or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)
+        )
+    ):
+        return pd.read_parquet(parquet_path)
+    schema = SCHEMAS[table]
+    dtypes = {column : dtype for column, dtype in schema.items() if column != "date"}
+    parse_dates = ["date"] if "date" in schema else False
+    return pd.read_csv(csv_path, dtype=dtypes, parse_dates=parse_dates)
+
+def _signature(table : str, data_dir : str) -> Tuple:
+    signature = []
+    for extension in ("csv", "parquet"):
+        path = os.path.join(data_dir, f"{table}.{extension}")
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append((extension, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def load_dataset(
+    table : Optional[str] = None,
+    data_dir : str = DATA_DIR
+    ) -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """
+    Loads typed datasets. Frames are memoized, and read again only when their files change.
+    Args:
+        table (str, optional): "riders", "results" or "races". Defaults to None (all three).
+        data_dir (str): Directory of the datasets. Defaults to "data".
+    Returns:
+        Union[pd.DataFrame, Dict[str, pd.DataFrame]]: The dataset, or a dict of the three
+            datasets by name.
+    Raises:
+        FileNotFoundError: If the dataset has neither a CSV nor a Parquet file.
+    """
+    if table is None:
+        return {name : load_dataset(name, data_dir) for name in TABLES}
+    if table not in SCHEMAS:
+        raise ValueError(f"Unknown dataset {table}, expected one of {TABLES}")
+
+    signature = _signature(table, data_dir)
+    if not signature:
+        raise FileNotFoundError(f"No {table}.csv nor {table}.parquet in {data_dir}")
+    key = os.path.abspath(os.path.join(data_dir, table))
+    memo = _memo.get(key)
+    if memo is None or memo[0] != signature:
+        memo = _memo[key] = (signature, _read(table, data_dir))
+    # Shallow copy : with the copy-on-write of pandas 3 (see requirements.txt), callers can't
+    # alter the memoized frame
+    return memo[1].copy(deep=False)
+
+def clear_cache():
+    """
+    Forgets every memoized frame.
+    """
+    _memo.clear()
+
+def export_dataset(
+    output : str,
+    fmt : str = "csv",
+    data_dir : str = DATA_DIR
+    ) -> Dict[str, int]:
+    """
+    Copies the typed datasets elsewhere, e.g. to hand them to another tool.
+    Args:
+        output (str): Output directory of the CSV or Parquet files, created if needed, or path
+            of the SQLite database.
+        fmt (str): One of EXPORT_FORMATS. Defaults to "csv".
+        data_dir (str): Directory of the datasets. Defaults to "data".
+    Returns:
+        Dict[str, int]: Number of rows of each dataset.
+    Raises:
+        ValueError: If the format is unknown, or is Parquet without pyarrow installed.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of {EXPORT_FORMATS}")
+    if fmt == "parquet" and not parquet_available():
+        raise ValueError("Exporting to Parquet needs pyarrow")
+    dataset = load_dataset(data_dir=data_dir)
+    if fmt == "sqlite":
+        from src.storage import SQLiteStorage # pylint: disable=import-outside-toplevel
+        # Every column is bound by the upserts, the missing ones are stored as NULL
+        with SQLiteStorage(output) as storage:
+            storage.write(*(dataset[table].reindex(columns=SCHEMAS[table]) for table in TABLES))
+    else:
+        os.makedirs(output, exist_ok=True)
+        for table, df in dataset.items():
+            path = os.path.join(output, f"{table}.{fmt}")
+            if fmt == "csv":
+                df.to_csv(path, index=False)
+            else:
+                df.to_parquet(path, index=False)
+    return {table : len(df) for table, df in dataset.items()}
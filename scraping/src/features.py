@@ -0,0 +1,334 @@
+"""
+Feature store : the results joined with their race and rider, integer-keyed and typed, with the
+derived columns (winner's and rider's speed, age) computed once and persisted, then kept up to
+date row by row as new races, riders and results arrive.
+"""
+
+from typing import Iterable, List, Optional, Tuple
+import os
+import numpy as np
+import pandas as pd
+from src.dataset import DATA_DIR, parquet_available
+from src.constants import RESULTS_PATH
+
+DEFAULT_FEATURES_DIR = os.path.join(DATA_DIR, "features")
+RACE_FEATURES = [
+    "date", "class", "distance", "vertical_meters", "startlist_quality", "profile_score",
+    "temperature", "race_ranking", "winner_time", "winner_speed"
+]
+RIDER_FEATURES = [
+    "birth_year", "height", "weight", "onedayraces", "gc", "tt", "sprint", "climber", "hills"
+]
+RESULT_FEATURES = ["result", "pnt", "seconds_lost"]
+DERIVED_FEATURES = ["rider_time", "rider_speed", "age"]
+# Columns of the matrix, rider_id and race_id being positions in the riders and races tables
+COLUMNS = ["rider_id", "race_id"] + RESULT_FEATURES + RACE_FEATURES + RIDER_FEATURES \
+    + DERIVED_FEATURES
+# Results whose rider or race is not in the store yet, joined once both are
+PENDING_COLUMNS = ["rider_url", "race_url"] + RESULT_FEATURES
+TABLES = ("races", "riders", "matrix", "pending")
+
+def _numeric(df : pd.DataFrame, columns : Iterable[str]) -> pd.DataFrame:
+    """
+    Casts columns to float64, NaN for the missing values, which is what the models take.
+    """
+    return df.assign(**{
+        column : pd.to_numeric(df[column], errors="coerce").astype("float64")
+        for column in columns
+    })
+
+def _derive(rows : pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes the derived columns of matrix rows.
+    """
+    winner_speed = 3600 * rows["distance"] / rows["winner_time"].where(rows["winner_time"] > 0)
+    rider_time = rows["winner_time"] + rows["seconds_lost"]
+    return rows.assign(
+        winner_speed=rows["winner_speed"].fillna(winner_speed.round(3)),
+        rider_time=rider_time,
+        rider_speed=(3600 * rows["distance"] / rider_time.where(rider_time > 0)).round(3),
+        age=rows["date"].dt.year - rows["birth_year"]
+    )
+
+def table_path(directory : str, table : str) -> str:
+    """
+    Returns:
+        str: Path of a saved table, Parquet when pyarrow is installed, pickle otherwise.
+    """
+    return os.path.join(directory, f"{table}.{'parquet' if parquet_available() else 'pkl'}")
+
+def read_table(path : str, columns : Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Reads a table saved by write_table.
+    Args:
+        path (str): Its path, see table_path.
+        columns (List[str], optional): Columns to read. Defaults to every column.
+    Returns:
+        pd.DataFrame: The table.
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    df = pd.read_pickle(path)
+    return df if columns is None else df[columns]
+
+def write_table(df : pd.DataFrame, path : str):
+    """
+    Saves a table, see table_path.
+    """
+    if path.endswith(".parquet"):
+        df.to_parquet(path)
+    else:
+        df.to_pickle(path)
+
+class FeatureStore:
+    """
+    One row per result, with the features of its race and rider.
+
+    Races and riders get an integer id, their position in their table, the first time they are
+    seen, so the matrix is joined with integer takes rather than on URL strings, and updates
+    only recompute the rows of the new results and of the races and riders that changed.
+    A result whose race or rider is not known yet, e.g. because its race page failed, is kept
+    pending until both are.
+    """
+
+    def __init__(
+        self,
+        races : Optional[pd.DataFrame] = None,
+        riders : Optional[pd.DataFrame] = None,
+        matrix : Optional[pd.DataFrame] = None,
+        pending : Optional[pd.DataFrame] = None
+        ):
+        """
+        Args:
+            races (pd.DataFrame, optional): url and RACE_FEATURES of each race, by race id.
+            riders (pd.DataFrame, optional): url and RIDER_FEATURES of each rider, by rider id.
+            matrix (pd.DataFrame, optional): COLUMNS, one row per result.
+            pending (pd.DataFrame, optional): PENDING_COLUMNS of the results waiting for their
+                race or rider.
+            Defaults to an empty store.
+        """
+        self.races = races if races is not None else _numeric(
+            pd.DataFrame({"url" : pd.Series(dtype="str"), "date" : pd.Series(
+                dtype="datetime64[ns]"
+            ), "class" : pd.Series(dtype="str")}).reindex(columns=["url"] + RACE_FEATURES),
+            RACE_FEATURES[2:]
+        )
+        self.riders = riders if riders is not None else _numeric(
+            pd.DataFrame(columns=["url"] + RIDER_FEATURES).astype({"url" : "str"}),
+            RIDER_FEATURES
+        )
+        self.matrix = matrix if matrix is not None else self._rows(
+            np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32),
+            _numeric(pd.DataFrame(columns=RESULT_FEATURES), RESULT_FEATURES)
+        )
+        self.pending = pending if pending is not None else _numeric(
+            pd.DataFrame(columns=PENDING_COLUMNS).astype({"rider_url" : "str", "race_url" : "str"}),
+            RESULT_FEATURES
+        )
+
+    @classmethod
+    def build(
+        cls,
+        riders : pd.DataFrame,
+        results : pd.DataFrame,
+        races : pd.DataFrame
+        ) -> "FeatureStore":
+        """
+        Builds a store from the datasets, see src.dataset.
+        Args:
+            riders (pd.DataFrame): Riders.
+            results (pd.DataFrame): Results.
+            races (pd.DataFrame): Races.
+        Returns:
+            FeatureStore: The store.
+        """
+        store = cls()
+        store.update(riders, results, races)
+        return store
+
+    @classmethod
+    def load(cls, directory : str = DEFAULT_FEATURES_DIR) -> "FeatureStore":
+        """
+        Loads a saved store.
+        Args:
+            directory (str): Directory of the store. Defaults to data/features.
+        Returns:
+            FeatureStore: The store.
+        Raises:
+            FileNotFoundError: If no store is saved there.
+        """
+        return cls(*(read_table(table_path(directory, table)) for table in TABLES))
+
+    def save(self, directory : str = DEFAULT_FEATURES_DIR):
+        """
+        Saves the store, one file per table.
+        Args:
+            directory (str): Directory of the store, created if needed. Defaults to
+                data/features.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for table in TABLES:
+            write_table(getattr(self, table), table_path(directory, table))
+
+    def _upsert(self, table : str, new : pd.DataFrame, columns : List[str]) -> np.ndarray:
+        """
+        Inserts or updates rows of the races or riders table on their URL.
+        Returns:
+            np.ndarray: Ids of the rows written.
+        """
+        stored = getattr(self, table)
+        new = new.drop_duplicates("url", keep="last")
+        ids = pd.Index(stored["url"]).get_indexer(new["url"])
+        unknown = ids < 0
+        ids[unknown] = len(stored) + np.arange(unknown.sum())
+        rows = new[["url"] + columns].set_axis(ids).astype({"url" : "str"})
+        if table == "races":
+            rows = _numeric(rows.assign(
+                date=pd.to_datetime(rows["date"]), **{"class" : rows["class"].astype("str")}
+            ), RACE_FEATURES[2:])
+        else:
+            rows = _numeric(rows, RIDER_FEATURES)
+        updated = rows[~unknown]
+        stored = stored.copy()
+        stored.loc[updated.index, updated.columns] = updated
+        setattr(self, table, pd.concat([stored, rows[unknown]]) if unknown.any() else stored)
+        return ids
+
+    def _rows(self, rider_ids : np.ndarray, race_ids : np.ndarray, results : pd.DataFrame):
+        """
+        Joins result fields with the features of their race and rider, by id.
+        """
+        races = self.races[RACE_FEATURES].take(race_ids).reset_index(drop=True)
+        riders = self.riders[RIDER_FEATURES].take(rider_ids).reset_index(drop=True)
+        rows = pd.concat([
+            pd.DataFrame({"rider_id" : rider_ids, "race_id" : race_ids}, dtype=np.int32),
+            results[RESULT_FEATURES].reset_index(drop=True), races, riders
+        ], axis=1)
+        return _derive(rows)[COLUMNS]
+
+    def update(
+        self,
+        riders : Optional[pd.DataFrame] = None,
+        results : Optional[pd.DataFrame] = None,
+        races : Optional[pd.DataFrame] = None
+        ) -> int:
+        """
+        Inserts or updates races, riders and results : new results get a row, the rows of
+        updated results, races and riders are recomputed, the others are left as they are.
+        Results whose rider or race is unknown to the store are kept pending, and get their row
+        in the update that brings the last of them.
+        Args:
+            riders (pd.DataFrame, optional): New or updated riders.
+            results (pd.DataFrame, optional): New or updated results.
+            races (pd.DataFrame, optional): New or updated races.
+        Returns:
+            int: Number of matrix rows written.
+        """
+        changed_races = self._upsert("races", races, RACE_FEATURES) if races is not None \
+            and not races.empty else np.empty(0, dtype=np.int64)
+        changed_riders = self._upsert("riders", riders, RIDER_FEATURES) if riders is not None \
+            and not riders.empty else np.empty(0, dtype=np.int64)
+
+        if results is not None and not results.empty:
+            results = pd.concat([self.pending, _numeric(
+                results[PENDING_COLUMNS].astype({"rider_url" : "str", "race_url" : "str"}),
+                RESULT_FEATURES
+            )], ignore_index=True).drop_duplicates(["rider_url", "race_url"], keep="last")
+        else:
+            results = self.pending
+        new_keys = np.empty(0, dtype=np.int64)
+        new_rows = None
+        if not results.empty:
+            profile_urls = results["rider_url"].str.removesuffix(RESULTS_PATH)
+            rider_ids = pd.Index(self.riders["url"]).get_indexer(profile_urls)
+            race_ids = pd.Index(self.races["url"]).get_indexer(results["race_url"])
+            known = (rider_ids >= 0) & (race_ids >= 0)
+            self.pending = results[~known].reset_index(drop=True)
+            results = results[known]
+            new_rows = self._rows(
+                rider_ids[known].astype(np.int32), race_ids[known].astype(np.int32), results
+            ).drop_duplicates(["rider_id", "race_id"], keep="last")
+            new_keys = _keys(new_rows)
+
+        matrix = self.matrix
+        stale = np.isin(_keys(matrix), new_keys)
+        affected = ~stale & (
+            np.isin(matrix["race_id"], changed_races) | np.isin(matrix["rider_id"], changed_riders)
+        )
+        recomputed = self._rows(
+            matrix["rider_id"].to_numpy()[affected], matrix["race_id"].to_numpy()[affected],
+            matrix[affected]
+        )
+        parts = [matrix[~stale & ~affected], recomputed]
+        if new_rows is not None:
+            parts.append(new_rows)
+        self.matrix = pd.concat(parts, ignore_index=True).sort_values(
+            ["race_id", "rider_id"], ignore_index=True
+        )
+        return len(recomputed) + (len(new_rows) if new_rows is not None else 0)
+
+    def frame(self, columns : Optional[Iterable[str]] = None, dropna : bool = False):
+        """
+        Args:
+            columns (Iterable[str], optional): Columns to keep. Defaults to every column.
+            dropna (bool): Whether to drop the rows missing one of these columns.
+        Returns:
+            pd.DataFrame: The feature matrix.
+        """
+        matrix = self.matrix if columns is None else self.matrix[list(columns)]
+        return matrix.dropna(ignore_index=True) if dropna else matrix
+
+def _keys(matrix : pd.DataFrame) -> np.ndarray:
+    return matrix["rider_id"].to_numpy(np.int64) << 32 | matrix["race_id"].to_numpy(np.int64)
+
+def load_features(
+    columns : Optional[Iterable[str]] = None,
+    dropna : bool = False,
+    directory : str = DEFAULT_FEATURES_DIR
+    ) -> pd.DataFrame:
+    """
+    Reads the saved feature matrix only, e.g. to start a model experiment.
+    Args:
+        columns (Iterable[str], optional): Columns to read. Defaults to every column.
+        dropna (bool): Whether to drop the rows missing one of these columns.
+        directory (str): Directory of the store. Defaults to data/features.
+    Returns:
+        pd.DataFrame: The feature matrix.
+    """
+    matrix = read_table(
+        table_path(directory, "matrix"), list(columns) if columns is not None else None
+    )
+    return matrix.dropna(ignore_index=True) if dropna else matrix
+
+def refresh_features(
+    riders : pd.DataFrame,
+    results : pd.DataFrame,
+    races : pd.DataFrame,
+    fetched : Optional[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]] = None,
+    directory : str = DEFAULT_FEATURES_DIR
+    ) -> Tuple[FeatureStore, int]:
+    """
+    Brings the saved store up to date after a crawl, and saves it.
+    Args:
+        riders (pd.DataFrame): Every rider, the merged ones after an incremental crawl.
+        results (pd.DataFrame): Every result.
+        races (pd.DataFrame): Every race.
+        fetched (Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame], optional): Riders, results
+            and races fetched by an incremental crawl. If given and a store is saved, it is only
+            updated with them. Otherwise the store is built from every row. Defaults to None.
+        directory (str): Directory of the store. Defaults to data/features.
+    Returns:
+        Tuple[FeatureStore, int]: The store and the number of matrix rows written.
+    """
+    if fetched is not None:
+        try:
+            store = FeatureStore.load(directory)
+        except FileNotFoundError:
+            # First incremental crawl, or a store saved before the pending results were kept
+            fetched = None
+    if fetched is None:
+        store = FeatureStore()
+        fetched = (riders, results, races)
+    written = store.update(*fetched)
+    store.save(directory)
+    return store, written
@@ -3,58 +3,113 @@ Module to scrape time trial race information from pcs
 """
 
 import asyncio
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import re
-import pandas as pd
 import aiohttp
+import requests
 from bs4 import BeautifulSoup
-from src.utils import fetch, fetch_async, to_numeric, minutes_to_seconds
+from src.cache import ResponseCache
+from src.client import create_session
+from src.utils import BASE_URL, fetch, fetch_html_async, to_numeric, minutes_to_seconds
+from src.workers import ParsePool
+from src.metrics import Metrics, timed_parse
+from src.parsing import child_elements, make_soup
+from src.constants import RESULTS_PATH
+from src.get_tt_results import pnt
 
-BASE_URL = "https://www.procyclingstats.com/"
+# Page fragments read by parse_race, the rest of the page is not parsed
+RACE_FRAGMENTS = ("title", "div.borderbox.w30.right.mb_w100", "#resultsCont")
+# The columns of the race result tables change with the race type (team, age, UCI points, bonus
+# seconds...) : the rank comes first, the rider and the time are found by their markup
+RIDER_LINK = 'a[href^="rider/"]'
 
-async def process_race(url : str, session : aiohttp.ClientSession, verbose=True) -> Dict:
+async def process_race(
+    url : str,
+    session : aiohttp.ClientSession,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    pool : Optional[ParsePool] = None,
+    parser : Optional[str] = None,
+    metrics : Optional[Metrics] = None,
+    raw=False,
+    with_results=False
+    ) -> Dict:
     """
     Async function to process a race's page and extract relevant information.
     Args:
         url (str): URL
         session (aiohttp.ClientSession): Reusable session for connection pooling.
         verbose (bool): Whether to print progress messages. Defaults to True.
+        cache (ResponseCache, optional): Response cache shared by the fetches.
+        pool (ParsePool, optional): If given, the page is parsed in a worker process.
+        parser (str, optional): Parser backend, see src.parsing. Defaults to DEFAULT_PARSER.
+        metrics (Metrics, optional): Measures of the crawl, see src.metrics.
+        raw (bool): If True, the numeric fields are left as raw strings, see parse_race.
+            Defaults to False.
+        with_results (bool): If True, the rows of the full result table are also parsed, under
+            the "results" key, see parse_race_results. Defaults to False.
     Returns:    
         Dict: A dictionary containing race information.
     """
-    soup = await fetch_async(url,session, verbose=verbose)
-
-    result = parse_race(soup, verbose=verbose)
+    html = await fetch_html_async(url, session, verbose=verbose, cache=cache, metrics=metrics)
+    if pool is None:
+        with timed_parse(metrics, "race"):
+            soup = make_soup(html, parser, RACE_FRAGMENTS)
+            result = parse_race(soup, verbose=verbose, raw=raw)
+            if with_results:
+                result["results"] = parse_race_results(url, soup, raw=raw)
+    else:
+        result = await pool.run(
+            parse_race_html, html, parser, raw, url if with_results else None,
+            metrics=metrics, kind="race"
+        )
     result["url"] = url
     return result
 
-def process_race_sync(url : str, verbose=True) -> Dict:
+def process_race_sync(
+    url : str,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    parser : Optional[str] = None,
+    session : Optional[requests.Session] = None
+    ) -> Dict:
     """
     Synchronous function to process a race's page and extract relevant information.
     Args:
         url (str): URL
         verbose (bool): Whether to print progress messages. Defaults to True.
+        cache (ResponseCache, optional): Response cache shared by the fetches.
+        parser (str, optional): Parser backend, see src.parsing. Defaults to DEFAULT_PARSER.
+        session (requests.Session, optional): Session whose connections are reused, see
+            src.client. Defaults to the shared session.
     Returns:    
         Dict: A dictionary containing race information.
     """
-    soup = fetch(url, verbose=verbose)
+    soup = fetch(
+        url, parser=parser, verbose=verbose, cache=cache, fragments=RACE_FRAGMENTS,
+        session=session
+    )
 
     result = parse_race(soup,verbose=verbose)
     result["url"] = url
     return result
 
-def parse_race(soup : BeautifulSoup, verbose=True) -> Dict:
+def parse_race(soup : BeautifulSoup, verbose=True, raw=False) -> Dict:
     """
     Parses a race page soup to extract relevant information.
+    The soup can be the whole page or only its RACE_FRAGMENTS.
     Args:
         soup (BeautifulSoup): Parsed HTML content of the page.
         verbose (bool): Whether to print progress messages. Defaults to True.
+        raw (bool): If True, the numeric fields are left as raw strings and the winner's speed
+            as None, for src.conversion.convert_races to convert whole columns at once.
+            Defaults to False.
     Returns:
         Dict: A dictionary containing race information.
     """
     result = {}
 
-    result["race_title"] = soup.select_one("head > title").get_text().replace(" results", "")
+    result["race_title"] = soup.select_one("title").get_text().replace(" results", "")
     if verbose :
         print(f"Parsing race {result["race_title"]}")
 
@@ -67,32 +122,121 @@ def parse_race(soup : BeautifulSoup, verbose=True) -> Dict:
         "departure" : values[12],
         "arrival" : values[13],
         "class" : values[3],
-        "distance" : to_numeric(values[5].split()[0]),
-        "vertical_meters" : to_numeric(values[11]),
-        "startlist_quality" : handle_startlist_quality(values[15]),
-        "profile_score" : to_numeric(values[10])
+        "distance" : values[5],
+        "vertical_meters" : values[11],
+        "startlist_quality" : values[15],
+        "profile_score" : values[10],
+        "temperature" : values[17],
+        "race_ranking" : values[14],
+        "winner_time" : soup.select_one("#resultsCont").select_one("td.time.ar > span").get_text(),
+        "winner_speed" : None,
     })
 
-    temperature_str = values[17]
+    profile_image_url_extension = overall_info.select_one("div.mt10 img")
+    if profile_image_url_extension:
+        result["profile_image_url"] = BASE_URL + profile_image_url_extension.get("src")
+    else:
+        result["profile_image_url"] = None
+
+    if not raw:
+        convert_race(result)
+    return result
+
+def convert_race(result : Dict):
+    """
+    Converts in place the raw numeric fields of a race, one value at a time. See
+    src.conversion.convert_races for the vectorized version.
+    Args:
+        result (Dict): Output of parse_race(raw=True).
+    """
+    result["distance"] = to_numeric(result["distance"].split()[0])
+    result["vertical_meters"] = to_numeric(result["vertical_meters"])
+    result["startlist_quality"] = handle_startlist_quality(result["startlist_quality"])
+    result["profile_score"] = to_numeric(result["profile_score"])
+
+    temperature_str = result["temperature"]
     if len(temperature_str.strip()) == 0:
         result["temperature"] = None
     else:
-        result["temperature"] = to_numeric(values[17].split()[0])
+        result["temperature"] = to_numeric(temperature_str.split()[0])
 
-    result["race_ranking"] = to_numeric(values[14])
+    result["race_ranking"] = to_numeric(result["race_ranking"])
 
-    winner_time_str = soup.select_one("#resultsCont").select_one("td.time.ar > span").get_text()
+    winner_time_str = result["winner_time"]
     result["winner_time"] = minutes_to_seconds(
         winner_time_str, sep = ":" if ":" in winner_time_str else "."
     ) # in seconds
     result["winner_speed"] = round(3600*result["distance"]/result["winner_time"],3) # in km/h
 
-    profile_image_url_extension = overall_info.select_one("div.mt10 img")
-    if profile_image_url_extension:
-        result["profile_image_url"] = BASE_URL + profile_image_url_extension.get("src")
-    else:
-        result["profile_image_url"] = None
+def parse_race_results(url : str, soup : BeautifulSoup, raw=False) -> List[Dict]:
+    """
+    Parses the full result table of a race page : one result per ranked rider, with the fields
+    of get_tt_results.parse_results, every rank kept, plus the rider's name. Like there, riders
+    are identified by the URL of their results page.
+    Args:
+        url (str): URL of the race.
+        soup (BeautifulSoup): Parsed HTML content of the page, or only its RACE_FRAGMENTS.
+        raw (bool): If True, the time lost is left as a raw string, see parse_results.
+            Defaults to False.
+    Returns:
+        List[Dict]: The results of the race, unranked riders (DNF, DNS, ...) left out.
+    """
+    data = []
+    table = soup.select_one("#resultsCont table.results")
+    if table is None:
+        return data
 
+    body = table.find("tbody", recursive=False) or table
+    for row in child_elements(body, "tr"):
+        tds = child_elements(row, "td")
+        rider_link = row.select_one(RIDER_LINK)
+        time_cell = next((td for td in tds if "time" in td.get("class", ())), None)
+        if not tds or rider_link is None or time_cell is None:
+            continue
+        rank_str = tds[0].get_text().strip()
+        if not rank_str.isdigit():
+            continue
+        rank = int(rank_str)
+        if data:
+            # The hidden span holds the gap to the winner, e.g. "+0:06"
+            hidden = time_cell.select_one(".hide")
+            gap = hidden.get_text() if hidden is not None else time_cell.get_text()
+            time_lost = gap.strip().lstrip("+")
+        else:
+            # The winner's cell holds the winning time
+            time_lost = "0:00"
+        data.append({
+            "rider_url" : BASE_URL + rider_link.get("href") + RESULTS_PATH,
+            "result" : rank,
+            "pnt" : pnt[rank] if rank <= 15 else 0,
+            "seconds_lost" : time_lost if raw else minutes_to_seconds(time_lost),
+            "race_url" : url,
+            "rider_name" : rider_link.get_text(),
+        })
+    return data
+
+def parse_race_html(
+    html : str,
+    parser : Optional[str] = None,
+    raw=False,
+    url : Optional[str] = None
+    ) -> Dict:
+    """
+    Parses a race page from its raw HTML, meant to run in a worker process.
+    Args:
+        html (str): Raw HTML content of the page.
+        parser (str, optional): Parser backend, see src.parsing. Defaults to DEFAULT_PARSER.
+        raw (bool): If True, the numeric fields are left as raw strings, see parse_race.
+            Defaults to False.
+        url (str, optional): URL of the race. If given, the rows of its full result table are
+            also parsed, under the "results" key, see parse_race_results.
+    Returns:
+        Dict: A dictionary containing race information.
+    """
+    soup = make_soup(html, parser, RACE_FRAGMENTS)
+    result = parse_race(soup, verbose=False, raw=raw)
+    if url is not None:
+        result["results"] = parse_race_results(url, soup, raw=raw)
     return result
 
 def handle_startlist_quality(s : str) -> Optional[int]:
@@ -113,14 +257,17 @@ def handle_startlist_quality(s : str) -> Optional[int]:
 
 
 if __name__ == "__main__":
+    import pandas as pd
+    from src.dataset import load_dataset
+
     async def main():
         """
         Main function
         """
-        results_df = pd.read_csv('data/results.csv')
+        results_df = load_dataset("results")
         url_set = set(results_df["race_url"].unique())
         url_list = list(url_set)
-        async with aiohttp.ClientSession() as session:
+        async with create_session() as session:
             tasks = [process_race(url,session) for url in url_list]
             data = await asyncio.gather(*tasks)
 
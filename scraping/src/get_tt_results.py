@@ -2,82 +2,148 @@
 Module to scrape time trial results from pcs
 """
 
-from typing import List, Dict
-from datetime import datetime
+from typing import List, Dict, Optional, Set
 import asyncio
-import pandas as pd
 import aiohttp
+import requests
 from bs4 import BeautifulSoup
-from src.utils import fetch, fetch_async, minutes_to_seconds
-
-BASE_URL = "https://www.procyclingstats.com/"
+from src.cache import ResponseCache
+from src.client import create_session
+from src.utils import BASE_URL, fetch, fetch_html_async, minutes_to_seconds
+from src.workers import ParsePool
+from src.metrics import Metrics, timed_parse
+from src.parsing import TableSchema, make_soup
+from src.constants import MIN_YEAR, RESULTS_PATH
+
+# Page fragments read by parse_results, the rest of the page is not parsed
+RESULTS_FRAGMENTS = ("div.page-content",)
+# Columns of the results table : Date | Race | Result | Class | KMs | Time
+RESULTS_TABLE = TableSchema({"date" : 0, "race" : 1, "result" : 2, "class" : 3, "time" : 5})
 allowed_classes = {"2.UWT","2.Pro", "2.1", "WC", "NC", "CC", "Olympics"}
 pnt = [None, 100, 70, 50, 40, 32, 26, 22, 18, 14, 10, 8, 6, 4, 2, 1]
 # Races that are forbidden to enter the database, for simplicity's sake
-forbidden_races = {
-    "https://www.procyclingstats.com/race/nc-denmark-itt/2024", 
+forbidden_races = {BASE_URL + path for path in (
+    "race/nc-denmark-itt/2024", 
     # Title stripped, then allowed, complicated shit, + half the info is missing
-    "https://www.procyclingstats.com/race/volta-ao-algarve/2020/stage-5", 
+    "race/volta-ao-algarve/2020/stage-5", 
     # The length of the TT is 0km for some reason, even though it was like 20kms in reality.
-    "https://www.procyclingstats.com/race/giro-d-italia/2022/stage-21", 
+    "race/giro-d-italia/2022/stage-21", 
     # Same goes for the next TTs
-    "https://www.procyclingstats.com/race/giro-d-italia/2021/stage-21",
-    "https://www.procyclingstats.com/race/giro-d-italia/2020/stage-21",
-    "https://www.procyclingstats.com/race/tirreno-adriatico/2021/stage-7",
-    "https://www.procyclingstats.com/race/tirreno-adriatico/2020/stage-8",
-    "https://www.procyclingstats.com/race/tour-de-romandie/2021/stage-5",
-    "https://www.procyclingstats.com/race/nc-czech-republic-itt/2022",
-    "https://www.procyclingstats.com/race/volta-a-portugal/2020/stage-8",
-    "https://www.procyclingstats.com/race/nc-romania-itt/2021",
-    "https://www.procyclingstats.com/race/nc-romania-itt/2023",
-    "https://www.procyclingstats.com/race/nc-panama-itt/2024",
-    "https://www.procyclingstats.com/race/etoile-de-besseges/2021/stage-5",
-    "https://www.procyclingstats.com/race/etoile-de-besseges/2020/stage-5",
-    "https://www.procyclingstats.com/race/ruta-del-sol/2020/stage-5",
-    "https://www.procyclingstats.com/race/nc-panama-itt/2024/result",
-    "https://www.procyclingstats.com/race/nc-romania-itt/2023/result",
-    "https://www.procyclingstats.com/race/nc-romania-itt/2021/result",
-    "https://www.procyclingstats.com/race/nc-czech-republic-itt/2022/result",
+    "race/giro-d-italia/2021/stage-21",
+    "race/giro-d-italia/2020/stage-21",
+    "race/tirreno-adriatico/2021/stage-7",
+    "race/tirreno-adriatico/2020/stage-8",
+    "race/tour-de-romandie/2021/stage-5",
+    "race/nc-czech-republic-itt/2022",
+    "race/volta-a-portugal/2020/stage-8",
+    "race/nc-romania-itt/2021",
+    "race/nc-romania-itt/2023",
+    "race/nc-panama-itt/2024",
+    "race/etoile-de-besseges/2021/stage-5",
+    "race/etoile-de-besseges/2020/stage-5",
+    "race/ruta-del-sol/2020/stage-5",
+    "race/nc-panama-itt/2024/result",
+    "race/nc-romania-itt/2023/result",
+    "race/nc-romania-itt/2021/result",
+    "race/nc-czech-republic-itt/2022/result",
     ""
-}
-
-async def process_results(url : str, session : aiohttp.ClientSession, verbose=True) -> List[Dict]:
+)}
+
+async def process_results(
+    url : str,
+    session : aiohttp.ClientSession,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    pool : Optional[ParsePool] = None,
+    parser : Optional[str] = None,
+    known_races : Optional[Set[str]] = None,
+    metrics : Optional[Metrics] = None,
+    raw=False,
+    min_year : int = MIN_YEAR
+    ) -> List[Dict]:
     """
     Async function to process a rider's time trial results page and extract relevant information.
     Args:
         url (str): URL of the rider's time trial results page.
         session (aiohttp.ClientSession): Reusable session for connection pooling.
         verbose (bool): Whether to print progress messages. Defaults to True.
+        cache (ResponseCache, optional): Response cache shared by the fetches.
+        pool (ParsePool, optional): If given, the page is parsed in a worker process.
+        parser (str, optional): Parser backend, see src.parsing. Defaults to DEFAULT_PARSER.
+        known_races (Set[str], optional): Race URLs of the rider's results already stored, the
+            walk through the table stops at the first of them.
+        metrics (Metrics, optional): Measures of the crawl, see src.metrics.
+        raw (bool): If True, the time lost is left as a raw string, see parse_results.
+            Defaults to False.
+        min_year (int): First season collected, see parse_results. Defaults to MIN_YEAR.
     Returns:
         List[Dict]: A list of dictionaries containing the rider's time trial results.
     """
-    soup = await fetch_async(url, session, verbose=verbose)
-
-    data = parse_results(url, soup, verbose=verbose)
+    html = await fetch_html_async(url, session, verbose=verbose, cache=cache, metrics=metrics)
+    if pool is not None:
+        return await pool.run(
+            parse_results_html, url, html, parser, known_races, raw, min_year,
+            metrics=metrics, kind="results"
+        )
+
+    with timed_parse(metrics, "results"):
+        soup = make_soup(html, parser, RESULTS_FRAGMENTS)
+        data = parse_results(
+            url, soup, verbose=verbose, known_races=known_races, raw=raw, min_year=min_year
+        )
     return data
 
-def process_results_sync(url : str, verbose=True) -> List[Dict]:
+def process_results_sync(
+    url : str,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    parser : Optional[str] = None,
+    session : Optional[requests.Session] = None,
+    min_year : int = MIN_YEAR
+    ) -> List[Dict]:
     """
     Synchronous function to process a rider's time trial results page and extract relevant
     information.
     Args:
         url (str): URL of the rider's time trial results page.
         verbose (bool): Whether to print progress messages. Defaults to True.
+        cache (ResponseCache, optional): Response cache shared by the fetches.
+        parser (str, optional): Parser backend, see src.parsing. Defaults to DEFAULT_PARSER.
+        session (requests.Session, optional): Session whose connections are reused, see
+            src.client. Defaults to the shared session.
+        min_year (int): First season collected, see parse_results. Defaults to MIN_YEAR.
     Returns:
         List[Dict]: A list of dictionaries containing the rider's time trial results.
     """
-    soup = fetch(url, verbose=verbose)
+    soup = fetch(
+        url, parser=parser, verbose=verbose, cache=cache, fragments=RESULTS_FRAGMENTS,
+        session=session
+    )
 
-    data = parse_results(url, soup, verbose=verbose)
+    data = parse_results(url, soup, verbose=verbose, min_year=min_year)
     return data
 
-def parse_results(url : str, soup : BeautifulSoup, verbose=True) -> List[Dict]:
+def parse_results(
+    url : str,
+    soup : BeautifulSoup,
+    verbose=True,
+    known_races : Optional[Set[str]] = None,
+    raw=False,
+    min_year : int = MIN_YEAR
+    ) -> List[Dict]:
     """
     Parses the rider's time trial results page soup to extract relevant information.
+    The soup can be the whole page or only its RESULTS_FRAGMENTS.
     Args:
         url (str): URL of the rider's time trial results page.
         soup (BeautifulSoup): Parsed HTML content of the rider's time trial results page.
         verbose (bool): Whether to print progress messages. Defaults to True.
+        known_races (Set[str], optional): Race URLs of the rider's results already stored. The
+            table is sorted newest first, so the walk stops at the first of them.
+        raw (bool): If True, the time lost is left as a raw string, for
+            src.conversion.convert_results to convert the whole column at once. Defaults to False.
+        min_year (int): First season collected, the walk stops at the first older result.
+            Defaults to MIN_YEAR.
     Returns:
         List[Dict]: A list of dictionaries containing the rider's time trial results.
     """
@@ -86,59 +152,79 @@ def parse_results(url : str, soup : BeautifulSoup, verbose=True) -> List[Dict]:
 
     data = []
 
-    all_lines = soup.select("body > div.wrapper > div.content > div.page-content > div > "
-                            "div.mt10 > table > tbody > tr")
-    for line in all_lines:
-        rider_result = {}
-
-        date_str = line.select_one("td:nth-child(1)").get_text()
-        date = datetime.strptime(date_str, "%Y-%m-%d")
-        if date.year < 2020:
-            break
-
-        race_class = line.select_one("td:nth-child(4)").get_text()
-        if race_class not in allowed_classes:
-            continue
-
-        rider_result["rider_url"] = url
-
-        result_str = line.select_one("td:nth-child(3)").text
-        if not result_str.isdigit():
-            continue
-        result = int(result_str)
-        if result > 20:
-            continue
-        rider_result["result"] = result
-
-        if result <= 15:
-            pnt_score = pnt[result]
-        else:
-            pnt_score = 0
-        rider_result["pnt"] = pnt_score
-
-        rider_result["seconds_lost"] = minutes_to_seconds(line.select_one("td:nth-child(6)").text)
-
-        race = line.select_one("td:nth-child(2) > a")
-        race_url =  BASE_URL + race.get("href")
-        if race_url in forbidden_races:
-            continue
-        rider_result["race_url"] = race_url
-
-        data.append(rider_result)
+    # Each row is walked once, and the filters run from the cheapest to the most expensive
+    for table in soup.select("div.page-content > div > div.mt10 > table"):
+        for cells in RESULTS_TABLE.rows(table):
+            if int(cells["date"].get_text()[:4]) < min_year:
+                return data
+
+            # A row without a race link has no URL, it can be neither known nor collected
+            anchor = cells["race"].a
+            race_url = BASE_URL + anchor.get("href") if anchor is not None else None
+            if known_races and race_url in known_races:
+                return data
+
+            if cells["class"].get_text() not in allowed_classes:
+                continue
+
+            result_str = cells["result"].get_text()
+            if not result_str.isdigit():
+                continue
+            result = int(result_str)
+            if result > 20 or race_url is None or race_url in forbidden_races:
+                continue
+
+            time_lost = cells["time"].get_text()
+            data.append({
+                "rider_url" : url,
+                "result" : result,
+                "pnt" : pnt[result] if result <= 15 else 0,
+                "seconds_lost" : time_lost if raw else minutes_to_seconds(time_lost),
+                "race_url" : race_url,
+            })
 
     return data
 
+def parse_results_html(
+    url : str,
+    html : str,
+    parser : Optional[str] = None,
+    known_races : Optional[Set[str]] = None,
+    raw=False,
+    min_year : int = MIN_YEAR
+    ) -> List[Dict]:
+    """
+    Parses a rider's time trial results page from its raw HTML, meant to run in a worker process.
+    Args:
+        url (str): URL of the rider's time trial results page.
+        html (str): Raw HTML content of the page.
+        parser (str, optional): Parser backend, see src.parsing. Defaults to DEFAULT_PARSER.
+        known_races (Set[str], optional): Race URLs of the rider's results already stored.
+        raw (bool): If True, the time lost is left as a raw string, see parse_results.
+            Defaults to False.
+        min_year (int): First season collected, see parse_results. Defaults to MIN_YEAR.
+    Returns:
+        List[Dict]: A list of dictionaries containing the rider's time trial results.
+    """
+    soup = make_soup(html, parser, RESULTS_FRAGMENTS)
+    return parse_results(
+        url, soup, verbose=False, known_races=known_races, raw=raw, min_year=min_year
+    )
+
 if __name__ == "__main__":
+    import pandas as pd
+    from src.dataset import load_dataset
+
     async def main():
         """
         Main function.
         """
-        riders_df = pd.read_csv("data/riders.csv")
+        riders_df = load_dataset("riders")
         data = []
 
-        async with aiohttp.ClientSession() as session:
+        async with create_session() as session:
             for i, rider in riders_df.iterrows():
-                results_url = rider["url"] + "/results/last-tt-results"
+                results_url = rider["url"] + RESULTS_PATH
                 rider_results = await process_results(results_url,session)
                 data.extend(rider_results)
 
@@ -2,20 +2,39 @@
 Module to scrape time trial specialists from pcs
 """
 
-from typing import Dict, Set, Tuple
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+from itertools import islice
 import asyncio
-import pandas as pd
 import aiohttp
+import requests
 from bs4 import BeautifulSoup
-from src.utils import fetch, fetch_async
+from src.cache import ResponseCache
+from src.client import create_session
+from src.utils import BASE_URL, fetch, fetch_async, fetch_html_async
+from src.constants import DEFAULT_YEARS
+from src.workers import ParsePool
+from src.metrics import Metrics, timed_parse
+from src.parsing import TableSchema, child_elements, make_soup
+from src.tasks import FailureReport, RetryError, RetryPolicy, run_with_retry
 
-BASE_URL = "https://www.procyclingstats.com/"
+# Page fragments read by parse_rider and get_all_tt_specialists_per_year, the rest of the page
+# is not parsed
+RIDER_FRAGMENTS = ("div.borderbox.left.w40.mb_w100",)
+RANKINGS_FRAGMENTS = ("div.page-content",)
+RANKINGS_PAGE_SIZE = 100
+# Columns of the rankings table read by parse_rankings
+RANKINGS_TABLE = TableSchema({"rider" : 3})
+SPECIALTIES = ("onedayraces", "gc", "tt", "sprint", "climber", "hills")
 
 async def process_rider(
     full_name : str,
     url : str,
     session : aiohttp.ClientSession,
-    verbose=True
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    pool : Optional[ParsePool] = None,
+    parser : Optional[str] = None,
+    metrics : Optional[Metrics] = None
     ) -> Dict:
     """
     Async function to process a rider's profile page and extract relevant information.
@@ -25,27 +44,51 @@ async def process_rider(
         url (str): URL of the rider's profile page.
         session (aiohttp.ClientSession): Reusable session for connection pooling.
         verbose (bool): Whether to print progress messages. Defaults to True.
+        cache (ResponseCache, optional): Response cache shared by the fetches.
+        pool (ParsePool, optional): If given, the page is parsed in a worker process.
+        parser (str, optional): Parser backend, see src.parsing. Defaults to DEFAULT_PARSER.
+        metrics (Metrics, optional): Measures of the crawl, see src.metrics.
     Returns:
         Dict: A dictionary containing the rider's information.
     """
 
-    soup = await fetch_async(url,session, verbose=verbose)
-
-    result = parse_rider(full_name, soup, verbose=verbose)
+    html = await fetch_html_async(url, session, verbose=verbose, cache=cache, metrics=metrics)
+    if pool is None:
+        with timed_parse(metrics, "rider"):
+            soup = make_soup(html, parser, RIDER_FRAGMENTS)
+            result = parse_rider(full_name, soup, verbose=verbose)
+    else:
+        result = await pool.run(
+            parse_rider_html, full_name, html, parser, metrics=metrics, kind="rider"
+        )
     result["url"] = url
     return result
 
-def process_rider_sync(full_name : str, url : str, verbose=True) -> Dict:
+def process_rider_sync(
+    full_name : str,
+    url : str,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    parser : Optional[str] = None,
+    session : Optional[requests.Session] = None
+    ) -> Dict:
     """
     Synchronous function to process a rider's profile page and extract relevant information.
     Args:
         full_name (str): Full name of the rider.
         url (str): URL of the rider's profile page.
         verbose (bool): Whether to print progress messages. Defaults to True.
+        cache (ResponseCache, optional): Response cache shared by the fetches.
+        parser (str, optional): Parser backend, see src.parsing. Defaults to DEFAULT_PARSER.
+        session (requests.Session, optional): Session whose connections are reused, see
+            src.client. Defaults to the shared session.
     Returns:
         Dict: A dictionary containing the rider's information.
     """
-    soup = fetch(url, verbose=verbose)
+    soup = fetch(
+        url, parser=parser, verbose=verbose, cache=cache, fragments=RIDER_FRAGMENTS,
+        session=session
+    )
 
     result = parse_rider(full_name, soup, verbose=verbose)
     result["url"] = url
@@ -54,6 +97,7 @@ def process_rider_sync(full_name : str, url : str, verbose=True) -> Dict:
 def parse_rider(full_name : str, soup : BeautifulSoup, verbose=True) -> Dict:
     """
     Parses the rider's profile page soup to extract relevant information.
+    The soup can be the whole page or only its RIDER_FRAGMENTS.
     Args:
         full_name (str): Full name of the rider.
         soup (BeautifulSoup): Parsed HTML content of the rider's profile page.
@@ -70,34 +114,42 @@ def parse_rider(full_name : str, soup : BeautifulSoup, verbose=True) -> Dict:
     if verbose:
         print(f"Processing rider {full_name}")
 
-    rider_info = soup.select_one("body > div.wrapper > div.content > div.page-content.noSideNav > "
-                                 "div > div.borderbox.left.w40.mb_w100 > div.borderbox.left.w65")
-    result["nationality"] = rider_info.select_one("div:nth-child(3) > ul > li > "
-                                                  "div:nth-child(3) > a").get_text()
-    result["birth_year"] = int(rider_info.select_one("div:nth-child(2) > ul > li > "
-                                                     "div:nth-child(4)").get_text())
-
-    rider_dimensions = rider_info.select_one("div:nth-child(4) > ul > li")
-    result["height"] = float(rider_dimensions.select_one("div:nth-child(5)").get_text())
-    result["weight"] = float(rider_dimensions.select_one("div:nth-child(2)").get_text())
-
-    result["onedayraces"] = int(rider_info.select_one("ul > li:nth-child(1) > "
-                                                      "div.xvalue.ac").get_text())
-    result["gc"] = int(rider_info.select_one("ul > li:nth-child(2) > div.xvalue.ac").get_text())
-    result["tt"] = int(rider_info.select_one("ul > li:nth-child(3) > div.xvalue.ac").get_text())
-    result["sprint"] = int(rider_info.select_one("ul > li:nth-child(4) > div.xvalue.ac").get_text())
-    result["climber"] = int(rider_info.select_one("ul > li:nth-child(5) > "
-                                                  "div.xvalue.ac").get_text())
-    result["hills"] = int(rider_info.select_one("ul > li:nth-child(6) > div.xvalue.ac").get_text())
-
-    result["photo_url"] = BASE_URL + soup.select_one("body > div.wrapper > div.content > "
-                                                     "div.page-content.noSideNav > div > "
-                                                     "div.borderbox.left.w40.mb_w100 > "
-                                                     "div.borderbox.left.w30.mr5 > div > "
-                                                     "a > img").get("src")
+    # The profile box is resolved once, every field is then read relative to it by position
+    profile = soup.select_one("div.borderbox.left.w40.mb_w100")
+    photo_box, rider_info = (
+        profile.find("div", class_=css_class, recursive=False) for css_class in ("w30", "w65")
+    )
+    sections = child_elements(rider_info)
+
+    result["nationality"] = child_elements(sections[2].ul.li)[2].a.get_text()
+    result["birth_year"] = int(child_elements(sections[1].ul.li)[3].get_text())
+
+    rider_dimensions = child_elements(sections[3].ul.li)
+    result["height"] = float(rider_dimensions[4].get_text())
+    result["weight"] = float(rider_dimensions[1].get_text())
+
+    # Points per specialty, one li per specialty in this order
+    specialties = rider_info.find("div", class_="xvalue").find_parent("ul")
+    points = [li.find("div", class_="xvalue").get_text() for li in child_elements(specialties)]
+    for specialty, value in zip(SPECIALTIES, points):
+        result[specialty] = int(value)
+
+    result["photo_url"] = BASE_URL + photo_box.img.get("src")
 
     return result
 
+def parse_rider_html(full_name : str, html : str, parser : Optional[str] = None) -> Dict:
+    """
+    Parses the rider's profile page from its raw HTML, meant to run in a worker process.
+    Args:
+        full_name (str): Full name of the rider.
+        html (str): Raw HTML content of the page.
+        parser (str, optional): Parser backend, see src.parsing. Defaults to DEFAULT_PARSER.
+    Returns:
+        Dict: A dictionary containing the rider's information.
+    """
+    return parse_rider(full_name, make_soup(html, parser, RIDER_FRAGMENTS), verbose=False)
+
 def process_name(full_name : str) -> Tuple[str,str]:
     """
     Processes a full name string to extract first and last names.
@@ -119,54 +171,186 @@ def process_name(full_name : str) -> Tuple[str,str]:
     first_name = " ".join(split[end_word_idx:])
     return first_name, last_name
 
-def get_all_tt_specialists_per_year(year : int=2025, verbose=True) -> Set[Tuple[str,str]]:
+def rankings_url(year : int, offset : int = 0) -> str:
+    """
+    Gives the URL of a page of the time trial rankings at the end of the season before a year.
+    Args:
+        year (int): The year for which to collect time trial specialists.
+        offset (int): Index of the first rider of the page. Defaults to 0.
+    Returns:
+        str: URL
+    """
+    return (
+        f"{BASE_URL}rankings.php?date={year - 1}-12-31"
+        f"&nation=&age=&zage=&page=smallerorequal&team=&offset={offset}&filter=Filter&p=me"
+        "&s=time-trial"
+    )
+
+def parse_rankings(soup : BeautifulSoup, limit : Optional[int] = None) -> List[Tuple[str,str]]:
+    """
+    Parses a rankings page soup to extract the riders, in ranking order.
+    The soup can be the whole page or only its RANKINGS_FRAGMENTS.
+    Args:
+        soup (BeautifulSoup): Parsed HTML content of the rankings page.
+        limit (int, optional): Maximum number of rows to read. Defaults to None (every row).
+    Returns:
+        List[Tuple[str, str]]: (name, profile URL) tuples.
+    """
+    result = []
+    rows = (
+        cells
+        for table in soup.select("div.page-content > div > div:nth-child(4) > table")
+        for cells in RANKINGS_TABLE.rows(table)
+    )
+    for cells in islice(rows, limit):
+        rider_link = cells["rider"].a
+        if rider_link:
+            result.append((rider_link.text, BASE_URL + rider_link.get("href"))) # (name, url) tuple
+    return result
+
+def get_all_tt_specialists_per_year(
+    year : int=2025,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    top_n : int = 50,
+    session : Optional[requests.Session] = None
+    ) -> Set[Tuple[str,str]]:
     """
     Collects time trial specialists for a given year.
     Args:
         year (int): The year for which to collect time trial specialists. Defaults to 202
         verbose (bool): Whether to print progress messages. Defaults to True.
+        cache (ResponseCache, optional): Response cache shared by the fetches.
+        top_n (int): Number of riders to collect from the top of the rankings. Defaults to 50.
+        session (requests.Session, optional): Session whose connections are reused, see
+            src.client. Defaults to the shared session.
     Returns:
         Set[Tuple[str, str]]: A set of tuples containing rider names and their profile URLs.
     """
     result = set()
-
-    rider_specialties_url = (
-        f"https://www.procyclingstats.com/rankings.php?date={year - 1}-12-31"
-        "&nation=&age=&zage=&page=smallerorequal&team=&offset=0&filter=Filter&p=me&s=time-trial"
-    )
     if verbose:
         print(f"Accessing the list of riders for {year}")
-    soup = fetch(rider_specialties_url)
-
-    all_rows = soup.select("body > div.wrapper > div.content > div.page-content > div > "
-                           "div:nth-child(4) > table > tbody > tr")
-    for i in range(0, 50):
-        if i < len(all_rows):
-            rider_link = all_rows[i].select_one("td:nth-child(4) > a")
-            if rider_link:
-                result.add((rider_link.text, BASE_URL + rider_link.get("href"))) # (name, url) tuple
+    for offset in range(0, top_n, RANKINGS_PAGE_SIZE):
+        soup = fetch(
+            rankings_url(year, offset), cache=cache, fragments=RANKINGS_FRAGMENTS, session=session
+        )
+        result.update(parse_rankings(soup, limit=min(RANKINGS_PAGE_SIZE, top_n - offset)))
     return result
 
-def get_all_tt_specialists() -> Set[Tuple[str,str]]:
+def get_all_tt_specialists(
+    cache : Optional[ResponseCache] = None,
+    years : Iterable[int] = DEFAULT_YEARS,
+    top_n : int = 50,
+    session : Optional[requests.Session] = None
+    ) -> Set[Tuple[str,str]]:
     """
-    Collects all time trial specialists from 2020 to 2024.
+    Collects all time trial specialists, from 2020 to 2024 by default.
+    Args:
+        cache (ResponseCache, optional): Response cache shared by the fetches.
+        years (Iterable[int]): Years for which to collect time trial specialists.
+        top_n (int): Number of riders to collect per year. Defaults to 50.
+        session (requests.Session, optional): Session whose connections are reused, see
+            src.client. Defaults to the shared session.
     Returns:
         Set[Tuple[str, str]]: A set of tuples containing rider names and their profile URLs.
     """
     tt_specialists_set = set()
-    for year in range(2020,2025):
-        tt_specialists_set = tt_specialists_set | get_all_tt_specialists_per_year(year)
+    for year in years:
+        tt_specialists_set = tt_specialists_set | get_all_tt_specialists_per_year(
+            year, cache=cache, top_n=top_n, session=session
+        )
 
     return tt_specialists_set
 
+async def discover_tt_specialists(
+    session : aiohttp.ClientSession,
+    years : Iterable[int] = DEFAULT_YEARS,
+    top_n : int = 50,
+    cache : Optional[ResponseCache] = None,
+    policy : Optional[RetryPolicy] = None,
+    report : Optional[FailureReport] = None,
+    verbose=False,
+    metrics : Optional[Metrics] = None
+    ) -> AsyncIterator[Tuple[str,str]]:
+    """
+    Asynchronously collects time trial specialists : every rankings page of every year is
+    fetched at once, and riders are yielded as soon as their page arrives, without duplicates.
+    Args:
+        session (aiohttp.ClientSession): Reusable session for connection pooling.
+        years (Iterable[int]): Years for which to collect time trial specialists.
+        top_n (int): Number of riders to collect per year. Defaults to 50.
+        cache (ResponseCache, optional): Response cache shared by the fetches.
+        policy (RetryPolicy, optional): Timeout and retry policy. Defaults to RetryPolicy().
+        report (FailureReport, optional): Report collecting the pages that failed. If None,
+            a failed page raises.
+        verbose (bool): Whether to print progress messages. Defaults to False.
+        metrics (Metrics, optional): Measures of the crawl, see src.metrics.
+    Yields:
+        Tuple[str, str]: (name, profile URL) of each new rider.
+    """
+    policy = policy or RetryPolicy()
+
+    async def fetch_page(year : int, offset : int) -> List[Tuple[str,str]]:
+        url = rankings_url(year, offset)
+        async def attempt():
+            soup = await fetch_async(
+                url, session, verbose=verbose, cache=cache, fragments=RANKINGS_FRAGMENTS,
+                metrics=metrics
+            )
+            # The soup is built by fetch_async, only the extraction is timed here
+            with timed_parse(metrics, "rankings"):
+                return parse_rankings(soup, limit=min(RANKINGS_PAGE_SIZE, top_n - offset))
+        try:
+            return await run_with_retry(attempt, policy)
+        except RetryError as exc:
+            if report is None:
+                raise
+            report.add("rankings", url, exc)
+            return []
+
+    pages = [
+        asyncio.ensure_future(fetch_page(year, offset))
+        for year in years
+        for offset in range(0, top_n, RANKINGS_PAGE_SIZE)
+    ]
+    seen = set()
+    try:
+        for page in asyncio.as_completed(pages):
+            for rider in await page:
+                if rider not in seen:
+                    seen.add(rider)
+                    yield rider
+    finally:
+        for page in pages:
+            page.cancel()
+
+async def get_all_tt_specialists_async(
+    session : aiohttp.ClientSession,
+    years : Iterable[int] = DEFAULT_YEARS,
+    top_n : int = 50,
+    **kwargs
+    ) -> Set[Tuple[str,str]]:
+    """
+    Asynchronously collects all time trial specialists, see discover_tt_specialists.
+    Args:
+        session (aiohttp.ClientSession): Reusable session for connection pooling.
+        years (Iterable[int]): Years for which to collect time trial specialists.
+        top_n (int): Number of riders to collect per year. Defaults to 50.
+        **kwargs: Other arguments of discover_tt_specialists.
+    Returns:
+        Set[Tuple[str, str]]: A set of tuples containing rider names and their profile URLs.
+    """
+    return {rider async for rider in discover_tt_specialists(session, years, top_n, **kwargs)}
+
 if __name__ == "__main__":
+    import pandas as pd
+
     async def main():
         """
         Main function to scrape time trial specialists and save their data to a CSV file.
         """
-        all_riders = get_all_tt_specialists()
-
-        async with aiohttp.ClientSession() as session:
+        async with create_session() as session:
+            all_riders = await get_all_tt_specialists_async(session)
             tasks = [process_rider(name, url, session) for name, url in all_riders]
             data = await asyncio.gather(*tasks)
         riders_df = pd.DataFrame(data)
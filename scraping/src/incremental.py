@@ -0,0 +1,149 @@
+"""
+Incremental updates of the datasets : only new results and races are fetched, and rider
+profiles are refreshed only when they are stale.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from dataclasses import dataclass, field
+import json
+import os
+import time
+import pandas as pd
+from src.constants import DATA_DIR
+from src.dataset import load_dataset
+
+REFRESHED_FILE = ".riders_refreshed.json"
+RIDER_MAX_AGE = 7 * 24 * 3600
+
+@dataclass
+class IncrementalState:
+    """
+    What is already stored in the datasets, and when each rider profile was last fetched.
+    """
+    riders : pd.DataFrame
+    results : pd.DataFrame
+    races : pd.DataFrame
+    refreshed : Dict[str, float] = field(default_factory=dict)
+    data_dir : str = DATA_DIR
+
+    @classmethod
+    def load(cls, data_dir : str = DATA_DIR) -> "IncrementalState":
+        """
+        Loads the stored datasets, missing files give empty frames.
+        Args:
+            data_dir (str): Directory of the riders, results and races datasets.
+        Returns:
+            IncrementalState: The stored state.
+        """
+        def read(table : str) -> pd.DataFrame:
+            try:
+                return load_dataset(table, data_dir)
+            except FileNotFoundError:
+                return pd.DataFrame()
+
+        return cls(
+            riders=read("riders"),
+            results=read("results"),
+            races=read("races"),
+            refreshed=load_refreshed(data_dir),
+            data_dir=data_dir
+        )
+
+    def riders_to_crawl(self, specialists : Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        Gives the riders to crawl : newly discovered specialists plus the stored riders.
+        Args:
+            specialists (Iterable[Tuple[str, str]]): (name, URL) of the discovered specialists.
+        Returns:
+            List[Tuple[str, str]]: (name, URL) pairs, names in the PCS "LAST First" format.
+        """
+        riders = dict((url, name) for name, url in specialists)
+        for rider in self.riders.itertuples():
+            riders.setdefault(rider.url, f"{rider.last_name.upper()} {rider.first_name}")
+        return [(name, url) for url, name in riders.items()]
+
+    def fresh_riders(self, max_age : float = RIDER_MAX_AGE) -> Set[str]:
+        """
+        Args:
+            max_age (float): Age in seconds after which a rider profile is stale.
+        Returns:
+            Set[str]: URLs of the stored riders whose profile is not stale.
+        """
+        now = time.time()
+        stored = set(self.riders["url"]) if not self.riders.empty else set()
+        return {url for url, at in self.refreshed.items() if url in stored and now - at < max_age}
+
+    def known_results(self) -> Dict[str, Set[str]]:
+        """
+        Returns:
+            Dict[str, Set[str]]: Results page URL -> race URLs of the results already stored.
+        """
+        if self.results.empty:
+            return {}
+        return {
+            rider_url : set(race_urls)
+            for rider_url, race_urls in self.results.groupby("rider_url")["race_url"]
+        }
+
+    def known_races(self) -> Set[str]:
+        """
+        Returns:
+            Set[str]: URLs of the races already stored.
+        """
+        return set(self.races["url"]) if not self.races.empty else set()
+
+    def merge(
+        self,
+        riders : pd.DataFrame,
+        results : pd.DataFrame,
+        races : pd.DataFrame
+        ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        Merges newly scraped data into the stored data, new rows win over stored ones.
+        Args:
+            riders (pd.DataFrame): New riders.
+            results (pd.DataFrame): New results.
+            races (pd.DataFrame): New races, with parsed dates.
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]: Merged riders, results and races.
+        """
+        return (
+            _merge(self.riders, riders, ["url"]),
+            _merge(self.results, results, ["rider_url", "race_url"]),
+            _merge(self.races, races, ["url"])
+        )
+
+def load_refreshed(data_dir : str = DATA_DIR) -> Dict[str, float]:
+    """
+    Args:
+        data_dir (str): Directory of the datasets.
+    Returns:
+        Dict[str, float]: Profile URL -> timestamp of the last time the profile was fetched.
+    """
+    path = os.path.join(data_dir, REFRESHED_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def mark_refreshed(riders : Iterable[str], data_dir : str = DATA_DIR, at : Optional[float] = None):
+    """
+    Records the riders whose profile was just fetched.
+    Args:
+        riders (Iterable[str]): Profile URLs.
+        data_dir (str): Directory of the datasets.
+        at (float, optional): Timestamp. Defaults to now.
+    """
+    at = time.time() if at is None else at
+    refreshed = load_refreshed(data_dir)
+    refreshed.update((url, at) for url in riders)
+    with open(os.path.join(data_dir, REFRESHED_FILE), "w", encoding="utf-8") as f:
+        json.dump(refreshed, f)
+
+def _merge(stored : pd.DataFrame, new : pd.DataFrame, key : List[str]) -> pd.DataFrame:
+    if new.empty:
+        return stored
+    if stored.empty:
+        return new
+    merged = pd.concat([stored, new], ignore_index=True)
+    return merged.drop_duplicates(subset=key, keep="last")
@@ -0,0 +1,118 @@
+"""
+Crash-safe checkpoint journal of a crawl : every completed page is appended with its parsed
+record as soon as it is done, so that an interrupted crawl can resume where it stopped.
+"""
+
+from typing import Dict, Optional, Tuple
+import json
+import os
+from src.constants import DEFAULT_JOURNAL_PATH
+
+# Key of the discovered riders, which do not come from a single page
+DISCOVERY = ("discovery", "")
+
+class CheckpointJournal:
+    """
+    Append-only journal of (stage, URL, record) entries, one JSON line each.
+
+    Each entry is flushed as it is written, a killed process loses at most the pages that were
+    in flight. A torn last line, from a crash in the middle of a write, is dropped on replay.
+    """
+
+    def __init__(self, path : str = DEFAULT_JOURNAL_PATH, resume : bool = False):
+        """
+        Args:
+            path (str): Path of the journal. Its directory must exist.
+            resume (bool): If True, the entries already in the journal are replayed and new
+                ones are appended. Defaults to False (the journal starts empty).
+        """
+        self.path = path
+        self.replayed = 0
+        self._completed : Dict[Tuple[str, str], object] = {}
+        if resume and os.path.exists(path):
+            self._replay()
+        # pylint: disable-next=consider-using-with
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _replay(self):
+        valid = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self._completed[(entry["stage"], entry["url"])] = entry["record"]
+                valid += len(line)
+        # New entries must not be appended to a torn line
+        with open(self.path, "r+b") as f:
+            f.truncate(valid)
+
+    def __len__(self) -> int:
+        return len(self._completed)
+
+    def take(self, stage : str, url : str) -> Optional[object]:
+        """
+        Gives the replayed record of a completed page, once : it is then forgotten, the caller
+        being the one keeping it.
+        Args:
+            stage (str): "discovery", "riders", "results" or "races".
+            url (str): URL of the page.
+        Returns:
+            object: The record, None if the page was not completed.
+        """
+        record = self._completed.pop((stage, url), None)
+        if record is not None:
+            self.replayed += 1
+        return record
+
+    def record(self, stage : str, url : str, record : object):
+        """
+        Appends a completed page.
+        Args:
+            stage (str): "discovery", "riders", "results" or "races".
+            url (str): URL of the page.
+            record (object): Its parsed record, JSON serializable.
+        """
+        self._file.write(
+            json.dumps({"stage" : stage, "url" : url, "record" : record}, ensure_ascii=False)
+            + "\n"
+        )
+        self._file.flush()
+
+    def compact(self):
+        """
+        Rewrites the journal with a single entry per page, the last one, atomically.
+        """
+        self._file.close()
+        last : Dict[Tuple[str, str], int] = {}
+        with open(self.path, encoding="utf-8") as f:
+            for number, line in enumerate(f):
+                entry = json.loads(line)
+                last[(entry["stage"], entry["url"])] = number
+        kept = set(last.values())
+        tmp_path = self.path + ".tmp"
+        with open(self.path, encoding="utf-8") as f, open(tmp_path, "w", encoding="utf-8") as out:
+            out.writelines(line for number, line in enumerate(f) if number in kept)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, self.path)
+        # pylint: disable-next=consider-using-with
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        """
+        Flushes the journal to disk and closes it.
+        """
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
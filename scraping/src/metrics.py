@@ -0,0 +1,345 @@
+"""
+Instrumentation of a crawl : fetch latencies, parse times, response sizes and statuses, queue
+depths, in-flight requests and stage timings, written to a JSON report and a Prometheus
+textfile at the end of the run.
+
+A Metrics object is threaded through the crawl like the response cache, every function
+accepting metrics=None skips the measures when it is not given.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager, nullcontext
+import asyncio
+import bisect
+import json
+import os
+import re
+import time
+from tqdm import tqdm
+
+DEFAULT_METRICS_PATH = "data/metrics.json"
+DEFAULT_PROMETHEUS_PATH = "data/metrics.prom"
+# Upper bounds in seconds of the latency buckets, the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# page type -> URL pattern, the first matching pattern wins
+PAGE_TYPES = (
+    ("rankings", re.compile(r"/rankings\.php")),
+    ("results", re.compile(r"/rider/[^/]+/results/")),
+    ("rider", re.compile(r"/rider/[^/?]+$")),
+    ("race", re.compile(r"/race/")),
+)
+
+def page_type(url : str) -> str:
+    """
+    Args:
+        url (str): URL of a PCS page.
+    Returns:
+        str: "rankings", "results", "rider", "race" or "other".
+    """
+    for name, pattern in PAGE_TYPES:
+        if pattern.search(url):
+            return name
+    return "other"
+
+class Histogram:
+    """
+    Counts of observed durations per bucket (not cumulative), with their sum and count.
+    """
+
+    def __init__(self, buckets : Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value : float):
+        """
+        Records one duration in seconds.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q : float) -> Optional[float]:
+        """
+        Estimates a quantile by linear interpolation inside its bucket, like Prometheus'
+        histogram_quantile.
+        Args:
+            q (float): Quantile between 0 and 1.
+        Returns:
+            Optional[float]: Estimate in seconds, None if nothing was observed.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def to_dict(self) -> Dict:
+        """
+        Returns:
+            Dict: Count, sum, mean, p50, p95, p99 and the count of each bucket.
+        """
+        return {
+            "count" : self.count,
+            "sum" : round(self.sum, 6),
+            "mean" : round(self.sum / self.count, 6) if self.count else None,
+            "p50" : self.quantile(0.5),
+            "p95" : self.quantile(0.95),
+            "p99" : self.quantile(0.99),
+            "buckets" : {
+                str(bound) : count
+                for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts)
+            },
+        }
+
+class Metrics:
+    """
+    Measures gathered during a crawl. Every method runs on the event loop, the parse times of
+    the worker processes are measured there and sent back with the parsed data.
+    """
+
+    def __init__(self, per_url : bool = True):
+        """
+        Args:
+            per_url (bool): Whether to keep the fetch latency of every URL, on top of the
+                histograms per page type. Defaults to True.
+        """
+        self.per_url = per_url
+        self.fetch_seconds : Dict[str, Histogram] = {}
+        self.parse_seconds : Dict[str, Histogram] = {}
+        self.url_seconds : Dict[str, float] = {}
+        self.response_bytes : Dict[str, int] = {}
+        self.statuses : Dict[int, int] = {}
+        self.cache_hits = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.queue_depths : Dict[str, List[int]] = {} # stage -> [max, sum, samples]
+        self.stage_seconds : Dict[str, float] = {}
+        self.started_at = time.time()
+
+    @contextmanager
+    def fetch(self, url : str):
+        """
+        Times a request and counts it as in flight while it runs.
+        Args:
+            url (str): Requested URL.
+        """
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight -= 1
+            self.fetch_seconds.setdefault(page_type(url), Histogram()).observe(elapsed)
+            if self.per_url:
+                self.url_seconds[url] = round(elapsed, 6)
+
+    def response(self, url : str, status : int, size : Optional[int] = None):
+        """
+        Counts a response, and its size in bytes if its body was read.
+        """
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if size is not None:
+            kind = page_type(url)
+            self.response_bytes[kind] = self.response_bytes.get(kind, 0) + size
+
+    def cache_hit(self):
+        """
+        Counts a page served by the response cache.
+        """
+        self.cache_hits += 1
+
+    def parsed(self, kind : str, seconds : float):
+        """
+        Records the time taken to parse and extract one page.
+        Args:
+            kind (str): Page type, see page_type.
+            seconds (float): Parse time.
+        """
+        self.parse_seconds.setdefault(kind, Histogram()).observe(seconds)
+
+    @contextmanager
+    def parse(self, kind : str):
+        """
+        Times the parsing of one page on the event loop, see parsed.
+        """
+        start = time.perf_counter()
+        yield
+        self.parsed(kind, time.perf_counter() - start)
+
+    def queue_depth(self, stage : str, depth : int):
+        """
+        Samples the number of items waiting in the queue of a stage.
+        """
+        sample = self.queue_depths.setdefault(stage, [0, 0, 0])
+        sample[0] = max(sample[0], depth)
+        sample[1] += depth
+        sample[2] += 1
+
+    @contextmanager
+    def stage(self, name : str):
+        """
+        Times a stage of the run, e.g. the discovery of the riders.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + (
+                time.perf_counter() - start
+            )
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: One line per page type with its fetch and parse times, then the statuses,
+            in-flight requests and the mean depth of the queues.
+        """
+        lines = []
+        for kind in sorted(set(self.fetch_seconds) | set(self.parse_seconds)):
+            fetch = self.fetch_seconds.get(kind, Histogram())
+            parse = self.parse_seconds.get(kind, Histogram())
+            lines.append(
+                f"{kind:9} {fetch.count:6} fetched  p50 {_ms(fetch.quantile(0.5))}"
+                f"  p95 {_ms(fetch.quantile(0.95))}  |  {parse.count:6} parsed"
+                f"  p50 {_ms(parse.quantile(0.5))}  p95 {_ms(parse.quantile(0.95))}"
+                f"  |  {self.response_bytes.get(kind, 0) / 2**20:7.1f} MiB"
+            )
+        statuses = ", ".join(
+            f"{status}: {count}" for status, count in sorted(self.statuses.items())
+        )
+        queues = ", ".join(
+            f"{stage} {total / samples:.0f} (max {deepest})"
+            for stage, (deepest, total, samples) in self.queue_depths.items()
+        )
+        lines.append(
+            f"statuses {{{statuses}}}  cache hits {self.cache_hits}"
+            f"  in flight {self.in_flight} (max {self.max_in_flight})  queues {queues or '-'}"
+        )
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict:
+        """
+        Returns:
+            Dict: Every measure, JSON serializable.
+        """
+        return {
+            "started_at" : self.started_at,
+            "stage_seconds" : {name : round(s, 3) for name, s in self.stage_seconds.items()},
+            "fetch_seconds" : {kind : h.to_dict() for kind, h in self.fetch_seconds.items()},
+            "parse_seconds" : {kind : h.to_dict() for kind, h in self.parse_seconds.items()},
+            "response_bytes" : self.response_bytes,
+            "statuses" : {str(status) : count for status, count in self.statuses.items()},
+            "cache_hits" : self.cache_hits,
+            "max_in_flight" : self.max_in_flight,
+            "queue_depths" : {
+                stage : {"max" : deepest, "mean" : round(total / samples, 2)}
+                for stage, (deepest, total, samples) in self.queue_depths.items()
+            },
+            "url_seconds" : self.url_seconds,
+        }
+
+    def to_json(self, path : str = DEFAULT_METRICS_PATH):
+        """
+        Writes the measures to a JSON file.
+        Args:
+            path (str): Output path. Defaults to data/metrics.json.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Returns:
+            str: The measures in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, description, histograms in (
+            ("pcs_fetch_seconds", "Latency of the page requests", self.fetch_seconds),
+            ("pcs_parse_seconds", "Time to parse and extract a page", self.parse_seconds),
+        ):
+            lines += [f"# HELP {name} {description}.", f"# TYPE {name} histogram"]
+            for kind, histogram in sorted(histograms.items()):
+                cumulative = 0
+                bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{page_type="{kind}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{page_type="{kind}"}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{page_type="{kind}"}} {histogram.count}')
+        lines += _samples(
+            "pcs_response_bytes_total", "counter", "Bytes of the response bodies.",
+            {f'page_type="{kind}"' : size for kind, size in sorted(self.response_bytes.items())}
+        )
+        lines += _samples(
+            "pcs_responses_total", "counter", "Responses per HTTP status.",
+            {f'status="{status}"' : count for status, count in sorted(self.statuses.items())}
+        )
+        lines += _samples(
+            "pcs_cache_hits_total", "counter", "Pages served by the response cache.",
+            {"" : self.cache_hits}
+        )
+        lines += _samples(
+            "pcs_in_flight_requests_max", "gauge", "Largest number of concurrent requests.",
+            {"" : self.max_in_flight}
+        )
+        lines += _samples(
+            "pcs_queue_depth_max", "gauge", "Largest number of items waiting per stage.",
+            {f'stage="{stage}"' : sample[0] for stage, sample in self.queue_depths.items()}
+        )
+        lines += _samples(
+            "pcs_stage_seconds", "gauge", "Duration of each stage of the run.",
+            {f'stage="{name}"' : f"{s:.3f}" for name, s in self.stage_seconds.items()}
+        )
+        lines += _samples(
+            "pcs_last_run_timestamp_seconds", "gauge", "Start time of the run.",
+            {"" : f"{self.started_at:.0f}"}
+        )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path : str = DEFAULT_PROMETHEUS_PATH):
+        """
+        Writes the Prometheus textfile atomically, so that the textfile collector of
+        node_exporter never reads it half written.
+        Args:
+            path (str): Output path, it should end with .prom. Defaults to data/metrics.prom.
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+def _ms(seconds : Optional[float]) -> str:
+    return "     -" if seconds is None else f"{1000 * seconds:4.0f}ms"
+
+def _samples(name : str, kind : str, description : str, values : Dict[str, object]) -> List[str]:
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for labels, value in values.items():
+        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return lines
+
+def timed_parse(metrics : Optional[Metrics], kind : str):
+    """
+    Returns:
+        A context manager timing a parse into metrics, or doing nothing if metrics is None.
+    """
+    return metrics.parse(kind) if metrics is not None else nullcontext()
+
+async def live_summary(metrics : Metrics, interval : float = 30.0):
+    """
+    Prints the summary of the measures every interval seconds, above the progress bars, until
+    cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        tqdm.write(metrics.summary())
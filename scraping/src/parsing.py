@@ -0,0 +1,173 @@
+"""
+HTML parser backends, partial parsing of the page fragments the extractors need, and
+single-pass extraction of the tables.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+import importlib.util
+import re
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+# Backends supported by BeautifulSoup that also honour parse_only, fastest first.
+PARSERS = ("lxml", "html.parser")
+DEFAULT_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+_SIMPLE_SELECTOR = re.compile(r"^(?P<name>[\w-]+)?(?P<id>#[\w-]+)?(?P<classes>(\.[\w-]+)*)$")
+
+class Fragment:
+    """
+    A page fragment, described by a simple CSS selector such as "div.borderbox.w30" or
+    "#resultsCont" (tag name, id and classes only).
+    """
+
+    def __init__(self, selector : str):
+        """
+        Args:
+            selector (str): Simple CSS selector.
+        Raises:
+            ValueError: If the selector uses combinators, pseudo-classes or attributes.
+        """
+        match = _SIMPLE_SELECTOR.match(selector)
+        if not match or not selector:
+            raise ValueError(f"Unsupported fragment selector : {selector!r}")
+        self.selector = selector
+        self.name = match["name"]
+        self.id = match["id"][1:] if match["id"] else None
+        self.classes = frozenset(c for c in match["classes"].split(".") if c)
+
+    def matches(self, name : str, attrs : Optional[Dict]) -> bool:
+        """
+        Tells if a tag matches the fragment, from its name and raw attributes.
+        """
+        if self.name is not None and name != self.name:
+            return False
+        attrs = attrs or {}
+        if self.id is not None and attrs.get("id") != self.id:
+            return False
+        if self.classes:
+            classes = attrs.get("class") or ""
+            if isinstance(classes, str):
+                classes = classes.split()
+            if not self.classes.issubset(classes):
+                return False
+        return True
+
+    def __repr__(self) -> str:
+        return f"Fragment({self.selector!r})"
+
+class FragmentStrainer(SoupStrainer):
+    """
+    SoupStrainer keeping only the subtrees rooted at any of the given fragments, everything
+    else in the document is skipped without building Tag objects.
+    """
+
+    def __init__(self, selectors : Sequence[str]):
+        """
+        Args:
+            selectors (Sequence[str]): Simple CSS selectors of the fragments to keep.
+        """
+        super().__init__()
+        self.fragments : List[Fragment] = [Fragment(selector) for selector in selectors]
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        return any(fragment.matches(name, attrs) for fragment in self.fragments)
+
+    def allow_string_creation(self, string) -> bool:
+        return False
+
+    def __repr__(self) -> str:
+        return f"FragmentStrainer({[fragment.selector for fragment in self.fragments]})"
+
+def available_parsers() -> List[str]:
+    """
+    Returns:
+        List[str]: The parser backends installed in this environment, fastest first.
+    """
+    return [
+        parser for parser in PARSERS
+        if parser == "html.parser" or importlib.util.find_spec(parser)
+    ]
+
+def make_soup(
+    html : str,
+    parser : Optional[str] = None,
+    fragments : Optional[Iterable[str]] = None
+    ) -> BeautifulSoup:
+    """
+    Parses an HTML document, optionally building only the given fragments.
+
+    Extractors meant to work on partial trees must use selectors relative to their fragments,
+    e.g. "title" rather than "head > title", so that they give the same output on the full
+    document and on the fragments, whatever the backend.
+
+    Args:
+        html (str): Raw HTML content.
+        parser (str, optional): Parser backend, one of PARSERS. Defaults to DEFAULT_PARSER.
+        fragments (Iterable[str], optional): Simple CSS selectors of the fragments to build.
+            Defaults to None (the whole document).
+    Returns:
+        BeautifulSoup: Parsed HTML content.
+    """
+    parse_only = FragmentStrainer(list(fragments)) if fragments else None
+    return BeautifulSoup(html, parser or DEFAULT_PARSER, parse_only=parse_only)
+
+def child_elements(tag : Tag, name : Optional[str] = None) -> List[Tag]:
+    """
+    Lists the element children of a tag in one pass, so that "tag > x:nth-child(n)" lookups
+    become list indexing instead of CSS queries.
+    Args:
+        tag (Tag): Parent tag.
+        name (str, optional): Only keep the children with this tag name. Defaults to None
+            (every element, which is what nth-child counts).
+    Returns:
+        List[Tag]: The element children, in document order.
+    """
+    return [
+        child for child in tag.children
+        if isinstance(child, Tag) and (name is None or child.name == name)
+    ]
+
+class TableSchema:
+    """
+    Declarative description of an HTML table : named columns at fixed td positions.
+
+    Each row is walked once and its cells are mapped to the column names, instead of one
+    "td:nth-child(n)" CSS query per cell, each of which scans the row again.
+    """
+
+    def __init__(self, columns : Dict[str, int]):
+        """
+        Args:
+            columns (Dict[str, int]): Column name -> position of its td in the row, from 0.
+        """
+        self.columns = columns
+        self.width = max(columns.values()) + 1
+
+    def cells(self, row : Tag) -> Optional[Dict[str, Tag]]:
+        """
+        Args:
+            row (Tag): A tr tag.
+        Returns:
+            Optional[Dict[str, Tag]]: Column name -> td, None if the row has too few cells
+            (e.g. a placeholder row spanning the whole table).
+        """
+        tds = child_elements(row, "td")
+        if len(tds) < self.width:
+            return None
+        return {name : tds[index] for name, index in self.columns.items()}
+
+    def rows(self, table : Tag) -> Iterator[Dict[str, Tag]]:
+        """
+        Yields the cells of the body rows of a table, in document order.
+        Args:
+            table (Tag): A table tag, or directly its tbody.
+        Yields:
+            Dict[str, Tag]: Column name -> td of each row with enough cells.
+        """
+        body = table
+        if table.name == "table":
+            body = table.find("tbody", recursive=False) or table
+        for row in child_elements(body, "tr"):
+            cells = self.cells(row)
+            if cells is not None:
+                yield cells
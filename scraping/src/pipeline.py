@@ -0,0 +1,343 @@
+"""
+Streaming crawl pipeline : riders -> results -> races stages connected by bounded queues.
+"""
+
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import aiohttp
+from tqdm import tqdm
+from src.cache import ResponseCache
+from src.tasks import FailureReport, RetryError, RetryPolicy, run_with_retry
+from src.workers import ParsePool
+from src.metrics import Metrics
+from src.records import RecordBuilder
+from src.journal import CheckpointJournal
+from src.get_tt_specialists import process_rider
+from src.constants import MIN_YEAR, RESULTS_PATH, STRATEGIES
+from src.get_tt_results import process_results
+from src.get_tt_races import process_race
+
+_DONE = object()
+
+class Stage:
+    """
+    A pool of workers consuming a bounded queue, with its own progress bar.
+    """
+
+    def __init__(
+        self,
+        name : str,
+        handle : Callable[[object], Awaitable[None]],
+        workers : int,
+        position : int,
+        progress : bool = True,
+        metrics : Optional[Metrics] = None,
+        report : Optional[FailureReport] = None
+        ):
+        """
+        Args:
+            name (str): Name of the stage, used in the progress bar and the failure report.
+            handle (Callable[[object], Awaitable[None]]): Coroutine processing one item.
+            workers (int): Number of items processed at once.
+            position (int): Line of the progress bar.
+            progress (bool): Whether to show the progress bar. Defaults to True.
+            metrics (Metrics, optional): If given, the depth of the queue is sampled on every
+                put.
+            report (FailureReport, optional): Report collecting the items whose handling
+                raised, the worker going on with the next item. Defaults to a new report.
+        """
+        self.name = name
+        self.handle = handle
+        self.metrics = metrics
+        self.report = report if report is not None else FailureReport()
+        self.queue = asyncio.Queue(maxsize=2 * workers)
+        self.bar = tqdm(
+            desc=f"Processing {name}", total=0, position=position, disable=not progress
+        )
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(workers)]
+
+    async def put(self, item):
+        """
+        Enqueues an item, waiting if the stage is saturated (backpressure).
+        """
+        self.bar.total += 1
+        self.bar.refresh()
+        await self.queue.put(item)
+        if self.metrics is not None:
+            self.metrics.queue_depth(self.name, self.queue.qsize())
+
+    async def close(self):
+        """
+        Waits for every enqueued item to be processed, then stops the workers.
+        """
+        for _ in self._tasks:
+            await self.queue.put(_DONE)
+        await asyncio.gather(*self._tasks)
+        self.bar.close()
+
+    async def _work(self):
+        while True:
+            item = await self.queue.get()
+            if item is _DONE:
+                return
+            try:
+                await self.handle(item)
+            except Exception as exc: # pylint: disable=broad-except
+                # A dead worker would leave close() waiting forever on the bounded queue
+                self.report.add(self.name, _item_url(item), exc)
+            finally:
+                self.bar.update()
+
+def _item_url(item) -> str:
+    # Items are URLs, or (name, profile URL) pairs for the riders and profiles stages
+    return item[1] if isinstance(item, tuple) else str(item)
+
+class CrawlPipeline:
+    """
+    Crawls rider profiles, their time trial results and the races of these results as one
+    streaming pipeline : each rider feeds its results page downstream as soon as it is parsed,
+    and each race URL is fetched as soon as it is first seen, so the stages overlap instead of
+    waiting for each other.
+
+    With the "race" strategy, a fourth stage fetches the profiles of the riders first seen in
+    the result table of a race.
+
+    A crawl can also stop before the races or the profiles, only collecting their URLs, and
+    another crawl start from them (run_races, run_profiles), e.g. for a coordinator to fetch
+    each page once across several crawls, see src.backfill.
+    """
+
+    def __init__(
+        self,
+        session : aiohttp.ClientSession,
+        report : FailureReport,
+        policy : Optional[RetryPolicy] = None,
+        concurrency : int = 32,
+        cache : Optional[ResponseCache] = None,
+        pool : Optional[ParsePool] = None,
+        progress : bool = True,
+        known_results : Optional[Dict[str, Set[str]]] = None,
+        known_races : Optional[Set[str]] = None,
+        fresh_riders : Optional[Set[str]] = None,
+        metrics : Optional[Metrics] = None,
+        raw : bool = False,
+        journal : Optional[CheckpointJournal] = None,
+        strategy : str = "rider",
+        min_year : int = MIN_YEAR,
+        follow_races : bool = True,
+        follow_profiles : bool = True
+        ):
+        """
+        The last three arguments support incremental updates, see src.incremental.
+        Args:
+            session (aiohttp.ClientSession): Reusable session for connection pooling.
+            report (FailureReport): Report collecting the pages that failed.
+            policy (RetryPolicy, optional): Timeout and retry policy. Defaults to RetryPolicy().
+            concurrency (int): Number of pages processed at once per stage. Defaults to 32.
+            cache (ResponseCache, optional): Response cache shared by the fetches.
+            pool (ParsePool, optional): If given, pages are parsed in worker processes.
+            progress (bool): Whether to show one progress bar per stage. Defaults to True.
+            known_results (Dict[str, Set[str]], optional): Results page URL -> race URLs of the
+                results already stored, the walk through each table stops at the first of them.
+            known_races (Set[str], optional): Race URLs already stored, they are not fetched.
+            fresh_riders (Set[str], optional): Profile URLs of the riders whose profile is
+                recent enough, it is not fetched again but their results still are.
+            metrics (Metrics, optional): Measures of the crawl, see src.metrics.
+            raw (bool): If True, the numeric fields of the results and races are left as raw
+                strings, for src.conversion to convert whole columns at once. Defaults to False.
+            journal (CheckpointJournal, optional): If given, every completed page is journaled
+                with its record, and the pages already in the journal are not fetched again.
+            strategy (str): Where the results come from, see STRATEGIES. Defaults to "rider".
+            min_year (int): First season of the results collected. Defaults to MIN_YEAR.
+            follow_races (bool): Whether the races of the results are fetched. If False, their
+                URLs are only collected in seen_races. Defaults to True.
+            follow_profiles (bool): Whether the profiles of the riders first seen in a race
+                table are fetched ("race" strategy). If False, they are only collected in
+                new_riders. Defaults to True.
+        """
+        self.session = session
+        self.report = report
+        self.policy = policy or RetryPolicy()
+        self.concurrency = concurrency
+        self.cache = cache
+        self.pool = pool
+        self.progress = progress
+        self.metrics = metrics
+        self.raw = raw
+        self.journal = journal
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy {strategy}, expected one of {STRATEGIES}")
+        self.strategy = strategy
+        self.min_year = min_year
+        self.follow_races = follow_races
+        self.follow_profiles = follow_profiles
+        # Rows are kept in column buffers rather than as one dict each, see src.records
+        self.riders = RecordBuilder.for_table("riders")
+        self.results = RecordBuilder.for_table("results", raw)
+        self.races = RecordBuilder.for_table("races", raw)
+        self.known_results = known_results or {}
+        self.fresh_riders = fresh_riders or set()
+        self.seen_races : Set[str] = set(known_races or ())
+        self.seen_riders : Set[str] = set(self.fresh_riders)
+        # (name, profile URL) of the riders first seen in a race table, when not followed
+        self.new_riders : List[Tuple[str, str]] = []
+        self._riders_stage : Optional[Stage] = None
+        self._results_stage : Optional[Stage] = None
+        self._races_stage : Optional[Stage] = None
+        self._profiles_stage : Optional[Stage] = None
+
+    async def _attempt(self, stage : str, url : str, factory : Callable[[], Awaitable]):
+        try:
+            return await run_with_retry(factory, self.policy)
+        except RetryError as exc:
+            self.report.add(stage, url, exc)
+            return None
+
+    async def _checkpointed(self, stage : str, url : str, factory : Callable[[], Awaitable]):
+        if self.journal is not None:
+            record = self.journal.take(stage, url)
+            if record is not None:
+                return record
+        record = await self._attempt(stage, url, factory)
+        if record is not None and self.journal is not None:
+            self.journal.record(stage, url, record)
+        return record
+
+    async def _fetch_rider(self, name : str, url : str) -> Optional[Dict]:
+        rider = await self._checkpointed("riders", url, lambda: process_rider(
+            name, url, self.session, verbose=False, cache=self.cache, pool=self.pool,
+            metrics=self.metrics
+        ))
+        if rider:
+            self.riders.append(rider)
+        return rider
+
+    async def _process_rider(self, item : Tuple[str, str]):
+        name, url = item
+        if url in self.fresh_riders:
+            await self._results_stage.put(url + RESULTS_PATH)
+            return
+        rider = await self._fetch_rider(name, url)
+        if rider:
+            await self._results_stage.put(rider["url"] + RESULTS_PATH)
+
+    async def _process_profile(self, item : Tuple[str, str]):
+        await self._fetch_rider(*item)
+
+    async def _process_results(self, url : str):
+        results = await self._checkpointed("results", url, lambda: process_results(
+            url, self.session, verbose=False, cache=self.cache, pool=self.pool,
+            known_races=self.known_results.get(url), metrics=self.metrics, raw=self.raw,
+            min_year=self.min_year
+        ))
+        for result in results or []:
+            if self.strategy == "rider":
+                self.results.append(result)
+            if result["race_url"] not in self.seen_races:
+                self.seen_races.add(result["race_url"])
+                if self.follow_races:
+                    await self._races_stage.put(result["race_url"])
+
+    async def _process_race(self, url : str):
+        race = await self._checkpointed("races", url, lambda: process_race(
+            url, self.session, verbose=False, cache=self.cache, pool=self.pool,
+            metrics=self.metrics, raw=self.raw, with_results=self.strategy == "race"
+        ))
+        if not race:
+            return
+        results = race.pop("results", None)
+        self.races.append(race)
+        for result in results or []:
+            self.results.append(result)
+            profile_url = result["rider_url"].removesuffix(RESULTS_PATH)
+            if profile_url not in self.seen_riders:
+                self.seen_riders.add(profile_url)
+                if self.follow_profiles:
+                    await self._profiles_stage.put((result["rider_name"], profile_url))
+                else:
+                    self.new_riders.append((result["rider_name"], profile_url))
+
+    def _start(self, profiles : bool = False):
+        self._riders_stage = Stage(
+            "riders", self._process_rider, self.concurrency, 0, self.progress, self.metrics,
+            self.report
+        )
+        self._results_stage = Stage(
+            "results", self._process_results, self.concurrency, 1, self.progress, self.metrics,
+            self.report
+        )
+        self._races_stage = Stage(
+            "races", self._process_race, self.concurrency, 2, self.progress, self.metrics,
+            self.report
+        )
+        if self.strategy == "race" or profiles:
+            self._profiles_stage = Stage(
+                "profiles", self._process_profile, self.concurrency, 3, self.progress,
+                self.metrics, self.report
+            )
+
+    async def _finish(self) -> Tuple[RecordBuilder, RecordBuilder, RecordBuilder]:
+        # Each stage is closed once its producers are done, the order matters
+        await self._riders_stage.close()
+        await self._results_stage.close()
+        await self._races_stage.close()
+        if self._profiles_stage is not None:
+            await self._profiles_stage.close()
+        return self.riders, self.results, self.races
+
+    async def run(
+        self,
+        riders : Iterable[Tuple[str, str]]
+        ) -> Tuple[RecordBuilder, RecordBuilder, RecordBuilder]:
+        """
+        Runs the whole pipeline.
+        Args:
+            riders (Iterable[Tuple[str, str]]): (name, profile URL) of the riders to crawl.
+        Returns:
+            Tuple[RecordBuilder, RecordBuilder, RecordBuilder]: riders, results and races data,
+                RecordBuilder.to_frame gives their DataFrame.
+        """
+        self._start()
+        # Known before any race is parsed, so that no profile is fetched twice
+        riders = list(riders)
+        self.seen_riders.update(url for _, url in riders)
+        for rider in riders:
+            await self._riders_stage.put(rider)
+        return await self._finish()
+
+    async def run_races(
+        self,
+        urls : Iterable[str]
+        ) -> Tuple[RecordBuilder, RecordBuilder, RecordBuilder]:
+        """
+        Runs the pipeline from the races stage, e.g. on the seen_races of crawls that did not
+        follow them.
+        Args:
+            urls (Iterable[str]): URLs of the races to crawl.
+        Returns:
+            Tuple[RecordBuilder, RecordBuilder, RecordBuilder]: See run.
+        """
+        self._start()
+        for url in urls:
+            if url not in self.seen_races:
+                self.seen_races.add(url)
+                await self._races_stage.put(url)
+        return await self._finish()
+
+    async def run_profiles(
+        self,
+        riders : Iterable[Tuple[str, str]]
+        ) -> Tuple[RecordBuilder, RecordBuilder, RecordBuilder]:
+        """
+        Only fetches rider profiles, e.g. the new_riders of crawls that did not follow them.
+        Args:
+            riders (Iterable[Tuple[str, str]]): (name, profile URL) of the riders.
+        Returns:
+            Tuple[RecordBuilder, RecordBuilder, RecordBuilder]: See run.
+        """
+        self._start(profiles=True)
+        for name, url in riders:
+            if url not in self.seen_riders:
+                self.seen_riders.add(url)
+                await self._profiles_stage.put((name, url))
+        return await self._finish()
@@ -0,0 +1,313 @@
+"""
+Winner speed prediction service : linear models of the winner's speed trained on the races
+dataset, saved as numbered versions, and served from memory over a Python API and a local HTTP
+endpoint (see src.serving), concurrent requests being grouped into single vectorized predictions.
+
+    python -m src.prediction train
+    python -m src.prediction serve --port 8081
+    python -m src.prediction estimate --feature distance=30 --feature vertical_meters=200 \
+        --feature startlist_quality=900 --feature profile_score=15
+    curl -d '{"distance": 30, "vertical_meters": 200, "startlist_quality": 900,
+        "profile_score": 15}' http://127.0.0.1:8081/predict
+"""
+
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import glob
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+from src.constants import DATA_DIR, DEFAULT_MODELS_DIR, DEFAULT_PORT
+from src.dataset import load_dataset
+
+FEATURES = ["distance", "vertical_meters", "startlist_quality", "profile_score"]
+TARGET = "winner_speed"
+# Speeds in km/h a time trial can be won at, others come from misparsed winner times
+TARGET_RANGE = (20.0, 70.0)
+
+@dataclass
+class LinearModel:
+    """
+    Linear model : target = intercept + features @ coef.
+    Attributes:
+        features (List[str]): Names of the features, in the order of coef.
+        coef (List[float]): Coefficient of each feature.
+        intercept (float): Intercept.
+        target (str): Name of the predicted column.
+        version (int): Version in the registry, 0 if not saved.
+        trained_at (str): ISO timestamp of the training.
+        rows (int): Number of training rows.
+        rmse (float): Root mean squared error on the training rows.
+    """
+    features : List[str]
+    coef : List[float]
+    intercept : float
+    target : str = TARGET
+    version : int = 0
+    trained_at : str = ""
+    rows : int = 0
+    rmse : float = 0.0
+    _coef : np.ndarray = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._coef = np.asarray(self.coef, dtype=np.float64)
+
+    def predict(self, x : Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        """
+        Args:
+            x (Union[pd.DataFrame, np.ndarray]): A frame with the features as columns, or an
+                array of shape (rows, features) in the order of features.
+        Returns:
+            np.ndarray: The predictions.
+        """
+        if isinstance(x, pd.DataFrame):
+            x = x[self.features].to_numpy(np.float64, na_value=np.nan)
+        return np.asarray(x, dtype=np.float64) @ self._coef + self.intercept
+
+    def row(self, features : Mapping[str, float]) -> List[float]:
+        """
+        Args:
+            features (Mapping[str, float]): Value of every feature.
+        Returns:
+            List[float]: The values in the order of the model.
+        Raises:
+            KeyError: If a feature is missing.
+        """
+        return [float(features[name]) for name in self.features]
+
+    def to_dict(self) -> Dict:
+        """
+        Returns:
+            Dict: The model, JSON serializable.
+        """
+        return {key : value for key, value in asdict(self).items() if not key.startswith("_")}
+
+def train_model(
+    races : pd.DataFrame,
+    features : Sequence[str] = FEATURES,
+    target : str = TARGET,
+    target_range : Optional[Tuple[float, float]] = TARGET_RANGE
+    ) -> LinearModel:
+    """
+    Fits a linear model by least squares, on the races where the features and the target are
+    all known.
+    Args:
+        races (pd.DataFrame): Races.
+        features (Sequence[str]): Features. Defaults to FEATURES.
+        target (str): Predicted column. Defaults to TARGET.
+        target_range (Tuple[float, float], optional): Bounds of the target values trained on.
+            Defaults to TARGET_RANGE, None keeps every value.
+    Returns:
+        LinearModel: The model, not saved yet.
+    Raises:
+        ValueError: If no race has all the columns.
+    """
+    data = races[list(features) + [target]].apply(pd.to_numeric, errors="coerce").dropna()
+    if target_range is not None:
+        data = data[data[target].between(*target_range)]
+    if data.empty:
+        raise ValueError(f"No race with all of {list(features) + [target]}")
+    x = data[list(features)].to_numpy(np.float64)
+    y = data[target].to_numpy(np.float64)
+    solution = np.linalg.lstsq(np.column_stack([x, np.ones(len(x))]), y, rcond=None)[0]
+    rmse = float(np.sqrt(np.mean((x @ solution[:-1] + solution[-1] - y) ** 2)))
+    return LinearModel(
+        features=list(features),
+        coef=solution[:-1].tolist(),
+        intercept=float(solution[-1]),
+        target=target,
+        trained_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        rows=len(data),
+        rmse=rmse
+    )
+
+class ModelRegistry:
+    """
+    Numbered versions of the models of a target, one JSON file each, loaded once.
+    """
+
+    def __init__(self, directory : str = DEFAULT_MODELS_DIR, target : str = TARGET):
+        """
+        Args:
+            directory (str): Directory of the models. Defaults to data/models.
+            target (str): Predicted column. Defaults to TARGET.
+        """
+        self.directory = directory
+        self.target = target
+        self._loaded : Dict[int, LinearModel] = {}
+
+    def _path(self, version : int) -> str:
+        return os.path.join(self.directory, f"{self.target}-v{version}.json")
+
+    def versions(self) -> List[int]:
+        """
+        Returns:
+            List[int]: The saved versions, oldest first.
+        """
+        pattern = re.compile(rf"{re.escape(self.target)}-v(\d+)\.json$")
+        return sorted(
+            int(match.group(1)) for match in (
+                pattern.search(path)
+                for path in glob.glob(os.path.join(self.directory, f"{self.target}-v*.json"))
+            ) if match
+        )
+
+    def save(self, model : LinearModel) -> int:
+        """
+        Saves a model as the next version.
+        Args:
+            model (LinearModel): The model, its version is set.
+        Returns:
+            int: Its version.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        model.version = max(self.versions(), default=0) + 1
+        with open(self._path(model.version), "w", encoding="utf-8") as f:
+            json.dump(model.to_dict(), f, indent=2)
+        self._loaded[model.version] = model
+        return model.version
+
+    def load(self, version : Optional[int] = None) -> LinearModel:
+        """
+        Args:
+            version (int, optional): Version to load. Defaults to the latest one.
+        Returns:
+            LinearModel: The model, read from disk only the first time.
+        Raises:
+            FileNotFoundError: If there is no such version.
+        """
+        if version is None:
+            versions = self.versions()
+            if not versions:
+                raise FileNotFoundError(f"No {self.target} model in {self.directory}")
+            version = versions[-1]
+        if version not in self._loaded:
+            with open(self._path(version), encoding="utf-8") as f:
+                self._loaded[version] = LinearModel(**json.load(f))
+        return self._loaded[version]
+
+class MicroBatcher:
+    """
+    Groups the predictions requested concurrently from an event loop into a single vectorized
+    call of the model.
+    """
+
+    def __init__(self, model : LinearModel, max_batch : int = 4096, max_delay : float = 0.0):
+        """
+        Args:
+            model (LinearModel): The model.
+            max_batch (int): Largest batch, reaching it predicts at once. Defaults to 4096.
+            max_delay (float): Seconds a request waits for others. Defaults to 0 : the batch
+                holds the requests of a single event loop iteration.
+        """
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.predictions = 0
+        self._rows : List[List[float]] = []
+        self._futures : List[asyncio.Future] = []
+        self._timer : Optional[asyncio.TimerHandle] = None
+
+    async def predict(self, features : Mapping[str, float]) -> float:
+        """
+        Args:
+            features (Mapping[str, float]): Value of every feature of the model.
+        Returns:
+            float: The prediction.
+        Raises:
+            KeyError: If a feature is missing.
+        """
+        row = self.model.row(features)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._rows.append(row)
+        self._futures.append(future)
+        if len(self._rows) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self.flush)
+        return await future
+
+    def flush(self):
+        """
+        Predicts the waiting requests.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        rows, futures = self._rows, self._futures
+        self._rows, self._futures = [], []
+        if not rows:
+            return
+        predictions = self.model.predict(np.array(rows, dtype=np.float64))
+        self.batches += 1
+        self.predictions += len(rows)
+        for future, prediction in zip(futures, predictions.tolist()):
+            if not future.done():
+                future.set_result(prediction)
+
+def train(data_dir : str = DATA_DIR, directory : str = DEFAULT_MODELS_DIR) -> LinearModel:
+    """
+    Trains a model on the races dataset and saves it as a new version.
+    Args:
+        data_dir (str): Directory of the datasets. Defaults to "data".
+        directory (str): Directory of the models. Defaults to data/models.
+    Returns:
+        LinearModel: The saved model.
+    """
+    model = train_model(load_dataset("races", data_dir))
+    ModelRegistry(directory).save(model)
+    return model
+
+def run(args : argparse.Namespace):
+    """
+    Runs a command of the command line : trains a new version, serves one, or prints the
+    prediction of a single race.
+    Args:
+        args (argparse.Namespace): command, directories, served version, server settings and
+            features, see the arguments below.
+    Raises:
+        ValueError: If a feature is not given as NAME=VALUE.
+    """
+    if args.command == "train":
+        trained = train(args.data_dir, args.models_dir)
+        print(
+            f"Trained {trained.target} model v{trained.version} on {trained.rows} races"
+            f" (RMSE {trained.rmse:.3f})"
+        )
+        return
+    model = ModelRegistry(args.models_dir).load(args.version)
+    if args.command == "estimate":
+        features = dict(feature.split("=", 1) for feature in args.feature or ())
+        prediction = float(model.predict(np.array([model.row(features)]))[0])
+        print(f"{model.target} : {prediction:.3f} (model v{model.version})")
+        return
+    # The server is only imported to serve, the other commands start without aiohttp
+    from src.serving import make_app # pylint: disable=import-outside-toplevel
+    from aiohttp import web # pylint: disable=import-outside-toplevel
+    print(f"Serving {model.target} model v{model.version}")
+    web.run_app(
+        make_app(MicroBatcher(model, max_delay=args.max_delay)),
+        host=args.host, port=args.port, access_log=None
+    )
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("command", choices=("train", "serve", "estimate"))
+    arg_parser.add_argument("--data-dir", default=DATA_DIR)
+    arg_parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR)
+    arg_parser.add_argument("--version", type=int, help="model to use, defaults to the latest")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument("--max-delay", type=float, default=0.0, help="seconds")
+    arg_parser.add_argument(
+        "--feature", action="append", metavar="NAME=VALUE",
+        help="feature of the race to estimate, repeatable"
+    )
+    run(arg_parser.parse_args())
@@ -0,0 +1,406 @@
+"""
+Query engine : riders, races and results mapped to dense integer ids, with CSR indexes of the
+results of each rider and of each race, and races sorted by date, distance and class, all saved
+as memory-mapped NumPy arrays so that queries start without parsing any CSV.
+
+    python -m src.query build
+    python -m src.query results --rider affini --min-distance 30 --min-climb 300
+    python -m src.query races --class 2.UWT --top 10 --by winner_speed
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from src.constants import DATA_DIR, DEFAULT_INDEX_DIR, RESULTS_PATH
+from src.dataset import load_dataset
+
+META_FILE = "meta.json"
+RACE_COLUMNS = [
+    "distance", "vertical_meters", "startlist_quality", "profile_score", "winner_time",
+    "winner_speed"
+]
+RESULT_COLUMNS = ["result", "pnt", "seconds_lost"]
+
+def _floats(series : pd.Series) -> np.ndarray:
+    return pd.to_numeric(series, errors="coerce").to_numpy(np.float64, na_value=np.nan)
+
+def _strings(series : pd.Series) -> np.ndarray:
+    # Fixed width unicode, which memory-maps unlike Python strings
+    return series.fillna("").astype(str).to_numpy().astype(np.str_)
+
+def _csr(keys : np.ndarray, count : int, order : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Groups row numbers by key.
+    Args:
+        keys (np.ndarray): Key of each row, in [0, count).
+        count (int): Number of keys.
+        order (np.ndarray): Row numbers sorted by key, then in the order wanted within a key.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Offsets, the rows of key k being rows[offsets[k]:
+            offsets[k + 1]], and the rows.
+    """
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=count), out=offsets[1:])
+    return offsets, order.astype(np.int32)
+
+def build_index(
+    riders : pd.DataFrame,
+    results : pd.DataFrame,
+    races : pd.DataFrame,
+    directory : str = DEFAULT_INDEX_DIR
+    ) -> Dict:
+    """
+    Builds and saves the index of the datasets, replacing the previous one.
+    Args:
+        riders (pd.DataFrame): Riders.
+        results (pd.DataFrame): Results.
+        races (pd.DataFrame): Races.
+        directory (str): Directory of the index, created if needed. Defaults to data/index.
+    Returns:
+        Dict: Metadata of the index.
+    """
+    # Riders and races only known from a result get an id too
+    profile_urls = results["rider_url"].astype(str).str.removesuffix(RESULTS_PATH)
+    rider_urls = pd.Index(riders["url"].astype(str)).append(pd.Index(profile_urls)).unique()
+    race_urls = pd.Index(races["url"].astype(str)).append(
+        pd.Index(results["race_url"].astype(str))
+    ).unique()
+    riders = riders.assign(url=riders["url"].astype(str)).drop_duplicates("url") \
+        .set_index("url").reindex(rider_urls)
+    races = races.assign(url=races["url"].astype(str)).drop_duplicates("url") \
+        .set_index("url").reindex(race_urls)
+    result_rider = rider_urls.get_indexer(profile_urls).astype(np.int32)
+    result_race = race_urls.get_indexer(results["race_url"].astype(str)).astype(np.int32)
+
+    race_class = pd.Categorical(races["class"].astype(object))
+    classes = [str(name) for name in race_class.categories]
+    arrays = {
+        "rider_url" : _strings(pd.Series(rider_urls)),
+        "rider_name" : _strings(riders["full_name"]),
+        "race_url" : _strings(pd.Series(race_urls)),
+        "race_title" : _strings(races["race_title"]),
+        "race_date" : pd.to_datetime(races["date"]).to_numpy("datetime64[D]"),
+        "race_class" : race_class.codes.astype(np.int16),
+        "result_rider" : result_rider,
+        "result_race" : result_race,
+    }
+    arrays.update({f"race_{column}" : _floats(races[column]) for column in RACE_COLUMNS})
+    arrays.update({
+        f"result_{column}" : _floats(results[column]) for column in RESULT_COLUMNS
+    })
+
+    # Results of a rider from the latest race, results of a race by rank (unranked last)
+    date_of_result = arrays["race_date"][result_race]
+    latest_first = np.where(
+        np.isnat(date_of_result), np.iinfo(np.int64).max, -date_of_result.astype(np.int64)
+    )
+    arrays["rider_offsets"], arrays["rider_results"] = _csr(
+        result_rider, len(rider_urls), np.lexsort((latest_first, result_rider))
+    )
+    arrays["race_offsets"], arrays["race_results"] = _csr(
+        result_race, len(race_urls), np.lexsort((arrays["result_result"], result_race))
+    )
+    # Races sorted by date and by distance (unknown last), and grouped by class
+    arrays["races_by_date"] = np.argsort(arrays["race_date"], kind="stable").astype(np.int32)
+    arrays["races_by_distance"] = np.argsort(
+        arrays["race_distance"], kind="stable"
+    ).astype(np.int32)
+    known = np.flatnonzero(arrays["race_class"] >= 0)
+    arrays["class_offsets"], arrays["class_races"] = _csr(
+        arrays["race_class"][known], len(classes),
+        known[np.argsort(arrays["race_class"][known], kind="stable")]
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    # The metadata is written last : an index without it is incomplete
+    meta_path = os.path.join(directory, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    meta = {
+        "riders" : len(rider_urls),
+        "races" : len(race_urls),
+        "results" : len(results),
+        "classes" : classes,
+        "arrays" : sorted(arrays),
+        "built_at" : datetime.now(timezone.utc).isoformat(timespec="seconds")
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+def _top(ids : np.ndarray, values : np.ndarray, k : int, ascending : bool) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: The k ids with the smallest (ascending) or largest values, in order, the
+            unknown values being left out.
+    """
+    ids = ids[~np.isnan(values)]
+    values = values[~np.isnan(values)]
+    keys = values if ascending else -values
+    if k < len(ids):
+        part = np.argpartition(keys, k)[:k]
+        ids, keys = ids[part], keys[part]
+    return ids[np.argsort(keys, kind="stable")]
+
+class QueryEngine:
+    """
+    Read-only queries over a saved index, its arrays being memory-mapped : opening it reads no
+    data, queries only touch the pages they need.
+    """
+
+    def __init__(self, directory : str = DEFAULT_INDEX_DIR):
+        """
+        Args:
+            directory (str): Directory of the index. Defaults to data/index.
+        Raises:
+            FileNotFoundError: If no complete index is saved there.
+        """
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.classes : List[str] = self.meta["classes"]
+        self.arrays = {
+            name : np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in self.meta["arrays"]
+        }
+
+    def __getitem__(self, name : str) -> np.ndarray:
+        return self.arrays[name]
+
+    def find_riders(self, query : str) -> np.ndarray:
+        """
+        Args:
+            query (str): Profile URL of a rider, or part of a name, case insensitive.
+        Returns:
+            np.ndarray: Ids of the matching riders.
+        """
+        exact = np.flatnonzero(self["rider_url"] == query.removesuffix(RESULTS_PATH))
+        if len(exact):
+            return exact
+        return np.flatnonzero(np.char.find(np.char.lower(self["rider_name"]), query.lower()) >= 0)
+
+    def find_races(
+        self,
+        since : Optional[str] = None,
+        until : Optional[str] = None,
+        min_distance : Optional[float] = None,
+        max_distance : Optional[float] = None,
+        min_climb : Optional[float] = None,
+        max_climb : Optional[float] = None,
+        classes : Optional[Iterable[str]] = None
+        ) -> np.ndarray:
+        """
+        Races matching every given filter, bounds included.
+        Args:
+            since (str, optional): First date, YYYY-MM-DD.
+            until (str, optional): Last date, YYYY-MM-DD.
+            min_distance (float, optional): Shortest distance in km.
+            max_distance (float, optional): Longest distance in km.
+            min_climb (float, optional): Least vertical meters.
+            max_climb (float, optional): Most vertical meters.
+            classes (Iterable[str], optional): Classes, e.g. ["2.UWT", "WC"].
+        Returns:
+            np.ndarray: Ids of the races, sorted.
+        """
+        selections = []
+        if since is not None or until is not None:
+            order = self["races_by_date"]
+            dates = self["race_date"][order]
+            low = np.searchsorted(dates, np.datetime64(since, "D")) if since else 0
+            high = np.searchsorted(dates, np.datetime64(until, "D"), "right") if until \
+                else np.searchsorted(dates, np.datetime64("NaT", "D"))
+            selections.append(order[low:high])
+        if min_distance is not None or max_distance is not None:
+            order = self["races_by_distance"]
+            distances = self["race_distance"][order]
+            low = np.searchsorted(distances, min_distance) if min_distance is not None else 0
+            high = np.searchsorted(
+                distances, max_distance if max_distance is not None else np.inf, "right"
+            )
+            selections.append(order[low:high])
+        if classes is not None:
+            offsets = self["class_offsets"]
+            codes = [self.classes.index(name) for name in classes if name in self.classes]
+            selections.append(np.concatenate([np.empty(0, dtype=np.int32)] + [
+                self["class_races"][offsets[code]:offsets[code + 1]] for code in codes
+            ]))
+
+        ids = np.arange(self.meta["races"], dtype=np.int32)
+        for selection in selections:
+            ids = np.intersect1d(ids, selection)
+        if min_climb is not None or max_climb is not None:
+            climb = self["race_vertical_meters"][ids]
+            keep = np.ones(len(ids), dtype=bool)
+            if min_climb is not None:
+                keep &= climb >= min_climb
+            if max_climb is not None:
+                keep &= climb <= max_climb
+            ids = ids[keep]
+        return ids
+
+    def find_results(self, rider : Optional[str] = None, **race_filters) -> np.ndarray:
+        """
+        Results of a rider, of races, or both.
+        Args:
+            rider (str, optional): See find_riders. Defaults to every rider.
+            **race_filters: See find_races. Defaults to every race.
+        Returns:
+            np.ndarray: Row numbers of the results, latest race first for a rider, by race and
+                rank otherwise.
+        """
+        races = self.find_races(**race_filters) if any(
+            value is not None for value in race_filters.values()
+        ) else None
+        if rider is not None:
+            offsets, rows = self["rider_offsets"], self["rider_results"]
+            ids = self.find_riders(rider)
+        elif races is not None:
+            offsets, rows = self["race_offsets"], self["race_results"]
+            ids, races = races, None
+        else:
+            return np.asarray(self["race_results"])
+        found = np.concatenate([np.empty(0, dtype=np.int32)] + [
+            rows[offsets[i]:offsets[i + 1]] for i in ids
+        ])
+        if races is not None:
+            found = found[np.isin(self["result_race"][found], races)]
+        return found
+
+    def races_frame(self, ids : np.ndarray) -> pd.DataFrame:
+        """
+        Args:
+            ids (np.ndarray): Race ids.
+        Returns:
+            pd.DataFrame: The races, with their number of results.
+        """
+        offsets = self["race_offsets"]
+        return pd.DataFrame({
+            "race" : self["race_title"][ids],
+            "date" : self["race_date"][ids],
+            "class" : self._class_names(self["race_class"][ids]),
+            **{column : self[f"race_{column}"][ids] for column in RACE_COLUMNS},
+            "results" : offsets[ids + 1] - offsets[ids],
+            "url" : self["race_url"][ids]
+        })
+
+    def results_frame(self, rows : np.ndarray) -> pd.DataFrame:
+        """
+        Args:
+            rows (np.ndarray): Result row numbers.
+        Returns:
+            pd.DataFrame: The results joined with their rider and race, with the rider's speed.
+        """
+        riders, races = self["result_rider"][rows], self["result_race"][rows]
+        distance = self["race_distance"][races]
+        seconds_lost = self["result_seconds_lost"][rows]
+        rider_time = self["race_winner_time"][races] + seconds_lost
+        with np.errstate(divide="ignore", invalid="ignore"):
+            speed = np.where(rider_time > 0, 3600 * distance / rider_time, np.nan)
+        return pd.DataFrame({
+            "rider" : self["rider_name"][riders],
+            "race" : self["race_title"][races],
+            "date" : self["race_date"][races],
+            "class" : self._class_names(self["race_class"][races]),
+            "distance" : distance,
+            "vertical_meters" : self["race_vertical_meters"][races],
+            "result" : self["result_result"][rows],
+            "seconds_lost" : seconds_lost,
+            "speed" : speed.round(3)
+        })
+
+    def _class_names(self, codes : np.ndarray) -> pd.Categorical:
+        return pd.Categorical.from_codes(np.asarray(codes), categories=self.classes)
+
+    def top_races(self, ids : np.ndarray, by : str, k : int, ascending : bool = False):
+        """
+        Args:
+            ids (np.ndarray): Race ids.
+            by (str): One of RACE_COLUMNS.
+            k (int): Number of races kept.
+            ascending (bool): Whether to keep the smallest values. Defaults to False.
+        Returns:
+            np.ndarray: Ids of the k races with the largest (or smallest) values, in order.
+        """
+        return _top(ids, self[f"race_{by}"][ids], k, ascending)
+
+    def top_results(self, rows : np.ndarray, by : str, k : int, ascending : bool = False):
+        """
+        Args:
+            rows (np.ndarray): Result row numbers.
+            by (str): One of RESULT_COLUMNS, or "speed".
+            k (int): Number of results kept.
+            ascending (bool): Whether to keep the smallest values. Defaults to False.
+        Returns:
+            np.ndarray: Row numbers of the k results with the largest (or smallest) values, in
+                order.
+        """
+        values = self.results_frame(rows)["speed"].to_numpy() if by == "speed" \
+            else self[f"result_{by}"][rows]
+        return _top(rows, values, k, ascending)
+
+def _race_filters(args : argparse.Namespace) -> Dict:
+    return {
+        "since" : args.since, "until" : args.until, "min_distance" : args.min_distance,
+        "max_distance" : args.max_distance, "min_climb" : args.min_climb,
+        "max_climb" : args.max_climb, "classes" : args.classes
+    }
+
+def run(args : argparse.Namespace):
+    """
+    Runs a command of the command line : builds the index, or prints the races or results found
+    and the time the query took.
+    Args:
+        args (argparse.Namespace): command, directories, filters and ranking, see the arguments
+            below.
+    """
+    start = time.perf_counter()
+    if args.command == "build":
+        dataset = load_dataset(data_dir=args.data_dir)
+        built = build_index(
+            dataset["riders"], dataset["results"], dataset["races"], args.index_dir
+        )
+        print(
+            f"Indexed {built['riders']} riders, {built['races']} races and {built['results']}"
+            f" results in {args.index_dir}"
+        )
+    else:
+        engine = QueryEngine(args.index_dir)
+        if args.command == "races":
+            found = engine.find_races(**_race_filters(args))
+            if args.top:
+                found = engine.top_races(
+                    found, args.by or "winner_speed", args.top, args.ascending
+                )
+            frame = engine.races_frame(found)
+        else:
+            found = engine.find_results(args.rider, **_race_filters(args))
+            if args.top:
+                found = engine.top_results(found, args.by or "speed", args.top, args.ascending)
+            frame = engine.results_frame(found)
+        with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+            print(frame.drop(columns="url", errors="ignore").to_string(index=False))
+    print(f"\n{time.perf_counter() - start:.3f} s")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("command", choices=("build", "results", "races"))
+    arg_parser.add_argument("--data-dir", default=DATA_DIR)
+    arg_parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    arg_parser.add_argument("--rider", help="part of a name, or a profile URL")
+    arg_parser.add_argument("--since", help="YYYY-MM-DD")
+    arg_parser.add_argument("--until", help="YYYY-MM-DD")
+    arg_parser.add_argument("--min-distance", type=float, help="km")
+    arg_parser.add_argument("--max-distance", type=float, help="km")
+    arg_parser.add_argument("--min-climb", type=float, help="vertical meters")
+    arg_parser.add_argument("--max-climb", type=float, help="vertical meters")
+    arg_parser.add_argument("--class", dest="classes", action="append", help="repeatable")
+    arg_parser.add_argument("--top", type=int, help="keep the k best rows")
+    arg_parser.add_argument("--by", help="column ranking the rows for --top")
+    arg_parser.add_argument("--ascending", action="store_true", help="smallest values first")
+    run(arg_parser.parse_args())
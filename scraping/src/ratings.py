@@ -0,0 +1,375 @@
+"""
+Rider ratings : an Elo rating per rider, updated race by race in date order from the time trial
+results, every pair of riders of a race being compared at once with NumPy.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from src.dataset import DATA_DIR
+from src.features import read_table, table_path, write_table
+from src.constants import RESULTS_PATH
+
+DEFAULT_RATINGS_DIR = os.path.join(DATA_DIR, "ratings")
+TABLES = ("riders", "races", "history")
+
+@dataclass
+class RatingConfig:
+    """
+    Settings of the ratings.
+    Attributes:
+        initial (float): Rating of a rider's first race.
+        k (float): Largest change of a rating in a single race.
+        scale (float): Rating difference for which the better rider is expected to beat the
+            other one 10 times out of 11.
+        settle (float): Number of races after which a rating moves 1/sqrt(2) as much as a new
+            rider's, whose rating is still uncertain.
+        min_factor (float): Lowest share of k a settled rider's rating moves by.
+        quality_reference (float): Startlist quality of a race counting fully. Lower quality
+            races count less, on a log scale.
+        full_distance (float): Distance in km of a race counting fully. Shorter ones (prologues)
+            count less.
+        min_weight (float): Lowest weight of a race, also the weight of an unknown quality.
+    """
+    initial : float = 1500.0
+    k : float = 32.0
+    scale : float = 400.0
+    settle : float = 10.0
+    min_factor : float = 0.4
+    quality_reference : float = 1000.0
+    full_distance : float = 20.0
+    min_weight : float = 0.25
+
+    def race_weight(self, quality : float, distance : float) -> float:
+        """
+        Args:
+            quality (float): Startlist quality of the race, NaN if unknown.
+            distance (float): Distance of the race in km, NaN if unknown.
+        Returns:
+            float: Share of k the ratings move by in this race.
+        """
+        # NaN != NaN
+        if quality == quality:
+            weight = np.log1p(max(quality, 0.0)) / np.log1p(self.quality_reference)
+        else:
+            weight = self.min_weight
+        if distance == distance:
+            weight *= min(distance / self.full_distance, 1.0)
+        return float(np.clip(weight, self.min_weight, 1.0))
+
+def rate_race(
+    ratings : np.ndarray,
+    ranks : np.ndarray,
+    races : np.ndarray,
+    weight : float = 1.0,
+    config : Optional[RatingConfig] = None
+    ) -> np.ndarray:
+    """
+    Elo update of the riders of a race, each one being compared with every other one.
+    Args:
+        ratings (np.ndarray): Ratings of the riders before the race.
+        ranks (np.ndarray): Their ranks, equal ranks are draws.
+        races (np.ndarray): Number of races they were rated in before this one.
+        weight (float): Weight of the race, see RatingConfig.race_weight. Defaults to 1.
+        config (RatingConfig, optional): Settings. Defaults to RatingConfig().
+    Returns:
+        np.ndarray: Change of each rating.
+    """
+    config = config or RatingConfig()
+    n = len(ratings)
+    if n < 2:
+        return np.zeros(n)
+    # expected[i, j] : probability that i beats j, the diagonal cancels out (0.5 - 0.5)
+    expected = 1 / (1 + 10 ** ((ratings[None, :] - ratings[:, None]) / config.scale))
+    score = (ranks[:, None] < ranks[None, :]) + 0.5 * (ranks[:, None] == ranks[None, :])
+    factor = np.maximum(np.sqrt(config.settle / (config.settle + races)), config.min_factor)
+    return config.k * weight * factor * (score - expected).sum(axis=1) / (n - 1)
+
+class RatingEngine:
+    """
+    Ratings of every rider, with their history.
+
+    Races are rated in date order : applying new races only rates these ones, starting from
+    the saved ratings, unless one of them is older than the rated races or a rated race got new
+    results, in which case the history is replayed from that race on, see apply.
+    """
+
+    def __init__(
+        self,
+        config : Optional[RatingConfig] = None,
+        riders : Optional[pd.DataFrame] = None,
+        races : Optional[pd.DataFrame] = None,
+        history : Optional[pd.DataFrame] = None
+        ):
+        """
+        Args:
+            config (RatingConfig, optional): Settings. Defaults to RatingConfig().
+            riders (pd.DataFrame, optional): url, rating and races of each rider, by rider id.
+            races (pd.DataFrame, optional): url and date of each rated race, by race id, in the
+                order they were rated.
+            history (pd.DataFrame, optional): rider_id, race_id, rating (after the race) and
+                change of each rating update.
+            Defaults to no rating.
+        """
+        self.config = config or RatingConfig()
+        riders = riders if riders is not None else pd.DataFrame(
+            {"url" : [], "rating" : [], "races" : []}
+        )
+        races = races if races is not None else pd.DataFrame(
+            {"url" : pd.Series(dtype="str"), "date" : pd.Series(dtype="datetime64[ns]")}
+        )
+        self.rider_urls : List[str] = riders["url"].tolist()
+        self.rider_ids : Dict[str, int] = {url : i for i, url in enumerate(self.rider_urls)}
+        self.ratings = riders["rating"].to_numpy(np.float64, copy=True)
+        self.races = riders["races"].to_numpy(np.int32, copy=True)
+        self.race_urls : List[str] = races["url"].tolist()
+        self.race_dates : List[pd.Timestamp] = list(pd.to_datetime(races["date"]))
+        self.rated = set(self.race_urls)
+        self._history = history if history is not None else pd.DataFrame({
+            "rider_id" : pd.Series(dtype=np.int32), "race_id" : pd.Series(dtype=np.int32),
+            "rating" : pd.Series(dtype=np.float64), "change" : pd.Series(dtype=np.float64)
+        })
+        self._pending : List[pd.DataFrame] = []
+
+    @classmethod
+    def load(
+        cls,
+        directory : str = DEFAULT_RATINGS_DIR,
+        config : Optional[RatingConfig] = None
+        ) -> "RatingEngine":
+        """
+        Loads saved ratings.
+        Args:
+            directory (str): Directory of the ratings. Defaults to data/ratings.
+            config (RatingConfig, optional): Settings. Defaults to RatingConfig().
+        Returns:
+            RatingEngine: The ratings.
+        Raises:
+            FileNotFoundError: If no ratings are saved there.
+        """
+        return cls(config, *(read_table(table_path(directory, table)) for table in TABLES))
+
+    def save(self, directory : str = DEFAULT_RATINGS_DIR):
+        """
+        Saves the ratings, one file per table.
+        Args:
+            directory (str): Directory of the ratings, created if needed. Defaults to
+                data/ratings.
+        """
+        os.makedirs(directory, exist_ok=True)
+        tables = {
+            "riders" : pd.DataFrame({
+                "url" : pd.Series(self.rider_urls, dtype="str"), "rating" : self.ratings,
+                "races" : self.races
+            }),
+            "races" : pd.DataFrame({
+                "url" : pd.Series(self.race_urls, dtype="str"),
+                "date" : pd.Series(self.race_dates, dtype="datetime64[ns]")
+            }),
+            "history" : self.history_table()
+        }
+        for table, df in tables.items():
+            write_table(df, table_path(directory, table))
+
+    def _ids(self, urls : pd.Series) -> np.ndarray:
+        ids = np.empty(len(urls), dtype=np.int32)
+        for i, url in enumerate(urls):
+            rider_id = self.rider_ids.get(url)
+            if rider_id is None:
+                rider_id = self.rider_ids[url] = len(self.rider_urls)
+                self.rider_urls.append(url)
+            ids[i] = rider_id
+        new = len(self.rider_urls) - len(self.ratings)
+        if new:
+            self.ratings = np.concatenate([self.ratings, np.full(new, self.config.initial)])
+            self.races = np.concatenate([self.races, np.zeros(new, dtype=np.int32)])
+        return ids
+
+    def _position(self, start : Tuple[pd.Timestamp, str]) -> int:
+        """
+        Returns:
+            int: Position of the first rated race not before start, a (date, url) key.
+        """
+        return next((
+            i for i, key in enumerate(zip(self.race_dates, self.race_urls)) if key >= start
+        ), len(self.race_urls))
+
+    def _rewind(self, position : int):
+        """
+        Undoes the ratings of the races rated from position on, so that they can be rated again
+        after an older race.
+        """
+        undone = self.race_urls[position:]
+        history = self.history_table()
+        kept = history[history["race_id"] < position]
+        # The history is in rating order : a rider's last kept row holds its rating then
+        by_rider = kept.groupby("rider_id")
+        last = by_rider["rating"].last()
+        counts = by_rider.size()
+        self.ratings[:] = self.config.initial
+        self.ratings[last.index.to_numpy()] = last.to_numpy()
+        self.races[:] = 0
+        self.races[counts.index.to_numpy()] = counts.to_numpy()
+        self._history = kept.reset_index(drop=True)
+        del self.race_urls[position:]
+        del self.race_dates[position:]
+        self.rated.difference_update(undone)
+
+    def _replay_start(
+        self,
+        races : pd.DataFrame,
+        counts : pd.Series
+        ) -> Optional[Tuple[pd.Timestamp, str]]:
+        """
+        Returns:
+            Tuple[pd.Timestamp, str]: (date, url) of the first new race, or of the first rated
+                race with new results if it is older. None if there is neither.
+        """
+        new = races[~races["url"].isin(self.rated) & races["url"].isin(counts.index)]
+        starts = [min(zip(new["date"], new["url"]))] if not new.empty else []
+        # Rated races with more results than they were rated with, e.g. the top 20 of a rider
+        # strategy crawl completed by the full table of a race strategy crawl
+        history = self.history_table()
+        rated_counts = np.bincount(history["race_id"], minlength=len(self.race_urls))
+        dates = dict(zip(races["url"], races["date"]))
+        starts.extend(
+            (dates[url], url) for url, rated in zip(self.race_urls, rated_counts)
+            if counts.get(url, 0) > rated and url in dates
+        )
+        return min(starts) if starts else None
+
+    def apply(self, results : pd.DataFrame, races : pd.DataFrame) -> int:
+        """
+        Rates the races not rated yet, in date order.
+
+        If a new race is older than the last rated one (a backfill, or races crawled with
+        another strategy), or a rated race has more results than it was rated with, the races
+        from that one on are rated again in date order, from the ratings at the time. Their
+        results must then be given too, or the new races are only rated after the others, with
+        a warning.
+        Args:
+            results (pd.DataFrame): Results, at least those of the new races.
+            races (pd.DataFrame): Races, the ones already rated are skipped.
+        Returns:
+            int: Number of races rated, those rated again included.
+        """
+        races = races.assign(date=pd.to_datetime(races["date"]))
+        results = results[results["result"].notna()]
+        counts = results["race_url"].astype(str).value_counts()
+        start = self._replay_start(races, counts)
+        position = self._position(start) if start is not None else len(self.race_urls)
+        if position < len(self.race_urls):
+            given = set(races["url"]) & set(counts.index)
+            missing = [url for url in self.race_urls[position:] if url not in given]
+            if missing:
+                warnings.warn(
+                    f"{len(missing)} rated races to rate again are missing from the given data,"
+                    " the new races are rated after the others : rebuild the ratings from every"
+                    " race to rate them in date order",
+                    stacklevel=2
+                )
+            else:
+                self._rewind(position)
+        races = races[~races["url"].isin(self.rated)].sort_values(["date", "url"])
+        results = results[results["race_url"].isin(races["url"])]
+        by_race = results.groupby(results["race_url"].astype(str)).indices
+        rider_ids = self._ids(
+            results["rider_url"].astype(str).str.removesuffix(RESULTS_PATH)
+        )
+        ranks = results["result"].to_numpy(np.float64, na_value=np.nan)
+
+        weights = [
+            self.config.race_weight(quality, distance) for quality, distance in zip(
+                races["startlist_quality"].to_numpy(np.float64, na_value=np.nan),
+                races["distance"].to_numpy(np.float64, na_value=np.nan)
+            )
+        ]
+
+        rated = 0
+        for url, date, weight in zip(races["url"], races["date"], weights):
+            positions = by_race.get(url)
+            # A race is rated once : it waits for its results
+            if positions is None:
+                continue
+            ids = rider_ids[positions]
+            change = rate_race(
+                self.ratings[ids], ranks[positions], self.races[ids], weight, self.config
+            )
+            self.ratings[ids] += change
+            self.races[ids] += 1
+            self._pending.append(pd.DataFrame({
+                "rider_id" : ids, "race_id" : np.int32(len(self.race_urls)),
+                "rating" : self.ratings[ids], "change" : change
+            }))
+            self.race_urls.append(url)
+            self.race_dates.append(date)
+            self.rated.add(url)
+            rated += 1
+        return rated
+
+    def history_table(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: rider_id, race_id, rating (after the race) and change of each rating
+                update, in the order races were rated.
+        """
+        if self._pending:
+            self._history = pd.concat([self._history, *self._pending], ignore_index=True)
+            self._pending = []
+        return self._history
+
+    def ratings_table(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: url, rating and number of rated races of each rider, best first.
+        """
+        return pd.DataFrame({
+            "url" : self.rider_urls, "rating" : self.ratings, "races" : self.races
+        }).sort_values("rating", ascending=False, ignore_index=True)
+
+    def history(self, rider_url : str) -> pd.DataFrame:
+        """
+        Rating history of a rider.
+        Args:
+            rider_url (str): URL of the rider's profile (or of its results page).
+        Returns:
+            pd.DataFrame: date, race_url, rating after the race and change, one row per rated
+                race of the rider. Empty if the rider was never rated.
+        """
+        rider_id = self.rider_ids.get(rider_url.removesuffix(RESULTS_PATH), -1)
+        history = self.history_table()
+        rows = history[history["rider_id"] == rider_id]
+        race_ids = rows["race_id"].to_numpy()
+        return pd.DataFrame({
+            "date" : pd.Series([self.race_dates[i] for i in race_ids], dtype="datetime64[ns]"),
+            "race_url" : pd.Series([self.race_urls[i] for i in race_ids], dtype="str"),
+            "rating" : rows["rating"].to_numpy(),
+            "change" : rows["change"].to_numpy()
+        })
+
+def refresh_ratings(
+    results : pd.DataFrame,
+    races : pd.DataFrame,
+    directory : str = DEFAULT_RATINGS_DIR,
+    config : Optional[RatingConfig] = None
+    ) -> Tuple[RatingEngine, int]:
+    """
+    Rates the races not rated yet, starting from the saved ratings if any, and saves them.
+    Args:
+        results (pd.DataFrame): Results.
+        races (pd.DataFrame): Races.
+        directory (str): Directory of the ratings. Defaults to data/ratings.
+        config (RatingConfig, optional): Settings. Defaults to RatingConfig().
+    Returns:
+        Tuple[RatingEngine, int]: The ratings and the number of races rated.
+    """
+    try:
+        engine = RatingEngine.load(directory, config)
+    except FileNotFoundError:
+        engine = RatingEngine(config)
+    rated = engine.apply(results, races)
+    engine.save(directory)
+    return engine, rated
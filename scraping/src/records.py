@@ -0,0 +1,135 @@
+"""
+Columnar record builders : the crawl appends its riders, results and races into typed column
+buffers instead of keeping one dict per row, and hands them to pandas without a per-row copy.
+"""
+
+from array import array
+from typing import Dict, Iterable
+import numpy as np
+import pandas as pd
+from src.conversion import RAW_COLUMNS
+from src.dataset import SCHEMAS
+
+# "number" : int64 buffer, turned into a float64 buffer (NaN for None) at the first float or
+# missing value, like pandas infers the dtype of Python values
+# "category" : int32 codes into a table of the distinct strings, for the repeated ones
+# "object" : plain list, for the unique strings and the raw values
+KINDS = ("number", "category", "object")
+
+def _kind(dtype : str) -> str:
+    if dtype == "category":
+        return "category"
+    if dtype.startswith(("Int", "float")):
+        return "number"
+    return "object"
+
+class RecordBuilder:
+    """
+    Column buffers of a table, filled one record at a time.
+    """
+
+    def __init__(self, columns : Dict[str, str]):
+        """
+        Args:
+            columns (Dict[str, str]): Column name -> kind, see KINDS. Fields of the records
+                that are not declared are not kept.
+        """
+        for name, kind in columns.items():
+            if kind not in KINDS:
+                raise ValueError(f"Unknown kind {kind} of column {name}, expected one of {KINDS}")
+        self.columns = dict(columns)
+        self._buffers = {}
+        self._categories : Dict[str, Dict[str, int]] = {}
+        for name, kind in self.columns.items():
+            if kind == "number":
+                self._buffers[name] = array("q")
+            elif kind == "category":
+                self._buffers[name] = array("i")
+                self._categories[name] = {}
+            else:
+                self._buffers[name] = []
+        self._length = 0
+
+    @classmethod
+    def for_table(cls, table : str, raw : bool = False) -> "RecordBuilder":
+        """
+        Builder of a dataset, with the columns and kinds of its schema, see src.dataset.
+        Args:
+            table (str): "riders", "results" or "races".
+            raw (bool): If True, the columns left as raw strings by the parsers are plain
+                columns, see src.conversion. Defaults to False.
+        Returns:
+            RecordBuilder: Empty builder.
+        """
+        raw_columns = RAW_COLUMNS.get(table, ()) if raw else ()
+        return cls({
+            name : "object" if name in raw_columns else _kind(dtype)
+            for name, dtype in SCHEMAS[table].items()
+        })
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, record : Dict):
+        """
+        Appends a record, its missing fields are None.
+        Args:
+            record (Dict): Field name -> value.
+        """
+        for name, kind in self.columns.items():
+            value = record.get(name)
+            buffer = self._buffers[name]
+            if kind == "object":
+                buffer.append(value)
+            elif kind == "category":
+                if value is None:
+                    buffer.append(-1)
+                else:
+                    categories = self._categories[name]
+                    buffer.append(categories.setdefault(value, len(categories)))
+            elif buffer.typecode == "q" and isinstance(value, int):
+                buffer.append(value)
+            else:
+                if buffer.typecode == "q":
+                    buffer = self._buffers[name] = array("d", buffer)
+                buffer.append(np.nan if value is None else value)
+        self._length += 1
+
+    def extend(self, records : Iterable[Dict]):
+        """
+        Appends several records.
+        """
+        for record in records:
+            self.append(record)
+
+    def _series(self, name : str) -> pd.Series:
+        kind = self.columns[name]
+        buffer = self._buffers[name]
+        if kind == "object":
+            return pd.Series(buffer)
+        if kind == "category":
+            # Categories are sorted so that sorting the column sorts the strings
+            categories = np.array(list(self._categories[name]), dtype=object)
+            order = np.argsort(categories)
+            remap = np.empty(len(order) + 1, dtype=np.int32)
+            remap[order] = np.arange(len(order), dtype=np.int32)
+            remap[-1] = -1
+            codes = remap[np.frombuffer(buffer, dtype=np.int32)] if len(buffer) else []
+            return pd.Series(pd.Categorical.from_codes(codes, categories=categories[order]))
+        if buffer.typecode == "q":
+            return pd.Series(np.frombuffer(buffer, dtype=np.int64), copy=False)
+        values = np.frombuffer(buffer, dtype=np.float64)
+        if np.isnan(values).all():
+            return pd.Series([None] * len(values), dtype=object)
+        return pd.Series(values, copy=False)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Hands the columns to pandas. The number columns share their buffer with the frame, so
+        the builder can't grow anymore.
+        Returns:
+            pd.DataFrame: One row per record, one column per declared column.
+        """
+        return pd.DataFrame(
+            {name : self._series(name) for name in self.columns}, copy=False
+        )
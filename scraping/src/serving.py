@@ -0,0 +1,70 @@
+"""
+HTTP endpoint of the winner speed prediction service, see src.prediction : concurrent requests
+are grouped into single vectorized predictions by a MicroBatcher.
+
+    python -m src.prediction serve --port 8081
+    curl -d '{"distance": 30, "vertical_meters": 200, "startlist_quality": 900,
+        "profile_score": 15}' http://127.0.0.1:8081/predict
+"""
+
+import numpy as np
+from aiohttp import web
+from src.prediction import LinearModel, MicroBatcher
+
+BATCHER = web.AppKey("batcher", MicroBatcher)
+
+def make_app(batcher : MicroBatcher) -> web.Application:
+    """
+    Endpoints :
+        POST /predict with the features of a race as a JSON object gives {"prediction": ...},
+            with {"rows": [...]} a list of them gives {"predictions": [...]}
+        GET /model gives the served model
+    Args:
+        batcher (MicroBatcher): Batcher of the served model.
+    Returns:
+        web.Application: The prediction server.
+    """
+    async def predict(request : web.Request) -> web.Response:
+        try:
+            body = await request.json()
+            if "rows" in body:
+                predictions = batcher.model.predict(np.array(
+                    [batcher.model.row(row) for row in body["rows"]], dtype=np.float64
+                ).reshape(-1, len(batcher.model.features)))
+                result = {"predictions" : predictions.tolist()}
+            else:
+                result = {"prediction" : await batcher.predict(body)}
+        except (ValueError, TypeError, KeyError) as error:
+            return web.json_response({"error" : f"{type(error).__name__}: {error}"}, status=400)
+        result["version"] = batcher.model.version
+        return web.json_response(result)
+
+    async def model(_ : web.Request) -> web.Response:
+        return web.json_response(batcher.model.to_dict())
+
+    app = web.Application()
+    app[BATCHER] = batcher
+    app.add_routes([web.post("/predict", predict), web.get("/model", model)])
+    return app
+
+async def start_server(
+    model : LinearModel,
+    host : str = "127.0.0.1",
+    port : int = 0,
+    max_delay : float = 0.0
+    ) -> web.AppRunner:
+    """
+    Starts the prediction server in the running event loop.
+    Args:
+        model (LinearModel): The model to serve.
+        host (str): Interface to listen on. Defaults to 127.0.0.1.
+        port (int): Port to listen on. Defaults to 0 (any free port).
+        max_delay (float): See MicroBatcher. Defaults to 0.
+    Returns:
+        web.AppRunner: Runner of the server, runner.addresses gives the actual port and
+            runner.app[BATCHER] the batching counters. Stop it with await runner.cleanup().
+    """
+    runner = web.AppRunner(make_app(MicroBatcher(model, max_delay=max_delay)), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
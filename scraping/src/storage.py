@@ -0,0 +1,221 @@
+"""
+SQLite storage of riders, races and results, following the schema of init.sql.
+"""
+
+from typing import Dict, Iterable
+import math
+import os
+import sqlite3
+import pandas as pd
+from src.constants import DEFAULT_DB_PATH, RESULTS_PATH
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "init.sql")
+
+UPSERT_RIDER = """
+INSERT INTO rider (
+    first_name, last_name, full_name, nationality, height, weight_, birth_year,
+    onedayraces, gc, tt, sprint, climber, hills, url_, image_url
+) VALUES (
+    :first_name, :last_name, :full_name, :nationality, :height, :weight, :birth_year,
+    :onedayraces, :gc, :tt, :sprint, :climber, :hills, :url, :photo_url
+)
+ON CONFLICT (url_) DO UPDATE SET
+    first_name = excluded.first_name,
+    last_name = excluded.last_name,
+    full_name = excluded.full_name,
+    nationality = excluded.nationality,
+    height = excluded.height,
+    weight_ = excluded.weight_,
+    birth_year = excluded.birth_year,
+    onedayraces = excluded.onedayraces,
+    gc = excluded.gc,
+    tt = excluded.tt,
+    sprint = excluded.sprint,
+    climber = excluded.climber,
+    hills = excluded.hills,
+    image_url = excluded.image_url
+"""
+
+UPSERT_RACE = """
+INSERT INTO race (
+    name, date_, departure, arrival, class, distance, altitude_gain, startlist_quality,
+    profile_score, temperature, race_ranking, winner_time, winner_speed, url_, profile_image_url
+) VALUES (
+    :race_title, :date, :departure, :arrival, :class, :distance, :vertical_meters,
+    :startlist_quality, :profile_score, :temperature, :race_ranking, :winner_time,
+    :winner_speed, :url, :profile_image_url
+)
+ON CONFLICT (url_) DO UPDATE SET
+    name = excluded.name,
+    date_ = excluded.date_,
+    departure = excluded.departure,
+    arrival = excluded.arrival,
+    class = excluded.class,
+    distance = excluded.distance,
+    altitude_gain = excluded.altitude_gain,
+    startlist_quality = excluded.startlist_quality,
+    profile_score = excluded.profile_score,
+    temperature = excluded.temperature,
+    race_ranking = excluded.race_ranking,
+    winner_time = excluded.winner_time,
+    winner_speed = excluded.winner_speed,
+    profile_image_url = excluded.profile_image_url
+"""
+
+# Results whose rider or race is not stored are skipped by the join
+UPSERT_RESULT = """
+INSERT INTO result (rider_id, race_id, result, seconds_lost, pnt)
+SELECT rider.id, race.id, :result, :seconds_lost, :pnt
+FROM rider JOIN race ON rider.url_ = :rider_profile_url AND race.url_ = :race_url
+WHERE true
+ON CONFLICT (rider_id, race_id) DO UPDATE SET
+    result = excluded.result,
+    seconds_lost = excluded.seconds_lost,
+    pnt = excluded.pnt
+"""
+
+RESULTS_QUERY = """
+SELECT
+    rider.url_ || '{results_path}' AS rider_url,
+    result.result,
+    result.pnt,
+    result.seconds_lost,
+    race.url_ AS race_url,
+    race.name AS race_title,
+    race.date_ AS date,
+    race.class,
+    race.distance,
+    race.altitude_gain AS vertical_meters,
+    race.startlist_quality,
+    race.profile_score,
+    race.winner_time,
+    race.winner_speed,
+    rider.full_name,
+    rider.nationality,
+    rider.height,
+    rider.weight_ AS weight,
+    rider.tt
+FROM result
+JOIN race ON race.id = result.race_id
+JOIN rider ON rider.id = result.rider_id
+{where}
+ORDER BY race.date_ DESC, result.result
+"""
+
+def _clean(record : Dict) -> Dict:
+    """
+    Replaces the NaN of a DataFrame record by None, and dates by ISO strings.
+    """
+    clean = {}
+    for key, value in record.items():
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        elif key == "date" and value is not None:
+            value = pd.Timestamp(value).date().isoformat()
+        clean[key] = value
+    return clean
+
+class SQLiteStorage:
+    """
+    Local SQLite database of riders, races and results.
+
+    The database runs in WAL mode so readers (e.g. a notebook) don't block the scraper writing
+    to it. Riders and races are upserted on their PCS URL, results on their (rider, race) pair.
+    """
+
+    def __init__(self, path : str = DEFAULT_DB_PATH, schema_path : str = SCHEMA_PATH):
+        """
+        Args:
+            path (str): Path of the SQLite file, created with the schema if needed.
+            schema_path (str): Path of the SQL schema. Defaults to init.sql.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        with open(schema_path, encoding="utf-8") as f:
+            self.connection.executescript(f.read())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def upsert_riders(self, riders : Iterable[Dict]) -> int:
+        """
+        Inserts or updates riders, as returned by process_rider.
+        Args:
+            riders (Iterable[Dict]): Rider records.
+        Returns:
+            int: Number of rows written.
+        """
+        with self.connection:
+            cursor = self.connection.executemany(UPSERT_RIDER, map(_clean, riders))
+        return cursor.rowcount
+
+    def upsert_races(self, races : Iterable[Dict]) -> int:
+        """
+        Inserts or updates races, as returned by process_race.
+        Args:
+            races (Iterable[Dict]): Race records.
+        Returns:
+            int: Number of rows written.
+        """
+        with self.connection:
+            cursor = self.connection.executemany(UPSERT_RACE, map(_clean, races))
+        return cursor.rowcount
+
+    def upsert_results(self, results : Iterable[Dict]) -> int:
+        """
+        Inserts or updates results, as returned by process_results. Their rider and race must
+        already be stored.
+        Args:
+            results (Iterable[Dict]): Result records.
+        Returns:
+            int: Number of rows written.
+        """
+        def with_profile_url(result : Dict) -> Dict:
+            result = _clean(result)
+            result["rider_profile_url"] = result["rider_url"].removesuffix(RESULTS_PATH)
+            return result
+
+        with self.connection:
+            cursor = self.connection.executemany(UPSERT_RESULT, map(with_profile_url, results))
+        return cursor.rowcount
+
+    def write(self, riders : pd.DataFrame, results : pd.DataFrame, races : pd.DataFrame):
+        """
+        Writes the three datasets, riders and races first so results can reference them.
+        """
+        self.upsert_riders(riders.to_dict("records"))
+        self.upsert_races(races.to_dict("records"))
+        self.upsert_results(results.to_dict("records"))
+
+    def load_results(self, where : str = "", params : Iterable = ()) -> pd.DataFrame:
+        """
+        Loads results joined with their race and rider, with an indexed query.
+        Args:
+            where (str): Optional SQL WHERE clause, e.g. "WHERE race.date_ >= ?".
+            params (Iterable): Parameters of the WHERE clause.
+        Returns:
+            pd.DataFrame: One row per result.
+        """
+        query = RESULTS_QUERY.format(results_path=RESULTS_PATH, where=where)
+        return pd.read_sql_query(query, self.connection, params=tuple(params), parse_dates=["date"])
+
+    def count(self, table : str) -> int:
+        """
+        Returns:
+            int: Number of rows of a table ("rider", "race" or "result").
+        """
+        if table not in ("rider", "race", "result"):
+            raise ValueError(f"Unknown table {table}")
+        return self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        self.connection.close()
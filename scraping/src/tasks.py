@@ -0,0 +1,233 @@
+"""
+Task execution layer for the scraping stages : timeouts, retries with backoff and failure isolation.
+"""
+
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import asyncio
+import json
+import random
+import aiohttp
+import requests
+from tqdm.asyncio import tqdm
+
+TRANSIENT_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+@dataclass
+class RetryPolicy:
+    """
+    How a single task is retried.
+    Attributes:
+        attempts (int): Maximum number of attempts, including the first one.
+        timeout (float): Timeout in seconds of each attempt.
+        base_delay (float): Base delay in seconds of the exponential backoff.
+        max_delay (float): Upper bound of the backoff delay.
+        max_retry_after (float): Upper bound of the delay asked by a Retry-After header.
+        retry_statuses (frozenset): HTTP statuses considered as transient.
+    """
+    attempts : int = 4
+    timeout : float = 30.0
+    base_delay : float = 1.0
+    max_delay : float = 30.0
+    max_retry_after : float = 120.0
+    retry_statuses : frozenset = TRANSIENT_STATUSES
+
+    def delay(self, attempt : int, retry_after : Optional[float] = None) -> float:
+        """
+        Gives the delay before the next attempt, using full jitter exponential backoff unless the
+        server asked for a specific delay.
+        Args:
+            attempt (int): Index of the attempt that just failed, starting at 0.
+            retry_after (Optional[float]): Delay in seconds asked by the server, if any.
+        Returns:
+            float: Delay in seconds.
+        """
+        if retry_after is not None:
+            return min(max(retry_after, 0.0), self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def is_transient(self, exc : BaseException) -> bool:
+        """
+        Tells if an exception is worth retrying.
+        Args:
+            exc (BaseException): The exception raised by the task.
+        Returns:
+            bool: True for timeouts, connection errors and transient HTTP statuses.
+        """
+        status = http_status(exc)
+        if status is not None:
+            return status in self.retry_statuses
+        return isinstance(exc, (
+            asyncio.TimeoutError,
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,
+            requests.ConnectionError,
+            requests.Timeout
+        ))
+
+class RetryError(Exception):
+    """
+    Raised when a task failed for good, the original exception is kept as the cause.
+    """
+    def __init__(self, exc : BaseException, attempts : int):
+        super().__init__(f"{type(exc).__name__} after {attempts} attempt(s) : {exc}")
+        self.exc = exc
+        self.attempts = attempts
+
+def http_status(exc : BaseException) -> Optional[int]:
+    """
+    Gives the HTTP status carried by an aiohttp or requests exception, if any.
+    """
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code
+    return None
+
+def retry_after(exc : BaseException) -> Optional[float]:
+    """
+    Reads the Retry-After header of a failed response, in seconds or as an HTTP date.
+    Args:
+        exc (BaseException): The exception raised by the task.
+    Returns:
+        Optional[float]: Delay in seconds, None if the header is absent or invalid.
+    """
+    headers = None
+    if isinstance(exc, aiohttp.ClientResponseError):
+        headers = exc.headers
+    elif isinstance(exc, requests.HTTPError) and exc.response is not None:
+        headers = exc.response.headers
+    value = headers.get("Retry-After") if headers else None
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return (date - datetime.now(timezone.utc)).total_seconds()
+
+async def run_with_retry(factory : Callable[[], Awaitable], policy : RetryPolicy):
+    """
+    Runs a coroutine with a timeout, retrying it on transient errors.
+    Args:
+        factory (Callable[[], Awaitable]): Builds a new coroutine for each attempt.
+        policy (RetryPolicy): Retry policy.
+    Returns:
+        The result of the coroutine.
+    Raises:
+        RetryError: If the last attempt failed or the error is not transient.
+    """
+    for attempt in range(policy.attempts):
+        try:
+            return await asyncio.wait_for(factory(), policy.timeout)
+        except Exception as exc: # pylint: disable=broad-except
+            if attempt == policy.attempts - 1 or not policy.is_transient(exc):
+                raise RetryError(exc, attempt + 1) from exc
+            await asyncio.sleep(policy.delay(attempt, retry_after(exc)))
+    raise ValueError("RetryPolicy.attempts must be at least 1")
+
+@dataclass
+class Failure:
+    """
+    A task that failed for good.
+    """
+    stage : str
+    url : str
+    error : str
+    message : str
+    attempts : int
+    status : Optional[int] = None
+
+@dataclass
+class FailureReport:
+    """
+    Collects the failures of every stage of a crawl instead of aborting it.
+    """
+    failures : List[Failure] = field(default_factory=list)
+
+    def add(self, stage : str, url : str, exc : BaseException):
+        """
+        Records a failed task.
+        Args:
+            stage (str): Name of the stage, e.g. "riders".
+            url (str): URL processed by the task.
+            exc (BaseException): The exception raised, usually a RetryError.
+        """
+        attempts = 1
+        if isinstance(exc, RetryError):
+            attempts = exc.attempts
+            exc = exc.exc
+        self.failures.append(Failure(
+            stage=stage,
+            url=url,
+            error=type(exc).__name__,
+            message=str(exc),
+            attempts=attempts,
+            status=http_status(exc)
+        ))
+
+    def __len__(self) -> int:
+        return len(self.failures)
+
+    def by_stage(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: Number of failures per stage.
+        """
+        counts = {}
+        for failure in self.failures:
+            counts[failure.stage] = counts.get(failure.stage, 0) + 1
+        return counts
+
+    def to_json(self, path : str):
+        """
+        Writes the report to a JSON file.
+        Args:
+            path (str): Output path.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([asdict(failure) for failure in self.failures], f, indent=2)
+
+async def gather_stage(
+    stage : str,
+    jobs : List[Tuple[str, Callable[[], Awaitable]]],
+    report : FailureReport,
+    policy : RetryPolicy = None,
+    concurrency : Optional[int] = None,
+    desc : Optional[str] = None
+    ) -> List:
+    """
+    Runs every job of a stage concurrently with a progress bar. Failed jobs are retried according
+    to the policy, then recorded in the report instead of cancelling the whole stage.
+    Args:
+        stage (str): Name of the stage, used in the report.
+        jobs (List[Tuple[str, Callable[[], Awaitable]]]): (url, coroutine factory) pairs.
+        report (FailureReport): Report collecting the failures.
+        policy (RetryPolicy, optional): Retry policy. Defaults to RetryPolicy().
+        concurrency (int, optional): Maximum number of jobs running at once. Defaults to None
+            (no limit).
+        desc (str, optional): Description of the progress bar.
+    Returns:
+        List: The results of the successful jobs, in the order of the jobs.
+    """
+    policy = policy or RetryPolicy()
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def run(url : str, factory : Callable[[], Awaitable]):
+        try:
+            if semaphore is None:
+                return True, await run_with_retry(factory, policy)
+            async with semaphore:
+                return True, await run_with_retry(factory, policy)
+        except RetryError as exc:
+            report.add(stage, url, exc)
+            return False, None
+
+    outcomes = await tqdm.gather(*(run(url, factory) for url, factory in jobs), desc=desc)
+    return [result for ok, result in outcomes if ok]
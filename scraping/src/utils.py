@@ -2,35 +2,149 @@
 Utility functions for web scraping and data parsing.
 """
 
-from typing import Union
+from typing import Iterable, Optional, Union
+import os
 import requests
 from aiohttp import ClientSession
 from bs4 import BeautifulSoup
+from src.cache import ResponseCache
+from src.client import shared_sync_session
+from src.metrics import Metrics
+from src.parsing import make_soup
 
-def fetch(url : str, headers=None, parser="html.parser", verbose=True) -> BeautifulSoup:
+DEFAULT_BASE_URL = "https://www.procyclingstats.com/"
+# Root of every scraped URL. PCS_BASE_URL points the scraper to another server, e.g. the mock
+# server of benchmarks.mock_pcs
+BASE_URL = os.environ.get("PCS_BASE_URL", DEFAULT_BASE_URL).rstrip("/") + "/"
+
+def _request_headers(url : str, headers=None, cache : Optional[ResponseCache] = None) -> dict:
+    """
+    Merges the user headers with the conditional headers of an expired cache entry.
+    """
+    request_headers = dict(headers or {})
+    if cache is not None:
+        request_headers.update(cache.conditional_headers(url))
+    return request_headers
+
+def fetch(
+    url : str,
+    headers=None,
+    parser=None,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    fragments : Optional[Iterable[str]] = None,
+    session : Optional[requests.Session] = None
+    ) -> BeautifulSoup:
     """
     Fetches the content of a URL and returns a BeautifulSoup object.
 
     Args:
         url (str): The URL to fetch.
         headers (dict, optional): Optional HTTP headers to send with the request.
-        parser (str, optional): The parser to use with BeautifulSoup. Defaults to "html.parser".
+        parser (str, optional): The parser to use with BeautifulSoup. Defaults to
+            src.parsing.DEFAULT_PARSER (lxml if installed, "html.parser" otherwise).
+        cache (ResponseCache, optional): Response cache to read from and write to.
+        fragments (Iterable[str], optional): Simple CSS selectors of the only fragments to
+            build. Defaults to None (the whole document).
+        session (requests.Session, optional): Session whose connections are reused, see
+            src.client. Defaults to the shared session of src.client.shared_sync_session.
 
     Returns:
         BeautifulSoup: Parsed HTML content.
     """
-    response = requests.get(url, headers=headers,timeout=2)
-    if verbose:
-        print("Accessing page : ", url)
-    response.raise_for_status()
-    return BeautifulSoup(response.text, parser)
+    text = cache.get(url) if cache is not None else None
+    if text is None:
+        session = session or shared_sync_session()
+        response = session.get(url, headers=_request_headers(url, headers, cache))
+        if verbose:
+            print("Accessing page : ", url)
+        if cache is not None and response.status_code == 304:
+            text = cache.revalidate(url, response.headers)
+            if text is None:
+                # The entry was evicted since the conditional request : the 304 has no body
+                response = session.get(url, headers=_request_headers(url, headers))
+        if text is None:
+            response.raise_for_status()
+            text = response.text
+            if cache is not None:
+                cache.store(url, text, response.headers)
+    return make_soup(text, parser, fragments)
+
+async def fetch_html_async(
+    url : str,
+    session : ClientSession,
+    headers=None,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    metrics : Optional[Metrics] = None
+    ) -> str:
+    """
+    Asynchronously fetches the content of a URL without parsing it, so that the parsing can
+    happen elsewhere (e.g. in a worker process).
+
+    Args:
+        url (str): The URL to fetch.
+        session (aiohttp.ClientSession): Reusable session for connection pooling.
+        headers (dict, optional): Optional HTTP headers to send with the request.
+        cache (ResponseCache, optional): Response cache to read from and write to.
+        metrics (Metrics, optional): Measures of the crawl, see src.metrics.
+
+    Returns:
+        str: Raw HTML content.
+    """
+    text = cache.get(url) if cache is not None else None
+    if text is not None:
+        if metrics is not None:
+            metrics.cache_hit()
+        return text
+    if metrics is None:
+        return await _download(url, session, headers, verbose, cache)
+    with metrics.fetch(url):
+        return await _download(url, session, headers, verbose, cache, metrics)
+
+async def _download(
+    url : str,
+    session : ClientSession,
+    headers=None,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    metrics : Optional[Metrics] = None,
+    conditional : bool = True
+    ) -> str:
+    text = None
+    request_headers = _request_headers(url, headers, cache if conditional else None)
+    async with session.get(url, headers=request_headers) as response:
+        if verbose:
+            print("Accessing page : ", url)
+        if cache is not None and conditional and response.status == 304:
+            if metrics is not None:
+                metrics.response(url, response.status)
+            text = cache.revalidate(url, response.headers)
+        else:
+            if metrics is not None and not response.ok:
+                metrics.response(url, response.status)
+            response.raise_for_status()
+            # text() decodes the body read here, it is not downloaded twice
+            body = await response.read()
+            text = await response.text()
+            if metrics is not None:
+                metrics.response(url, response.status, len(body))
+            if cache is not None:
+                cache.store(url, text, response.headers)
+    if text is None:
+        # The entry was evicted since the conditional request : the 304 has no body to use
+        return await _download(url, session, headers, verbose, cache, metrics, conditional=False)
+    return text
 
 async def fetch_async(
     url : str,
     session : ClientSession,
     headers=None,
-    parser="html.parser",
-    verbose=True
+    parser=None,
+    verbose=True,
+    cache : Optional[ResponseCache] = None,
+    fragments : Optional[Iterable[str]] = None,
+    metrics : Optional[Metrics] = None
     ) -> BeautifulSoup:
     """
     Asynchronously fetches the content of a URL and returns a BeautifulSoup object.
@@ -39,17 +153,20 @@ async def fetch_async(
         url (str): The URL to fetch.
         session (aiohttp.ClientSession): Reusable session for connection pooling.
         headers (dict, optional): Optional HTTP headers to send with the request.
-        parser (str, optional): The parser to use with BeautifulSoup. Defaults to "html.parser".
+        parser (str, optional): The parser to use with BeautifulSoup. Defaults to
+            src.parsing.DEFAULT_PARSER (lxml if installed, "html.parser" otherwise).
+        cache (ResponseCache, optional): Response cache to read from and write to.
+        fragments (Iterable[str], optional): Simple CSS selectors of the only fragments to
+            build. Defaults to None (the whole document).
+        metrics (Metrics, optional): Measures of the crawl, see src.metrics.
 
     Returns:
         BeautifulSoup: Parsed HTML content.
     """
-    async with session.get(url, headers=headers) as response:
-        response.raise_for_status()
-        text = await response.text()
-        if verbose:
-            print("Accessing page : ", url)
-        return BeautifulSoup(text, parser)
+    text = await fetch_html_async(
+        url, session, headers=headers, verbose=verbose, cache=cache, metrics=metrics
+    )
+    return make_soup(text, parser, fragments)
 
 def minutes_to_seconds(time_in_minutes_str : str, sep = ":") -> int:
     """
@@ -0,0 +1,80 @@
+"""
+Process pool running the CPU-bound parsing of the pages off the event loop.
+"""
+
+from typing import Callable, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import os
+import time
+from src.metrics import Metrics
+
+def _timed(func : Callable, *args) -> Tuple[float, object]:
+    """
+    Runs func in the worker process and measures it there, without the time spent waiting for
+    a worker or sending the data back.
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+class ParsePool:
+    """
+    Runs parsing functions (raw HTML in, plain dicts out) in worker processes, so that pages are
+    parsed on every core while the event loop keeps downloading.
+
+    The number of parsing jobs submitted at once is bounded : once the workers are saturated,
+    the coroutines wait before handing over their HTML, which keeps memory in check and applies
+    backpressure on the fetching side.
+    """
+
+    def __init__(self, workers : Optional[int] = None, max_pending : Optional[int] = None):
+        """
+        Args:
+            workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+            max_pending (int, optional): Maximum number of parsing jobs submitted at once.
+                Defaults to twice the number of workers.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._slots = asyncio.Semaphore(self.max_pending)
+
+    async def run(
+        self,
+        func : Callable,
+        *args,
+        metrics : Optional[Metrics] = None,
+        kind : Optional[str] = None
+        ):
+        """
+        Runs a picklable function in a worker process.
+        Args:
+            func (Callable): Module-level function, e.g. parse_race_html.
+            *args: Its arguments, they must be picklable.
+            metrics (Metrics, optional): If given, the run time of the function is recorded as
+                the parse time of a page of type kind.
+            kind (str, optional): Page type, see src.metrics.page_type.
+        Returns:
+            The result of the function.
+        """
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            if metrics is None:
+                return await loop.run_in_executor(self._executor, func, *args)
+            seconds, result = await loop.run_in_executor(self._executor, _timed, func, *args)
+        metrics.parsed(kind, seconds)
+        return result
+
+    def close(self):
+        """
+        Shuts the worker processes down, the jobs not started yet are cancelled. Closing a
+        closed pool does nothing.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
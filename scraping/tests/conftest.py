@@ -0,0 +1,17 @@
+import pytest
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--live", action="store_true", help="also run the tests fetching procyclingstats.com"
+    )
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "live: fetches procyclingstats.com, run with --live")
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--live"):
+        return
+    skip = pytest.mark.skip(reason="fetches procyclingstats.com, run with --live")
+    for item in items:
+        if "live" in item.keywords:
+            item.add_marker(skip)
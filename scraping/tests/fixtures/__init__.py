@@ -0,0 +1,84 @@
+"""
+Offline corpus of PCS pages (races, riders, results and rankings) for the tests and benchmarks.
+
+manifest.json maps every page URL to its HTML file. The pages flagged "synthetic" there are not
+captures : they were written by hand after the PCS markup the extractors target, the corpus
+having been built without network access. They pin the behaviour of the extractors, but cannot
+tell whether that markup still matches the live site, which the opt-in live tests check :
+    python -m pytest --live tests/test_live.py
+
+To replace the corpus with live captures, which clears the flags, e.g. after a PCS layout
+change :
+    python -m tests.fixtures --refresh
+"""
+
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import requests
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_PATH = os.path.join(FIXTURES_DIR, "manifest.json")
+KINDS = ("race", "rider", "results", "rankings")
+
+def load_manifest() -> List[Dict]:
+    """
+    Returns:
+        List[Dict]: {"kind", "url", "file", "synthetic"} entries of the corpus.
+    """
+    with open(MANIFEST_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def read_page(url : str) -> str:
+    """
+    Args:
+        url (str): URL of a page of the corpus.
+    Returns:
+        str: Saved HTML of the page.
+    Raises:
+        KeyError: If the page is not in the corpus.
+    """
+    for entry in load_manifest():
+        if entry["url"] == url:
+            with open(os.path.join(FIXTURES_DIR, entry["file"]), encoding="utf-8") as f:
+                return f.read()
+    raise KeyError(f"{url} is not in the fixture corpus")
+
+def pages(kind : Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    Args:
+        kind (str, optional): "race", "rider", "results" or "rankings". Defaults to None (every
+            page).
+    Returns:
+        List[Tuple[str, str]]: (url, html) of the pages of the corpus.
+    """
+    corpus = []
+    for entry in load_manifest():
+        if kind is None or entry["kind"] == kind:
+            with open(os.path.join(FIXTURES_DIR, entry["file"]), encoding="utf-8") as f:
+                corpus.append((entry["url"], f.read()))
+    return corpus
+
+def refresh(timeout : float = 10):
+    """
+    Downloads every page of the manifest again, overwriting the saved HTML, and marks the pages
+    as live captures in the manifest.
+    """
+    manifest = load_manifest()
+    for entry in manifest:
+        response = requests.get(entry["url"], timeout=timeout)
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES_DIR, entry["file"]), "w", encoding="utf-8") as f:
+            f.write(response.text)
+        entry["synthetic"] = False
+        print(f"Saved {entry['url']} to {entry['file']}")
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+        f.write("\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--refresh", action="store_true", help="download the corpus again")
+    if parser.parse_args().refresh:
+        refresh()
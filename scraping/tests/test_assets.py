@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import socket
+import pandas as pd
+import pytest
+from aiohttp import web
+from benchmarks.mock_pcs import STATS, MockConfig, base_url, image_bytes, start_server
+from src.assets import (
+    MANIFEST_FILE, THUMBNAIL_SIZE, AssetStore, asset_urls, make_thumbnail, sync_assets,
+    thumbnails_available
+)
+from src.tasks import FailureReport, RetryPolicy
+
+CONFIG = MockConfig(riders=10, races=5)
+PHOTOS = [f"images/riders/rider-{i}.png" for i in range(CONFIG.riders)]
+PROFILES = [f"images/profiles/mock-{i}.jpg" for i in range(CONFIG.races)]
+# Riders 0 and 5 have the placeholder photo
+UNIQUE = len(PHOTOS) - 1 + len(PROFILES)
+
+@pytest.fixture
+def port():
+    # The URLs, port included, stay the same from one sync to the next
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def sync(directory, port, config=CONFIG, paths=PHOTOS + PROFILES, **kwargs):
+    async def run():
+        runner = await start_server(config, port=port)
+        try:
+            url = base_url(runner)
+            counts = await sync_assets(
+                [url + path for path in paths], str(directory), **{"thumbnails": False, **kwargs}
+            )
+            return counts, runner.app[STATS]
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+def stored_objects(directory):
+    return sorted(
+        name for _, _, names in os.walk(directory / "objects") for name in names
+    )
+
+def test_sync_deduplicates_and_skips_stored_images(tmp_path, port):
+    counts, stats = sync(tmp_path, port)
+
+    assert counts["new"] == UNIQUE
+    assert counts["duplicate"] == 1
+    assert counts["bytes"] == stats.bytes_sent
+    assert len(stored_objects(tmp_path)) == UNIQUE
+    with open(tmp_path / MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert len(manifest) == len(PHOTOS + PROFILES)
+    assert len({entry["hash"] for entry in manifest.values()}) == UNIQUE
+
+    counts, stats = sync(tmp_path, port)
+
+    assert counts["skipped"] == len(PHOTOS + PROFILES)
+    assert counts["bytes"] == 0
+    assert stats.requests == 0
+
+def test_revalidation_only_transfers_changed_images(tmp_path, port):
+    sync(tmp_path, port)
+
+    counts, stats = sync(tmp_path, port, revalidate=True)
+    assert counts["unchanged"] == len(PHOTOS + PROFILES)
+    assert stats.statuses == {304: len(PHOTOS + PROFILES)}
+
+    # Other images behind the same URLs
+    counts, stats = sync(tmp_path, port, MockConfig(riders=10, races=5, seed=1), revalidate=True)
+    assert counts["changed"] == len(PHOTOS + PROFILES)
+    assert stats.statuses == {200: len(PHOTOS + PROFILES)}
+    store = AssetStore(str(tmp_path))
+    photo = store.get(next(url for url in store.manifest if url.endswith(PHOTOS[1])))
+    with open(store.object_path(photo), "rb") as f:
+        assert f.read() == image_bytes(MockConfig(seed=1), "rider", 1)
+
+def test_failed_downloads_are_reported(tmp_path, port):
+    report = FailureReport()
+
+    counts, _ = sync(
+        tmp_path, port, paths=PHOTOS[:2] + ["images/riders/rider-99.png"],
+        policy=RetryPolicy(attempts=1), report=report
+    )
+
+    assert counts["new"] == 2
+    assert counts["failed"] == 1
+    assert [(failure.stage, failure.status) for failure in report.failures] == [("assets", 404)]
+    assert not [name for name in stored_objects(tmp_path) if name.endswith(".tmp")]
+
+def test_asset_urls():
+    riders = pd.DataFrame({"photo_url": ["a.png", None, "b.png", "a.png"]})
+    races = pd.DataFrame({"profile_image_url": [None, "c.jpg", "b.png"]})
+
+    assert asset_urls(riders, races) == ["a.png", "b.png", "c.jpg"]
+    assert asset_urls(pd.DataFrame(), races) == ["c.jpg", "b.png"]
+
+@pytest.mark.skipif(not thumbnails_available(), reason="Pillow is not installed")
+def test_thumbnails_are_size_capped(tmp_path):
+    from PIL import Image
+    source = tmp_path / "profile.png"
+    Image.effect_noise((1200, 600), 100).convert("RGB").save(source)
+
+    size = make_thumbnail(str(source), str(tmp_path / "thumb.jpg"), max_bytes=1500)
+
+    with Image.open(tmp_path / "thumb.jpg") as thumbnail:
+        assert thumbnail.size == (THUMBNAIL_SIZE[0], THUMBNAIL_SIZE[0] // 2)
+    assert size == os.path.getsize(tmp_path / "thumb.jpg") <= 1500
+
+@pytest.mark.skipif(not thumbnails_available(), reason="Pillow is not installed")
+def test_sync_makes_one_thumbnail_per_image(tmp_path, port):
+    counts, _ = sync(tmp_path, port, thumbnails=True, workers=1)
+
+    assert counts["thumbnails"] == UNIQUE
+    assert len(os.listdir(tmp_path / "thumbnails")) > 0
+    assert sync(tmp_path, port, thumbnails=True, workers=1)[0]["thumbnails"] == 0
+
+async def start_broken_image_server():
+    # Error pages, one sent as a page, the other one as an image
+    async def page(request):
+        content_type = "text/html" if request.match_info["name"] == "page" else "image/jpeg"
+        return web.Response(body=b"<html>Not found</html>", content_type=content_type)
+
+    app = web.Application()
+    app.router.add_get("/images/{name}.jpg", page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/images/"
+
+@pytest.mark.skipif(not thumbnails_available(), reason="Pillow is not installed")
+def test_broken_images_are_reported(tmp_path, port):
+    report = FailureReport()
+
+    async def run():
+        runner, url = await start_broken_image_server()
+        try:
+            return await sync_assets(
+                [url + "page.jpg", url + "html.jpg"], str(tmp_path), workers=1,
+                policy=RetryPolicy(attempts=1), report=report
+            )
+        finally:
+            await runner.cleanup()
+
+    broken = asyncio.run(run())
+    counts, _ = sync(tmp_path, port, thumbnails=True, workers=1, report=report)
+
+    assert broken["failed"] == 1
+    assert broken["thumbnails"] == 0
+    assert [(failure.stage, failure.url.rsplit("/", 1)[1]) for failure in report.failures] == [
+        ("assets", "page.jpg"), ("thumbnails", "html.jpg")
+    ]
+    assert report.failures[1].error == "UnidentifiedImageError"
+    # The store still takes the next images
+    assert counts["thumbnails"] == UNIQUE
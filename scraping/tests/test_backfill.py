@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import pandas as pd
+import pytest
+from benchmarks.mock_pcs import STATS, MockConfig, base_url, start_server
+from src import get_tt_specialists
+from src.backfill import (
+    assign_profiles, assign_races, assign_riders, backfill, make_shards, merge_shards,
+    race_season
+)
+from src.features import table_path, write_table
+
+def test_make_shards():
+    assert [shard.name for shard in make_shards(2000, 2024, 10)] == [
+        "2015-2024", "2005-2014", "2000-2004"
+    ]
+    assert [shard.name for shard in make_shards(2023, 2024)] == ["2024-2024", "2023-2023"]
+
+def test_assign_riders():
+    shards = make_shards(2020, 2024, 2)
+    assign_riders(shards, {
+        2024: {("A", "https://pcs/rider/a")},
+        2023: {("B", "https://pcs/rider/b"), ("A", "https://pcs/rider/a")},
+        2021: {("C", "https://pcs/rider/c"), ("B", "https://pcs/rider/b")},
+        2020: {("D", "https://pcs/rider/d"), ("E", "https://pcs/rider/e")},
+    })
+    # Each rider goes to a single shard, the shards getting as many riders give or take one
+    assert [[name for name, _ in shard.riders] for shard in shards] == [
+        ["A", "D"], ["B", "E"], ["C"]
+    ]
+
+@pytest.mark.parametrize("url, season", [
+    ("https://pcs/race/tour-de-france/2024/stage-21", 2024),
+    ("https://pcs/race/nc-belgium-itt/2025/result", 2025),
+    ("https://pcs/race/mock-race-3/2021", 2021),
+    ("https://pcs/race/tour-de-france", None),
+])
+def test_race_season(url, season):
+    assert race_season(url) == season
+
+def test_assign_races():
+    shards = make_shards(2020, 2024, 2)
+    assign_races(shards, [
+        f"https://pcs/race/{name}/{season}/result" for name, season in (
+            ("a", 2024), ("b", 2023), ("a", 2024), ("c", 2021), ("d", 2025), ("e", 2019),
+            ("f", 2020), ("c", 2022)
+        )
+    ] + ["https://pcs/race/undated"])
+    races = [[url.split("/race/")[1] for url in shard.races] for shard in shards]
+
+    # Each race once, by season, the seasons outside the shards going to the nearest one
+    assert races == [
+        ["a/2024/result", "b/2023/result", "d/2025/result", "undated"],
+        ["c/2021/result", "c/2022/result"],
+        ["e/2019/result", "f/2020/result"],
+    ]
+
+def test_assign_profiles():
+    shards = make_shards(2023, 2024)
+    assign_profiles(shards, [("A", "https://pcs/rider/a"), ("A", "https://pcs/rider/a")])
+
+    assert [shard.profiles for shard in shards] == [[("A", "https://pcs/rider/a")], []]
+
+def test_merge_shards(tmp_path):
+    directories = []
+    for name, rider, races in (("2024-2024", "b", ["x", "y"]), ("2023-2023", "a", ["y", "z"])):
+        directory = tmp_path / name
+        directory.mkdir()
+        tables = {
+            "riders": pd.DataFrame({
+                "first_name": [rider], "last_name": ["Z"], "url": [f"https://pcs/rider/{rider}"]
+            }),
+            "results": pd.DataFrame({
+                "rider_url": [f"https://pcs/rider/{rider}"] * 2, "result": [1, 2],
+                "race_url": [f"https://pcs/race/{race}" for race in races],
+            }),
+            "races": pd.DataFrame({
+                "race_title": races, "date": pd.to_datetime(["2024-01-01", "2023-06-01"]),
+                "url": [f"https://pcs/race/{race}" for race in races],
+            }),
+        }
+        for table, df in tables.items():
+            write_table(df, table_path(str(directory), table))
+        directories.append(str(directory))
+
+    riders, results, races = merge_shards(directories)
+    assert riders["url"].tolist() == ["https://pcs/rider/a", "https://pcs/rider/b"]
+    assert len(results) == 4
+    # Race y was found by both shards, it is kept from the first one
+    assert races["race_title"].tolist() == ["x", "y", "z"]
+    assert races["date"].tolist() == list(
+        pd.to_datetime(["2024-01-01", "2023-06-01", "2023-06-01"])
+    )
+
+@pytest.fixture
+def mock_site(monkeypatch):
+    # The server runs in its own thread, the backfill blocking the main one
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runner = asyncio.run_coroutine_threadsafe(start_server(MockConfig(
+        riders=30, races=80, results_per_rider=6, season_shift=5
+    )), loop).result()
+    url = base_url(runner)
+    # The shards are spawned and read PCS_BASE_URL, discovery runs in this process
+    monkeypatch.setenv("PCS_BASE_URL", url)
+    monkeypatch.setattr(get_tt_specialists, "BASE_URL", url)
+    yield runner.app[STATS]
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+@pytest.mark.parametrize("strategy", ["rider", "race"])
+def test_sharded_backfill_matches_single_shard(mock_site, tmp_path, strategy):
+    def run(shard_size, workers):
+        requests = mock_site.requests
+        tables = backfill(
+            2020, 2025, shard_size=shard_size, workers=workers, concurrency=4, top_n=10,
+            strategy=strategy, output_dir=str(tmp_path / f"shards-{shard_size}"), to_csv=False,
+            verbose=False
+        )
+        return tables, mock_site.requests - requests
+
+    sharded, sharded_requests = run(2, 2)
+    single, single_requests = run(6, 1)
+
+    assert len(list((tmp_path / "shards-2").iterdir())) == 3
+    # Six seasons of 10 ranked riders, shifted by 5, cover the 30 riders of the server
+    assert len(sharded[0]) == 30
+    for merged, expected in zip(sharded, single):
+        pd.testing.assert_frame_equal(merged, expected)
+    assert sharded[2]["url"].is_unique
+    # Every page is fetched once, however the work is sharded
+    assert sharded_requests == single_requests
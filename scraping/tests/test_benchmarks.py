@@ -0,0 +1,55 @@
+from benchmarks import bench_startup
+from benchmarks.bench_parsers import PAGE_TYPES, pages_from_fixtures, regressions, run
+from src.parsing import available_parsers
+
+def test_run_covers_every_extractor_and_backend():
+    measures = run(pages_from_fixtures(), repeat=1)
+
+    assert len(measures) == len(PAGE_TYPES) * len(available_parsers()) * 2
+    assert all(measure["pages_per_second"] > 0 for measure in measures.values())
+    assert all(measure["peak_kib"] > 0 for measure in measures.values())
+
+def test_regressions_beyond_tolerance():
+    baseline = {
+        "race/lxml/full": {"pages_per_second": 100.0, "peak_kib": 400.0},
+        "race/lxml/fragments": {"pages_per_second": 150.0, "peak_kib": 300.0},
+    }
+    measures = {
+        "race/lxml/full": {"pages_per_second": 80.0, "peak_kib": 400.0},
+        "race/lxml/fragments": {"pages_per_second": 100.0, "peak_kib": 300.0},
+        "rider/lxml/full": {"pages_per_second": 1.0, "peak_kib": 100.0},
+    }
+
+    assert regressions(measures, baseline, tolerance=0.25) == ["race/lxml/fragments"]
+    assert regressions(measures, baseline, tolerance=0.5) == []
+
+def test_quick_commands_import_no_heavy_module():
+    measures = bench_startup.run(repeat=1)
+
+    runs = {"query races", "predict estimate", "export --format csv"}
+    assert set(measures) == {" ".join(args) for args in bench_startup.QUICK_COMMANDS} | runs
+    assert all(measure["import_ms"] > 0 for measure in measures.values())
+    assert bench_startup.failures(measures, budget=10.0, run_budget=10.0) == []
+    # The quick runs load the datasets, never the crawler
+    for name in runs:
+        assert measures[name]["returncode"] == 0
+        assert not set(measures[name]["heavy"]) & {"aiohttp", "bs4", "requests", "tqdm"}
+
+def test_import_profile():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |   _io",
+        "import time:       200 |       1500 | argparse",
+        "import time:       300 |        300 |     pandas.core",
+        "import time:       400 |       2500 | pandas",
+    ])
+
+    assert bench_startup.import_profile(stderr) == {"import_ms": 4.0, "heavy": ["pandas"]}
+    assert bench_startup.failures({"--help": {"seconds": 0.6, "heavy": []}}, 0.5) == ["--help"]
+    assert bench_startup.failures({
+        "query races": {"seconds": 0.6, "heavy": ["numpy", "pandas"], "run": True,
+                        "returncode": 0},
+        "export --format csv": {"seconds": 0.6, "heavy": ["pandas", "requests"], "run": True,
+                                "returncode": 0},
+        "predict estimate": {"seconds": 0.6, "heavy": [], "run": True, "returncode": 1},
+    }, 0.5, 1.0) == ["export --format csv", "predict estimate"]
@@ -0,0 +1,129 @@
+import asyncio
+import time
+import aiohttp
+import pytest
+from aiohttp import web
+from src import cache as cache_module
+from src.cache import ResponseCache
+from src.utils import fetch, fetch_html_async
+
+RACE_URL = "https://www.procyclingstats.com/race/tour-de-france/2024/stage-21"
+RIDER_URL = "https://www.procyclingstats.com/rider/filippo-ganna"
+RESULTS_URL = "https://www.procyclingstats.com/rider/filippo-ganna/results/last-tt-results"
+
+@pytest.mark.parametrize(
+    "url, expected_ttl",
+    [
+        (RACE_URL, None),
+        (RESULTS_URL, 12 * 3600),
+        (RIDER_URL, 24 * 3600),
+        ("https://www.procyclingstats.com/rankings.php?date=2023-12-31&s=time-trial", 24 * 3600),
+    ]
+)
+def test_ttl_per_url_class(tmp_path, url : str, expected_ttl):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.ttl_for(url) == expected_ttl
+
+def test_store_and_get_persist_on_disk(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get(RACE_URL) is None
+    cache.store(RACE_URL, "<html>race</html>", {"ETag": '"abc"'})
+    cache.close()
+
+    reopened = ResponseCache(str(tmp_path))
+    assert reopened.get(RACE_URL) == "<html>race</html>"
+    assert reopened.stats["hits"] == 1
+    assert cache.stats["misses"] == 1
+
+def test_expired_entry_is_revalidated(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store(RIDER_URL, "<html>rider</html>", {"ETag": '"v1"', "Last-Modified": "yesterday"})
+    cache._index[RIDER_URL]["stored_at"] = time.time() - 2 * 24 * 3600
+
+    assert cache.get(RIDER_URL) is None
+    assert cache.conditional_headers(RIDER_URL) == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "yesterday"
+    }
+    assert cache.revalidate(RIDER_URL, {"ETag": '"v2"'}) == "<html>rider</html>"
+    assert cache.get(RIDER_URL) == "<html>rider</html>"
+    assert cache.conditional_headers(RIDER_URL)["If-None-Match"] == '"v2"'
+
+def test_offline_mode_ignores_expiry(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store(RIDER_URL, "<html>rider</html>")
+    cache._index[RIDER_URL]["stored_at"] = 0
+    cache.close()
+
+    assert ResponseCache(str(tmp_path), offline=True).get(RIDER_URL) == "<html>rider</html>"
+
+def test_lru_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=25)
+    cache.store("https://a/race/1", "x" * 10)
+    cache.store("https://a/race/2", "x" * 10)
+    cache.get("https://a/race/1")
+    cache.store("https://a/race/3", "x" * 10)
+
+    assert "https://a/race/1" in cache
+    assert "https://a/race/2" not in cache
+    assert "https://a/race/3" in cache
+    assert cache.stats["evictions"] == 1
+    assert cache.size() <= 25
+
+def test_index_is_written_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "INDEX_FLUSH_EVERY", 3)
+    writes = []
+    cache = ResponseCache(str(tmp_path))
+    save_index = cache._save_index
+    monkeypatch.setattr(cache, "_save_index", lambda: writes.append(1) or save_index())
+
+    for i in range(7):
+        cache.store(f"https://a/race/{i}", "x" * 10)
+
+    assert len(writes) == 2
+    assert cache.size() == 70
+    cache.close()
+    assert len(writes) == 3
+    assert len(ResponseCache(str(tmp_path))) == 7
+
+async def start_etag_server():
+    # Answers 304 to any conditional request, whatever the cache still holds
+    async def page(request):
+        if "If-None-Match" in request.headers:
+            return web.Response(status=304, headers={"ETag" : '"v1"'})
+        return web.Response(text="<html>rider</html>", headers={"ETag" : '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/rider/{name}", page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/rider/ganna"
+
+def expired_without_body(tmp_path, url):
+    cache = ResponseCache(str(tmp_path))
+    cache.store(url, "<html>old</html>", {"ETag": '"v1"'})
+    cache._index[url]["stored_at"] = 0
+    # Evicted between the conditional request and its 304
+    cache.revalidate = lambda url, headers=None: None
+    return cache
+
+def test_revalidated_entry_evicted_meanwhile_is_fetched_again(tmp_path):
+    async def run():
+        runner, url = await start_etag_server()
+        try:
+            cache = expired_without_body(tmp_path / "async", url)
+            async with aiohttp.ClientSession() as session:
+                text = await fetch_html_async(url, session, verbose=False, cache=cache)
+            sync_cache = expired_without_body(tmp_path / "sync", url)
+            soup = await asyncio.to_thread(fetch, url, verbose=False, cache=sync_cache)
+            return text, soup, cache, sync_cache
+        finally:
+            await runner.cleanup()
+
+    text, soup, cache, sync_cache = asyncio.run(run())
+
+    assert text == "<html>rider</html>"
+    assert soup.get_text() == "rider"
+    assert [c.stats["stores"] for c in (cache, sync_cache)] == [2, 2]
@@ -0,0 +1,123 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import pcs_chrono
+from src import assets, constants, dataset, get_tt_races, get_tt_results, get_tt_specialists
+from src import journal, pipeline, prediction, query, storage
+from src.constants import MIN_YEAR
+from src.prediction import FEATURES, LinearModel, ModelRegistry
+from src.utils import BASE_URL
+
+@pytest.mark.parametrize("module, name", [
+    (pcs_chrono, "DATA_DIR"),
+    (dataset, "DATA_DIR"),
+    (get_tt_specialists, "DEFAULT_YEARS"),
+    (get_tt_results, "MIN_YEAR"),
+    (pipeline, "STRATEGIES"),
+    (storage, "DEFAULT_DB_PATH"),
+    (journal, "DEFAULT_JOURNAL_PATH"),
+    (query, "DEFAULT_INDEX_DIR"),
+    (prediction, "DEFAULT_MODELS_DIR"),
+    (prediction, "DEFAULT_PORT"),
+    (dataset, "EXPORT_FORMATS"),
+    (assets, "DEFAULT_ASSETS_DIR"),
+])
+def test_defaults_are_shared(module, name):
+    assert getattr(module, name) is getattr(constants, name)
+
+def test_main_takes_the_crawl_arguments():
+    process = subprocess.run(
+        [sys.executable, "main.py", "--help"], cwd=os.path.dirname(pcs_chrono.__file__),
+        capture_output=True, text=True, check=True
+    )
+
+    for argument in ("--incremental", "--years", "--strategy", "--resume", "--assets"):
+        assert argument in process.stdout
+
+def test_parsing_imports_no_heavy_module():
+    code = (
+        "import json, sys, pcs_chrono\n"
+        "for argv in (['crawl'], ['update', '--years', '2021', '2023'], ['race', 'race/x'],"
+        " ['export', '--output', 'out'], ['assets'], ['query', 'races'],"
+        " ['predict', 'estimate']):\n"
+        "    pcs_chrono.build_parser().parse_args(argv)\n"
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    modules = set(json.loads(process.stdout))
+    loaded = {name.split(".")[0] for name in modules}
+
+    assert not loaded & {"pandas", "numpy", "aiohttp", "bs4", "requests", "tqdm"}
+    # Only the shared defaults of the project
+    assert {name for name in modules if name.startswith("src.")} == {"src.constants"}
+
+@pytest.mark.parametrize("subcommand, incremental", [("crawl", False), ("update", True)])
+def test_crawl_arguments(subcommand, incremental):
+    args = pcs_chrono.build_parser().parse_args([subcommand, "--years", "2021", "2023", "--db"])
+
+    assert args.incremental is incremental
+    assert args.years == [2021, 2023]
+    assert args.db == pcs_chrono.DEFAULT_DB_PATH
+    assert args.min_year == MIN_YEAR
+
+@pytest.mark.parametrize("argv", [[], ["query"], ["predict", "forecast"], ["export"]])
+def test_invalid_arguments(argv):
+    with pytest.raises(SystemExit) as exit_info:
+        pcs_chrono.main(argv)
+    assert exit_info.value.code == 2
+
+@pytest.mark.parametrize("url", [
+    "race/tour-de-france/2024/stage-21",
+    BASE_URL + "race/tour-de-france/2024/stage-21",
+])
+def test_race(monkeypatch, capsys, url):
+    fetched = []
+    def process_race_sync(race_url, verbose=True):
+        fetched.append(race_url)
+        return {"race_title": "Tour de France 2024 Stage 21 (ITT)", "distance": 33.7}
+    monkeypatch.setattr(get_tt_races, "process_race_sync", process_race_sync)
+
+    pcs_chrono.main(["race", url])
+
+    assert fetched == [BASE_URL + "race/tour-de-france/2024/stage-21"]
+    assert json.loads(capsys.readouterr().out)["distance"] == 33.7
+
+def test_predict_estimate(tmp_path, capsys):
+    ModelRegistry(str(tmp_path)).save(LinearModel(FEATURES, [0.2, -0.01, 0.002, 0.1], 45.0))
+
+    pcs_chrono.main([
+        "predict", "estimate", "--models-dir", str(tmp_path), "--feature", "distance=30",
+        "--feature", "vertical_meters=200", "--feature", "startlist_quality=900",
+        "--feature", "profile_score=15"
+    ])
+
+    assert capsys.readouterr().out.strip() == "winner_speed : 52.300 (model v1)"
+
+@pytest.mark.parametrize("features", [[], ["--feature", "distance"]])
+def test_errors_exit_with_a_message(tmp_path, features):
+    ModelRegistry(str(tmp_path)).save(LinearModel(FEATURES, [0.0] * len(FEATURES), 45.0))
+
+    with pytest.raises(SystemExit) as exit_info:
+        pcs_chrono.main(["predict", "estimate", "--models-dir", str(tmp_path), *features])
+    assert str(exit_info.value.code).startswith("pcs-chrono predict: ")
+
+def test_export_without_dataset(tmp_path):
+    with pytest.raises(SystemExit) as exit_info:
+        pcs_chrono.main(
+            ["export", "--output", str(tmp_path / "out"), "--data-dir", str(tmp_path)]
+        )
+    assert "FileNotFoundError" in str(exit_info.value.code)
+
+@pytest.mark.parametrize("argv", [["crawl"], ["update"], ["predict", "train"]])
+def test_other_errors_raise(monkeypatch, argv):
+    def run(args):
+        raise KeyError("race_url")
+    monkeypatch.setattr(pcs_chrono, "_crawl", run)
+    monkeypatch.setattr(pcs_chrono, "_predict", run)
+
+    with pytest.raises(KeyError):
+        pcs_chrono.main(argv)
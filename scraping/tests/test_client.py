@@ -0,0 +1,62 @@
+import asyncio
+from benchmarks.mock_pcs import MockConfig, base_url, start_server
+from src.client import (
+    ACCEPT_ENCODING, ClientConfig, ConnectionStats, create_session, create_sync_session
+)
+from src.get_tt_races import process_race_sync
+from src.utils import fetch_html_async
+
+PATHS = [f"race/mock-race-{i}/2020/result" for i in range(5)]
+
+def test_headers():
+    headers = ClientConfig(user_agent="test-agent").headers()
+
+    assert headers["User-Agent"] == "test-agent"
+    assert headers["Accept-Encoding"] == ACCEPT_ENCODING
+    assert "gzip" in ACCEPT_ENCODING
+
+def test_stats_str():
+    stats = ConnectionStats(requests=10, connections=2)
+
+    assert stats.reused == 8
+    assert str(stats) == "10 requests on 2 connections (80% on a reused connection)"
+    assert ConnectionStats().reused == 0
+
+def test_async_session_reuses_connections():
+    stats = ConnectionStats()
+
+    async def run():
+        runner = await start_server(MockConfig(riders=5, races=20))
+        try:
+            # A host name rather than an IP address, so that it is resolved
+            url = base_url(runner).replace("127.0.0.1", "localhost")
+            async with create_session(stats=stats) as session:
+                for path in PATHS:
+                    await fetch_html_async(url + path, session, verbose=False)
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+    assert stats.requests == len(PATHS)
+    assert stats.connections == 1
+    assert stats.dns_misses == 1
+
+def test_sync_session_reuses_connections():
+    stats = ConnectionStats()
+    session = create_sync_session(stats=stats)
+
+    async def run():
+        runner = await start_server(MockConfig(riders=5, races=20))
+        try:
+            return await asyncio.to_thread(lambda: [
+                process_race_sync(base_url(runner) + path, verbose=False, session=session)
+                for path in PATHS
+            ])
+        finally:
+            await runner.cleanup()
+
+    races = asyncio.run(run())
+    session.close()
+    assert len(races) == len(PATHS)
+    assert stats.requests == len(PATHS)
+    assert stats.connections == 1
@@ -0,0 +1,70 @@
+import random
+import pandas as pd
+import pytest
+from src.conversion import (
+    convert_races, convert_results, numeric_column, round_like_python, startlist_quality_column,
+    time_column
+)
+from src.get_tt_races import RACE_FRAGMENTS, handle_startlist_quality, parse_race
+from src.get_tt_results import RESULTS_FRAGMENTS, parse_results
+from src.parsing import make_soup
+from src.utils import minutes_to_seconds, to_numeric
+from tests.fixtures import pages
+
+def python_values(series : pd.Series) -> list:
+    return [None if pd.isna(value) else value for value in series.tolist()]
+
+@pytest.mark.parametrize("values", [
+    ["33.7", " 1200 ", "", "n/a", "N/A", "nan", "None", "-", "1e5", "12a", "0.5", "+3", "007"],
+    ["1", "2", "3"],
+    ["1", "", "3"],
+    ["", "n/a"],
+])
+def test_numeric_column(values):
+    expected = pd.DataFrame({"value": [to_numeric(value) for value in values]})["value"]
+    pd.testing.assert_series_equal(numeric_column(pd.Series(values)), expected, check_names=False)
+
+def test_startlist_quality_column():
+    values = ["123 (45)", "812", "", "1 2 3", "(7) 8", "n/a"]
+    assert python_values(startlist_quality_column(pd.Series(values))) == [
+        handle_startlist_quality(value) for value in values
+    ]
+
+@pytest.mark.parametrize("sep, values", [
+    (":", ["0:16", "1:02:03", "12:00", "0:00", " 1: 02"]),
+    (".", ["45.24", "45.24,57", "1.02.03,1"]),
+])
+def test_time_column(sep, values):
+    column = time_column(pd.Series(values), sep)
+    assert column.dtype == "int64"
+    assert column.tolist() == [minutes_to_seconds(value, sep) for value in values]
+
+def test_time_column_missing_values():
+    column = time_column(pd.Series(["0:16", "", "-", "1:02.5"]))
+    assert python_values(column) == [16, None, None, None]
+
+def test_round_like_python():
+    rng = random.Random(0)
+    values = [3600 * rng.randint(5, 600) / 10 / rng.randint(300, 4000) for _ in range(50_000)]
+    # Exact ties, numpy alone gives 11.362 and 46.238
+    values += [11.3625, 46.2375]
+    assert round_like_python(pd.Series(values).to_numpy(), 3).tolist() == [
+        round(value, 3) for value in values
+    ]
+
+def test_convert_races_matches_parse_race():
+    soups = [make_soup(html, fragments=RACE_FRAGMENTS) for _, html in pages("race")]
+    expected = pd.DataFrame([parse_race(soup, verbose=False) for soup in soups])
+    raw = pd.DataFrame([parse_race(soup, verbose=False, raw=True) for soup in soups])
+
+    assert raw["distance"].map(type).eq(str).all()
+    pd.testing.assert_frame_equal(convert_races(raw), expected)
+
+def test_convert_results_matches_parse_results():
+    (url, html), = pages("results")
+    soup = make_soup(html, fragments=RESULTS_FRAGMENTS)
+    expected = pd.DataFrame(parse_results(url, soup, verbose=False))
+    raw = pd.DataFrame(parse_results(url, soup, verbose=False, raw=True))
+
+    pd.testing.assert_frame_equal(convert_results(raw), expected)
+    assert convert_results(pd.DataFrame()).empty
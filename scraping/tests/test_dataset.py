@@ -0,0 +1,91 @@
+import os
+import pandas as pd
+import pytest
+from src import dataset
+from src.storage import SQLiteStorage
+from tests.test_storage import RACE, RESULT, RIDER
+
+TDF = "https://www.procyclingstats.com/race/tour-de-france/2024/stage-21"
+GANNA = "https://www.procyclingstats.com/rider/filippo-ganna/results/last-tt-results"
+
+def results(seconds_lost):
+    return pd.DataFrame([
+        {"rider_url": GANNA, "result": 2, "pnt": 70, "seconds_lost": seconds_lost,
+         "race_url": TDF},
+        {"rider_url": GANNA, "result": None, "pnt": 0, "seconds_lost": None, "race_url": TDF},
+    ])
+
+def races():
+    return pd.DataFrame([
+        {"race_title": "Tour de France 2024 Stage 21 (ITT)", "date": "2024-07-21",
+         "class": "2.UWT", "distance": 33.7, "temperature": None, "url": TDF},
+    ])
+
+def riders():
+    return pd.DataFrame([{"first_name": "Filippo", "last_name": "Ganna", "tt": 3000}])
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    dataset.clear_cache()
+    yield
+    dataset.clear_cache()
+
+@pytest.mark.parametrize("parquet", [True, False])
+def test_typed_round_trip(tmp_path, parquet):
+    dataset.write_dataset(riders(), results(31), races(), str(tmp_path), parquet=parquet)
+    assert os.path.exists(tmp_path / "results.parquet") == parquet
+
+    loaded = dataset.load_dataset(data_dir=str(tmp_path))
+    assert loaded["results"]["rider_url"].dtype == "category"
+    assert loaded["results"]["seconds_lost"].dtype == "Int32"
+    assert loaded["results"]["seconds_lost"].isna().tolist() == [False, True]
+    assert loaded["races"]["date"].dtype.kind == "M"
+    assert loaded["races"]["temperature"].dtype == "Int16"
+    assert loaded["riders"]["tt"].tolist() == [3000]
+
+def test_loads_are_memoized_until_files_change(tmp_path):
+    dataset.write_dataset(riders(), results(31), races(), str(tmp_path))
+    first = dataset.load_dataset("results", str(tmp_path))
+    first.loc[0, "seconds_lost"] = 0
+    assert dataset.load_dataset("results", str(tmp_path))["seconds_lost"].iloc[0] == 31
+
+    dataset.write_dataset(riders(), results(45), races(), str(tmp_path))
+    assert dataset.load_dataset("results", str(tmp_path))["seconds_lost"].iloc[0] == 45
+
+def test_newer_csv_wins_over_parquet(tmp_path):
+    dataset.write_dataset(riders(), results(31), races(), str(tmp_path))
+    results(45).to_csv(tmp_path / "results.csv", index=False)
+    stat = os.stat(tmp_path / "results.parquet")
+    os.utime(tmp_path / "results.csv", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert dataset.load_dataset("results", str(tmp_path))["seconds_lost"].iloc[0] == 45
+
+def test_missing_or_unknown_dataset(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        dataset.load_dataset("races", str(tmp_path))
+    with pytest.raises(ValueError):
+        dataset.load_dataset("teams", str(tmp_path))
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "sqlite"])
+def test_export_dataset(tmp_path, fmt):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    dataset.write_dataset(
+        pd.DataFrame([RIDER]), pd.DataFrame([RESULT]), pd.DataFrame([RACE]), str(data_dir)
+    )
+    output = str(tmp_path / ("export.sqlite" if fmt == "sqlite" else "export"))
+
+    counts = dataset.export_dataset(output, fmt, str(data_dir))
+
+    assert counts == {"riders": 1, "results": 1, "races": 1}
+    if fmt == "sqlite":
+        with SQLiteStorage(output) as storage:
+            assert storage.load_results()["seconds_lost"].tolist() == [62]
+    else:
+        assert os.path.exists(os.path.join(output, f"results.{fmt}"))
+        exported = dataset.load_dataset("results", output)
+        assert exported["seconds_lost"].tolist() == [62]
+
+def test_export_dataset_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        dataset.export_dataset(str(tmp_path), "xlsx", str(tmp_path))
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.features import COLUMNS, FeatureStore, load_features, refresh_features
+
+RIDERS = pd.DataFrame({
+    "url": ["https://pcs/rider/a", "https://pcs/rider/b", "https://pcs/rider/c"],
+    "birth_year": [1995, 2000, None],
+    "height": [1.80, 1.75, 1.90],
+    "weight": [70.0, 65.0, None],
+    "onedayraces": [100, 200, 300],
+    "gc": [1000, 2000, 3000],
+    "tt": [900, 800, 700],
+    "sprint": [10, 20, 30],
+    "climber": [500, 600, 700],
+    "hills": [50, 60, 70],
+})
+RACES = pd.DataFrame({
+    "url": ["https://pcs/race/x/2024", "https://pcs/race/y/2024"],
+    "date": pd.to_datetime(["2024-05-01", "2024-07-01"]),
+    "class": ["2.UWT", "1.Pro"],
+    "distance": [36.0, 20.0],
+    "vertical_meters": [100, None],
+    "startlist_quality": [900, 500],
+    "profile_score": [10, 2],
+    "temperature": [20, None],
+    "race_ranking": [5, 40],
+    "winner_time": [2700, 1500],
+    "winner_speed": [48.0, None],
+})
+RESULTS = pd.DataFrame({
+    "rider_url": [
+        f"https://pcs/rider/{rider}/results/last-tt-results" for rider in ("a", "b", "a", "c")
+    ],
+    "result": [1, 2, 3, 1],
+    "pnt": [100, 70, 20, 50],
+    "seconds_lost": [0, 30, 45, 0],
+    "race_url": [
+        "https://pcs/race/x/2024", "https://pcs/race/x/2024", "https://pcs/race/y/2024",
+        "https://pcs/race/y/2024",
+    ],
+})
+
+def test_build():
+    store = FeatureStore.build(RIDERS, RESULTS, RACES)
+    matrix = store.matrix
+
+    assert list(matrix.columns) == COLUMNS
+    assert matrix["rider_id"].dtype == np.int32
+    assert list(zip(matrix["race_id"], matrix["rider_id"])) == [(0, 0), (0, 1), (1, 0), (1, 2)]
+    row = matrix.iloc[1]
+    assert row["rider_time"] == 2730
+    assert row["rider_speed"] == round(3600 * 36 / 2730, 3)
+    assert row["age"] == 24
+    assert row["tt"] == 800
+    # A missing winner speed is computed from the distance and the winner's time
+    assert matrix["winner_speed"].tolist() == [48.0, 48.0, 48.0, 48.0]
+
+def test_unknown_rider_or_race_is_pending():
+    store = FeatureStore.build(RIDERS, RESULTS, RACES.iloc[:1])
+    assert len(store.matrix) == 2
+    assert store.pending["race_url"].tolist() == ["https://pcs/race/y/2024"] * 2
+
+    # The race page that failed arrives with a later crawl
+    assert store.update(races=RACES.iloc[1:]) == 2
+    assert store.pending.empty
+    pd.testing.assert_frame_equal(store.matrix, FeatureStore.build(RIDERS, RESULTS, RACES).matrix)
+
+def test_update_matches_build():
+    store = FeatureStore.build(RIDERS.iloc[:2], RESULTS.iloc[:3], RACES)
+    races = RACES.iloc[[1]].assign(distance=21.0)
+    riders = RIDERS.iloc[[2]]
+    results = RESULTS.iloc[[3]]
+
+    # The updated race has one result, the new rider one new result
+    assert store.update(riders, results, races) == 2
+    expected = FeatureStore.build(RIDERS, RESULTS, RACES.assign(
+        distance=[36.0, 21.0]
+    )).matrix
+    pd.testing.assert_frame_equal(store.matrix, expected)
+
+def test_updated_result_replaces_its_row():
+    store = FeatureStore.build(RIDERS, RESULTS, RACES)
+    assert store.update(results=RESULTS.iloc[[1]].assign(seconds_lost=40)) == 1
+
+    assert len(store.matrix) == len(RESULTS)
+    assert store.matrix.loc[1, "rider_time"] == 2740
+
+@pytest.mark.parametrize("dropna, rows", [(False, 4), (True, 3)])
+def test_save_and_load(tmp_path, dropna, rows):
+    store = FeatureStore.build(RIDERS, RESULTS, RACES)
+    store.save(str(tmp_path))
+
+    pd.testing.assert_frame_equal(FeatureStore.load(str(tmp_path)).matrix, store.matrix)
+    matrix = load_features(["weight", "rider_speed"], dropna=dropna, directory=str(tmp_path))
+    assert list(matrix.columns) == ["weight", "rider_speed"]
+    assert len(matrix) == rows
+
+def test_refresh_features(tmp_path):
+    directory = str(tmp_path / "features")
+    with pytest.raises(FileNotFoundError):
+        FeatureStore.load(directory)
+
+    refresh_features(RIDERS.iloc[:2], RESULTS.iloc[:3], RACES, directory=directory)
+    _, written = refresh_features(
+        RIDERS, RESULTS, RACES, fetched=(RIDERS.iloc[[2]], RESULTS.iloc[[3]], RACES.iloc[:0]),
+        directory=directory
+    )
+
+    assert written == 1
+    assert len(load_features(directory=directory)) == len(RESULTS)
+
+def test_first_incremental_refresh_builds_from_every_row(tmp_path):
+    directory = str(tmp_path / "features")
+
+    # The fetched result is of a rider crawled before
+    _, written = refresh_features(
+        RIDERS, RESULTS, RACES, fetched=(RIDERS.iloc[:0], RESULTS.iloc[[3]], RACES.iloc[:0]),
+        directory=directory
+    )
+
+    assert written == len(RESULTS)
+    assert len(load_features(directory=directory)) == len(RESULTS)
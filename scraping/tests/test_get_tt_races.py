@@ -1,6 +1,13 @@
-from typing import Dict
+from typing import Dict, Optional
 import pytest
-from src.get_tt_races import process_race_sync
+from src.get_tt_races import parse_race, parse_race_html, parse_race_results, RACE_FRAGMENTS
+from src.parsing import available_parsers, make_soup
+from tests.fixtures import read_page
+
+def race_from_fixture(url : str, parser : Optional[str] = None, fragments=RACE_FRAGMENTS):
+    result = parse_race(make_soup(read_page(url), parser, fragments), verbose=False)
+    result["url"] = url
+    return result
 
 @pytest.mark.parametrize(
     "url",
@@ -12,7 +19,9 @@ from src.get_tt_races import process_race_sync
         ("https://www.procyclingstats.com/race/volta-ao-algarve/2023/stage-5")
     ]
 )
-def test_process_race_sync_expected_keys(url : str):
+@pytest.mark.parametrize("parser", available_parsers())
+@pytest.mark.parametrize("fragments", [None, RACE_FRAGMENTS])
+def test_parse_race_expected_keys(url : str, parser : str, fragments):
     expected_keys = {
         "race_title",
         "date",
@@ -31,7 +40,7 @@ def test_process_race_sync_expected_keys(url : str):
         "url"
     }
     
-    result = process_race_sync(url, verbose=False)
+    result = race_from_fixture(url, parser, fragments)
     
     assert set(result.keys()) == expected_keys
     
@@ -156,7 +165,40 @@ def test_process_race_sync_expected_keys(url : str):
         ),
     ]
 )
-def test_process_race_sync_values(url : str, expected : Dict):
-    result = process_race_sync(url, verbose=False)
+def test_parse_race_values(url : str, expected : Dict):
+    result = race_from_fixture(url)
     for key, value in expected.items():
-        assert value == result[key]
\ No newline at end of file
+        assert value == result[key]
+
+@pytest.mark.parametrize("url, rows, last_gap, winner", [
+    ("https://www.procyclingstats.com/race/tour-de-france/2024/stage-21", 30, 258, "pogacar-tadej"),
+    ("https://www.procyclingstats.com/race/tour-de-luxembourg/2023/stage-4", 45, 394,
+     "vingegaard-jonas"),
+    # Other columns (H2H, specialty, age, UCI points) and a DNF
+    ("https://www.procyclingstats.com/race/nc-belgium-itt/2024/result", 20, 170,
+     "evenepoel-remco"),
+])
+@pytest.mark.parametrize("parser", available_parsers())
+def test_parse_race_results(url : str, rows : int, last_gap : int, winner : str, parser : str):
+    soup = make_soup(read_page(url), parser, RACE_FRAGMENTS)
+    results = parse_race_results(url, soup)
+
+    assert len(results) == rows
+    assert [result["result"] for result in results] == list(range(1, rows + 1))
+    assert results[0]["seconds_lost"] == 0
+    assert results[1]["seconds_lost"] == 6
+    assert results[-1]["seconds_lost"] == last_gap
+    assert results[0]["pnt"] == 100 and results[-1]["pnt"] == 0
+    assert {result["race_url"] for result in results} == {url}
+    # Keyed like parse_results, by the rider's results page
+    assert results[0]["rider_url"] == (
+        f"https://www.procyclingstats.com/rider/{winner}/results/last-tt-results"
+    )
+    assert parse_race_results(url, soup, raw=True)[1]["seconds_lost"] == "0:06"
+
+def test_parse_race_html_with_results():
+    url = "https://www.procyclingstats.com/race/nc-belgium-itt/2025/result"
+    html = read_page(url)
+
+    assert "results" not in parse_race_html(html)
+    assert len(parse_race_html(html, url=url)["results"]) == 20
@@ -0,0 +1,75 @@
+import pytest
+from benchmarks.mock_pcs import MockConfig, results_page
+from src.get_tt_results import RESULTS_FRAGMENTS, allowed_classes, parse_results, pnt
+from src.parsing import available_parsers, make_soup
+from tests.fixtures import read_page
+
+URL = "https://www.procyclingstats.com/rider/filippo-ganna/results/last-tt-results"
+RACE = "https://www.procyclingstats.com/race/"
+
+@pytest.mark.parametrize("parser", available_parsers())
+@pytest.mark.parametrize("fragments", [None, RESULTS_FRAGMENTS])
+def test_parse_results(parser : str, fragments):
+    results = parse_results(URL, make_soup(read_page(URL), parser, fragments), verbose=False)
+    race_urls = [result["race_url"] for result in results]
+
+    assert len(results) == 16
+    assert results[0] == {
+        "rider_url": URL,
+        "result": 3,
+        "pnt": 50,
+        "seconds_lost": 16,
+        "race_url": RACE + "tour-de-france/2025/stage-5"
+    }
+    assert all(result["pnt"] == pnt[result["result"]] for result in results)
+    # DNF, 112th place, 22nd place, 1.1 class and forbidden races are skipped
+    assert RACE + "giro-d-italia/2025/stage-1" not in race_urls
+    assert RACE + "giro-d-italia/2025/stage-14" not in race_urls
+    assert RACE + "vuelta-a-espana/2024/stage-21" not in race_urls
+    assert RACE + "chrono-des-nations/2024/result" not in race_urls
+    assert RACE + "giro-d-italia/2022/stage-21" not in race_urls
+    # The walk stops at the first result before 2020
+    assert race_urls[-1] == RACE + "world-championship-itt/2020/result"
+
+def test_parse_results_stops_at_known_race():
+    soup = make_soup(read_page(URL), fragments=RESULTS_FRAGMENTS)
+    known_races = {RACE + "olympic-games-itt/2024/result"}
+
+    results = parse_results(URL, soup, verbose=False, known_races=known_races)
+    assert [result["race_url"] for result in results] == [
+        RACE + "tour-de-france/2025/stage-5",
+        RACE + "nc-italy-itt/2025/result",
+        RACE + "giro-d-italia/2025/stage-10",
+        RACE + "tirreno-adriatico/2025/stage-1",
+        RACE + "volta-ao-algarve/2025/stage-5",
+        RACE + "world-championship-itt/2024/result",
+    ]
+
+@pytest.mark.parametrize("known_races", [None, {RACE + "olympic-games-itt/2024/result"}])
+def test_rows_without_race_link_are_skipped(known_races):
+    soup = make_soup(read_page(URL), fragments=RESULTS_FRAGMENTS)
+    first = soup.select_one("div.page-content table > tbody > tr > td:nth-child(2) > a")
+    first.unwrap()
+
+    results = parse_results(URL, soup, verbose=False, known_races=known_races)
+
+    assert results[0]["race_url"] == RACE + "nc-italy-itt/2025/result"
+    assert len(results) == (15 if known_races is None else 5)
+
+def test_parse_long_results_table():
+    html = results_page(MockConfig(riders=1, races=1000, results_per_rider=600), 0)
+    soup = make_soup(html, fragments=RESULTS_FRAGMENTS)
+    cells = [
+        [td.get_text() for td in row.select("td")]
+        for row in soup.select("div.page-content table > tbody > tr")
+    ]
+
+    results = parse_results(URL, soup, verbose=False)
+    assert len(cells) == 600
+    assert len(results) == sum(
+        row[3] in allowed_classes and int(row[2]) <= 20 for row in cells
+    )
+    assert [result["seconds_lost"] for result in results[:3]] == [
+        int(row[5].split(":")[0]) * 60 + int(row[5].split(":")[1])
+        for row in cells if row[3] in allowed_classes and int(row[2]) <= 20
+    ][:3]
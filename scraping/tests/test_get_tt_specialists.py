@@ -1,6 +1,18 @@
 from typing import Dict
+import asyncio
 import pytest
-from src.get_tt_specialists import process_rider_sync
+from src import get_tt_specialists
+from src.get_tt_specialists import (
+    RANKINGS_FRAGMENTS, RIDER_FRAGMENTS, get_all_tt_specialists_async, parse_rankings, parse_rider,
+    rankings_url
+)
+from src.parsing import available_parsers, make_soup
+from tests.fixtures import read_page
+
+def rider_from_fixture(full_name : str, url : str, parser=None, fragments=RIDER_FRAGMENTS):
+    result = parse_rider(full_name, make_soup(read_page(url), parser, fragments), verbose=False)
+    result["url"] = url
+    return result
 
 @pytest.mark.parametrize(
     "full_name, url",
@@ -10,7 +22,9 @@ from src.get_tt_specialists import process_rider_sync
         ("BILBAO Pello", "https://www.procyclingstats.com/rider/pello-bilbao")
     ]
 )
-def test_process_rider_sync_expected_keys(full_name : str, url : str):
+@pytest.mark.parametrize("parser", available_parsers())
+@pytest.mark.parametrize("fragments", [None, RIDER_FRAGMENTS])
+def test_parse_rider_expected_keys(full_name : str, url : str, parser : str, fragments):
     expected_keys = {
         "first_name",
         "last_name",
@@ -29,7 +43,7 @@ def test_process_rider_sync_expected_keys(full_name : str, url : str):
         "url"
     }
      
-    result = process_rider_sync(full_name, url, verbose=False)
+    result = rider_from_fixture(full_name, url, parser, fragments)
     
     assert set(result.keys()) == expected_keys
     assert isinstance(result["url"], str)
@@ -84,7 +98,7 @@ def test_process_rider_sync_expected_keys(full_name : str, url : str):
         )
     ]
 )  
-def test_process_rider_sync_values(full_name : str, url : str, expected : Dict):
+def test_parse_rider_values(full_name : str, url : str, expected : Dict):
     # Since some stats can change, we only check for a subset of keys
     assertable_keys = {
         "first_name",
@@ -94,7 +108,46 @@ def test_process_rider_sync_values(full_name : str, url : str, expected : Dict):
         # Height and weight can change
     }
     
-    result = process_rider_sync(full_name, url, verbose=False)
+    result = rider_from_fixture(full_name, url)
     
     for key in assertable_keys:
         assert result[key] == expected[key]
+
+@pytest.mark.parametrize("fragments", [None, RANKINGS_FRAGMENTS])
+def test_parse_rankings(fragments):
+    soup = make_soup(read_page(rankings_url(2024)), fragments=fragments)
+
+    riders = parse_rankings(soup)
+    assert len(riders) == 100
+    assert riders[0] == ("GANNA Filippo", "https://www.procyclingstats.com/rider/filippo-ganna")
+    assert parse_rankings(soup, limit=10) == riders[:10]
+
+def rankings_page(year : int, offset : int) -> str:
+    # Riders are ranked the same way every year but with a shift, so that years overlap
+    rows = "".join(
+        f'<tr><td>{rank}</td><td></td><td></td>'
+        f'<td><a href="rider/rider-{rank + year}">RIDER{rank + year} Name</a></td></tr>'
+        for rank in range(offset, offset + 100)
+    )
+    return (
+        '<html><body><div class="wrapper"><div class="content"><div class="page-content"><div>'
+        f'<div></div><div></div><div></div><div><table><tbody>{rows}</tbody></table></div>'
+        '</div></div></div></div></body></html>'
+    )
+
+def test_discover_tt_specialists(monkeypatch):
+    fetched = []
+
+    async def fake_fetch_async(url, session, **kwargs):
+        fetched.append(url)
+        query = dict(param.split("=") for param in url.split("?")[1].split("&"))
+        year = int(query["date"][:4]) + 1
+        return make_soup(rankings_page(year, int(query["offset"])), fragments=kwargs["fragments"])
+
+    monkeypatch.setattr(get_tt_specialists, "fetch_async", fake_fetch_async)
+    riders = asyncio.run(get_all_tt_specialists_async(None, years=range(2020, 2023), top_n=150))
+
+    assert len(fetched) == 6
+    assert len(riders) == 152
+    assert ("RIDER2020 Name", "https://www.procyclingstats.com/rider/rider-2020") in riders
+    assert ("RIDER2172 Name", "https://www.procyclingstats.com/rider/rider-2172") not in riders
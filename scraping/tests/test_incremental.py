@@ -0,0 +1,55 @@
+import time
+import pandas as pd
+from src.incremental import IncrementalState, mark_refreshed
+
+GANNA = "https://www.procyclingstats.com/rider/filippo-ganna"
+AFFINI = "https://www.procyclingstats.com/rider/edoardo-affini"
+TDF = "https://www.procyclingstats.com/race/tour-de-france/2024/stage-21"
+GIRO = "https://www.procyclingstats.com/race/giro-d-italia/2024/stage-7"
+
+def write_datasets(data_dir):
+    pd.DataFrame([
+        {"first_name": "Filippo", "last_name": "Ganna", "tt": 3000, "url": GANNA},
+    ]).to_csv(data_dir / "riders.csv", index=False)
+    pd.DataFrame([
+        {"rider_url": GANNA + "/results/last-tt-results", "result": 2, "race_url": TDF},
+    ]).to_csv(data_dir / "results.csv", index=False)
+    pd.DataFrame([
+        {"race_title": "Tour de France 2024 Stage 21 (ITT)", "date": "2024-07-21", "url": TDF},
+    ]).to_csv(data_dir / "races.csv", index=False)
+
+def test_known_state(tmp_path):
+    write_datasets(tmp_path)
+    state = IncrementalState.load(str(tmp_path))
+
+    assert state.known_races() == {TDF}
+    assert state.known_results() == {GANNA + "/results/last-tt-results": {TDF}}
+    assert state.riders_to_crawl([("AFFINI Edoardo", AFFINI)]) == [
+        ("AFFINI Edoardo", AFFINI),
+        ("GANNA Filippo", GANNA)
+    ]
+
+def test_only_recent_profiles_are_fresh(tmp_path):
+    write_datasets(tmp_path)
+    assert IncrementalState.load(str(tmp_path)).fresh_riders() == set()
+
+    mark_refreshed([GANNA], str(tmp_path))
+    assert IncrementalState.load(str(tmp_path)).fresh_riders() == {GANNA}
+
+    mark_refreshed([GANNA], str(tmp_path), at=time.time() - 30 * 24 * 3600)
+    assert IncrementalState.load(str(tmp_path)).fresh_riders() == set()
+
+def test_merge_deduplicates(tmp_path):
+    write_datasets(tmp_path)
+    state = IncrementalState.load(str(tmp_path))
+    riders = pd.DataFrame([{"first_name": "Filippo", "last_name": "Ganna", "tt": 3100, "url": GANNA}])
+    results = pd.DataFrame([
+        {"rider_url": GANNA + "/results/last-tt-results", "result": 2, "race_url": TDF},
+        {"rider_url": GANNA + "/results/last-tt-results", "result": 1, "race_url": GIRO},
+    ])
+
+    riders, results, races = state.merge(riders, results, pd.DataFrame())
+
+    assert riders["tt"].tolist() == [3100]
+    assert sorted(results["race_url"]) == [GIRO, TDF]
+    assert races["url"].tolist() == [TDF]
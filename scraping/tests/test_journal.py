@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from src import pipeline
+from src.journal import CheckpointJournal
+from src.pipeline import CrawlPipeline
+from src.tasks import FailureReport, RetryPolicy
+
+RIDERS = [(f"RIDER{i} Name", f"https://pcs/rider/rider-{i}") for i in range(6)]
+
+def test_replay(tmp_path):
+    path = str(tmp_path / "crawl.journal")
+    with CheckpointJournal(path) as journal:
+        journal.record("races", "https://pcs/race/a", {"url": "https://pcs/race/a", "x": "1:02"})
+        journal.record("results", "https://pcs/rider/b", [])
+
+    with CheckpointJournal(path, resume=True) as journal:
+        assert len(journal) == 2
+        assert journal.take("races", "https://pcs/race/a")["x"] == "1:02"
+        assert journal.take("races", "https://pcs/race/a") is None
+        assert journal.take("results", "https://pcs/rider/b") == []
+        assert journal.take("races", "https://pcs/race/c") is None
+        assert journal.replayed == 2
+
+    # Without resume the journal starts empty
+    with CheckpointJournal(path) as journal:
+        assert len(journal) == 0
+    assert (tmp_path / "crawl.journal").read_text() == ""
+
+def test_torn_line_is_dropped(tmp_path):
+    path = str(tmp_path / "crawl.journal")
+    with CheckpointJournal(path) as journal:
+        journal.record("races", "a", {"n": 1})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"stage": "races", "url": "b", "rec')
+
+    with CheckpointJournal(path, resume=True) as journal:
+        assert len(journal) == 1
+        journal.record("races", "c", {"n": 3})
+    with CheckpointJournal(path, resume=True) as journal:
+        assert journal.take("races", "c") == {"n": 3}
+
+def test_compact(tmp_path):
+    path = str(tmp_path / "crawl.journal")
+    with CheckpointJournal(path) as journal:
+        for n in range(3):
+            journal.record("races", "a", {"n": n})
+        journal.record("races", "b", {"n": 0})
+        journal.compact()
+        journal.record("races", "c", {"n": 0})
+
+    assert len((tmp_path / "crawl.journal").read_text().splitlines()) == 3
+    with CheckpointJournal(path, resume=True) as journal:
+        assert journal.take("races", "a") == {"n": 2}
+
+@pytest.fixture
+def flaky_site(monkeypatch):
+    calls = {"riders": [], "results": [], "races": []}
+    broken = {"https://pcs/race/rider-4-race", "https://pcs/race/rider-5-race"}
+
+    async def process_rider(name, url, session, **kwargs):
+        calls["riders"].append(url)
+        return {"full_name": name, "url": url}
+
+    async def process_results(url, session, **kwargs):
+        calls["results"].append(url)
+        rider = url.split("/")[4]
+        return [
+            {"rider_url": url, "race_url": "https://pcs/race/race-0"},
+            {"rider_url": url, "race_url": f"https://pcs/race/{rider}-race"},
+        ]
+
+    async def process_race(url, session, **kwargs):
+        calls["races"].append(url)
+        if url in broken:
+            raise ConnectionError("interrupted")
+        return {"url": url}
+
+    monkeypatch.setattr(pipeline, "process_rider", process_rider)
+    monkeypatch.setattr(pipeline, "process_results", process_results)
+    monkeypatch.setattr(pipeline, "process_race", process_race)
+    return calls, broken
+
+def test_resume_skips_completed_pages(flaky_site, tmp_path):
+    calls, broken = flaky_site
+    path = str(tmp_path / "crawl.journal")
+
+    async def crawl(journal):
+        crawl = CrawlPipeline(
+            None, FailureReport(), RetryPolicy(attempts=1), concurrency=2, progress=False,
+            journal=journal
+        )
+        return await crawl.run(RIDERS)
+
+    with CheckpointJournal(path) as journal:
+        _, _, races = asyncio.run(crawl(journal))
+    assert len(races) == 5
+
+    broken.clear()
+    for urls in calls.values():
+        urls.clear()
+    with CheckpointJournal(path, resume=True) as journal:
+        riders, results, races = asyncio.run(crawl(journal))
+        journal.compact()
+
+    # Only the races that failed are fetched again, every stage is complete
+    assert calls == {
+        "riders": [],
+        "results": [],
+        "races": ["https://pcs/race/rider-4-race", "https://pcs/race/rider-5-race"]
+    }
+    assert (len(riders), len(results), len(races)) == (6, 12, 7)
+    assert len((tmp_path / "crawl.journal").read_text().splitlines()) == 6 + 6 + 7
+
+def test_failed_crawl_closes_the_journal_and_cache(monkeypatch, tmp_path):
+    import main
+    import pcs_chrono
+    from src.cache import ResponseCache
+    monkeypatch.setattr(main, "DEFAULT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(main, "DEFAULT_JOURNAL_PATH", str(tmp_path / "crawl.journal"))
+
+    async def crawl(cache, journal, **kwargs):
+        cache.store(RIDERS[0][1], "<html>rider</html>")
+        journal.record("riders", RIDERS[0][1], {"url": RIDERS[0][1]})
+        raise ValueError("write failed")
+    monkeypatch.setattr(main, "main", crawl)
+
+    with pytest.raises(ValueError):
+        main.run(pcs_chrono.build_parser().parse_args(["crawl"]))
+
+    # Both were flushed : the page is neither fetched again nor parsed again on --resume
+    assert ResponseCache(str(tmp_path / "cache")).get(RIDERS[0][1]) == "<html>rider</html>"
+    with CheckpointJournal(str(tmp_path / "crawl.journal"), resume=True) as journal:
+        assert journal.take("riders", RIDERS[0][1]) == {"url": RIDERS[0][1]}
@@ -0,0 +1,65 @@
+import pytest
+import requests
+from src.get_tt_races import RACE_FRAGMENTS, parse_race, parse_race_results
+from src.get_tt_results import RESULTS_FRAGMENTS, parse_results
+from src.get_tt_specialists import (
+    RANKINGS_FRAGMENTS, RANKINGS_PAGE_SIZE, RIDER_FRAGMENTS, parse_rankings, parse_rider
+)
+from src.parsing import available_parsers, make_soup
+from tests.fixtures import load_manifest
+
+# The corpus may be synthetic (see tests.fixtures) : these tests catch a drift of the real markup.
+# They are skipped unless pytest runs with --live
+pytestmark = pytest.mark.live
+
+EXTRACTORS = {
+    "race" : (RACE_FRAGMENTS, lambda url, soup: parse_race(soup, verbose=False)),
+    "rider" : (RIDER_FRAGMENTS, lambda url, soup: parse_rider("RIDER Name", soup, verbose=False)),
+    "results" : (RESULTS_FRAGMENTS, lambda url, soup: parse_results(url, soup, verbose=False)),
+    "rankings" : (RANKINGS_FRAGMENTS, lambda url, soup: parse_rankings(soup)),
+}
+
+@pytest.fixture(scope="module")
+def live_pages():
+    session = requests.Session()
+    cache = {}
+    def get(url):
+        if url not in cache:
+            response = session.get(url, timeout=30)
+            response.raise_for_status()
+            cache[url] = response.text
+        return cache[url]
+    yield get
+    session.close()
+
+@pytest.mark.parametrize("entry", load_manifest(), ids=lambda entry: entry["file"])
+def test_extractors_agree_on_live_pages(live_pages, entry):
+    fragments, extract = EXTRACTORS[entry["kind"]]
+    html = live_pages(entry["url"])
+
+    # Every backend, on the whole page and on the fragments, gives the same output
+    outputs = [
+        extract(entry["url"], make_soup(html, parser, only))
+        for parser in available_parsers()
+        for only in (None, fragments)
+    ]
+    assert outputs[0]
+    assert all(output == outputs[0] for output in outputs)
+    if entry["kind"] == "rankings":
+        assert len(outputs[0]) == RANKINGS_PAGE_SIZE
+
+@pytest.mark.parametrize(
+    "entry", [entry for entry in load_manifest() if entry["kind"] == "race"],
+    ids=lambda entry: entry["file"]
+)
+def test_race_result_tables_on_live_pages(live_pages, entry):
+    results = parse_race_results(
+        entry["url"], make_soup(live_pages(entry["url"]), fragments=RACE_FRAGMENTS)
+    )
+
+    assert results
+    assert [result["result"] for result in results] == list(range(1, len(results) + 1))
+    # The gaps, read from the hidden spans, grow from the winner down
+    gaps = [result["seconds_lost"] for result in results]
+    assert gaps[0] == 0
+    assert gaps == sorted(gaps)
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import aiohttp
+import pytest
+from benchmarks.mock_pcs import MockConfig, base_url, start_server
+from src import get_tt_results
+from src.metrics import Histogram, Metrics, page_type
+from src.pipeline import CrawlPipeline
+from src.tasks import FailureReport, RetryPolicy
+from src.workers import ParsePool
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://www.procyclingstats.com/rankings.php?date=2023-12-31&offset=0", "rankings"),
+    ("https://www.procyclingstats.com/rider/filippo-ganna", "rider"),
+    ("https://www.procyclingstats.com/rider/filippo-ganna/results/last-tt-results", "results"),
+    ("https://www.procyclingstats.com/race/tour-de-france/2024/stage-7", "race"),
+    ("https://www.procyclingstats.com/", "other"),
+])
+def test_page_type(url, expected):
+    assert page_type(url) == expected
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(0.1, 0.2, 0.4))
+    for value in (0.05, 0.15, 0.15, 0.3, 1.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.quantile(0.5) == pytest.approx(0.175)
+    assert histogram.quantile(0.99) == 0.4
+    assert Histogram().quantile(0.5) is None
+
+def test_prometheus_textfile(tmp_path):
+    metrics = Metrics()
+    with metrics.fetch("https://pcs/race/a/2024/result"):
+        pass
+    metrics.response("https://pcs/race/a/2024/result", 200, 1500)
+    metrics.response("https://pcs/rider/b", 429)
+    metrics.parsed("race", 0.003)
+    metrics.queue_depth("races", 4)
+    path = tmp_path / "metrics.prom"
+    metrics.write_prometheus(str(path))
+    text = path.read_text()
+
+    assert 'pcs_fetch_seconds_bucket{page_type="race",le="+Inf"} 1' in text
+    assert 'pcs_parse_seconds_bucket{page_type="race",le="0.005"} 1' in text
+    assert 'pcs_response_bytes_total{page_type="race"} 1500' in text
+    assert 'pcs_responses_total{status="429"} 1' in text
+    assert 'pcs_queue_depth_max{stage="races"} 4' in text
+    assert not (tmp_path / "metrics.prom.tmp").exists()
+
+async def crawl_mock(config, riders, monkeypatch, pool=None):
+    runner = await start_server(config)
+    metrics = Metrics()
+    try:
+        async with aiohttp.ClientSession() as session:
+            url = base_url(runner)
+            # The race URLs of the results pages are built from BASE_URL
+            monkeypatch.setattr(get_tt_results, "BASE_URL", url)
+            crawl = CrawlPipeline(
+                session, FailureReport(), RetryPolicy(attempts=3, base_delay=0), concurrency=2,
+                pool=pool, progress=False, metrics=metrics
+            )
+            await crawl.run((f"RIDER{i} Mock", f"{url}rider/rider-{i}") for i in range(riders))
+        return crawl, metrics
+    finally:
+        await runner.cleanup()
+
+@pytest.mark.parametrize("workers", [None, 1])
+def test_crawl_is_measured(workers, tmp_path, monkeypatch):
+    config = MockConfig(riders=3, races=10, rate_429=0.2, retry_after=0)
+
+    async def run():
+        pool = ParsePool(workers) if workers else None
+        try:
+            return await crawl_mock(config, 3, monkeypatch, pool)
+        finally:
+            if pool is not None:
+                pool.close()
+
+    crawl, metrics = asyncio.run(run())
+    requests = 3 + 3 + len(crawl.races)
+
+    assert len(crawl.report) == 0
+    assert len(crawl.races) == 10
+    # Every attempt is timed, 429s included
+    assert sum(h.count for h in metrics.fetch_seconds.values()) == sum(metrics.statuses.values())
+    assert metrics.statuses[200] == requests
+    assert metrics.parse_seconds["race"].count == len(crawl.races)
+    assert metrics.parse_seconds["results"].count == 3
+    assert metrics.response_bytes["race"] > 0
+    assert metrics.in_flight == 0
+    assert 1 <= metrics.max_in_flight <= 6
+    assert set(metrics.queue_depths) == {"riders", "results", "races"}
+    metrics.to_json(str(tmp_path / "metrics.json"))
+    with open(tmp_path / "metrics.json", encoding="utf-8") as f:
+        report = json.load(f)
+    assert len(report["url_seconds"]) == requests
+    assert "race" in metrics.summary()
@@ -0,0 +1,57 @@
+import asyncio
+import aiohttp
+from benchmarks.load_test import run_load_test
+from benchmarks.mock_pcs import STATS, MockConfig, base_url, start_server
+from src.get_tt_races import RACE_FRAGMENTS, parse_race
+from src.get_tt_results import RESULTS_FRAGMENTS, parse_results
+from src.get_tt_specialists import RANKINGS_FRAGMENTS, RIDER_FRAGMENTS, parse_rankings, parse_rider
+from src.parsing import make_soup
+
+async def fetch_pages(config, paths):
+    runner = await start_server(config)
+    try:
+        async with aiohttp.ClientSession() as session:
+            pages = []
+            for path in paths:
+                async with session.get(base_url(runner) + path) as response:
+                    pages.append((response.status, response.headers, await response.text()))
+            return pages, runner.app[STATS]
+    finally:
+        await runner.cleanup()
+
+def test_pages_follow_pcs_markup():
+    config = MockConfig(riders=150, races=400)
+    pages, stats = asyncio.run(fetch_pages(config, [
+        "rankings.php?date=2023-12-31&offset=100&s=time-trial",
+        "rider/rider-7",
+        "rider/rider-7/results/last-tt-results",
+        "race/mock-race-12/2020/result",
+        "race/mock-race-400/2020/result",
+    ]))
+    (_, _, rankings), (_, _, rider), (_, _, results), (_, _, race), (status, _, _) = pages
+
+    assert len(parse_rankings(make_soup(rankings, fragments=RANKINGS_FRAGMENTS))) == 50
+    assert parse_rider("RIDER7 Mock", make_soup(rider, fragments=RIDER_FRAGMENTS), False)["tt"] >= 0
+    assert parse_results("url", make_soup(results, fragments=RESULTS_FRAGMENTS), False)
+    assert parse_race(make_soup(race, fragments=RACE_FRAGMENTS), False)["winner_time"] == 1801
+    assert status == 404
+    assert stats.statuses == {200: 4, 404: 1}
+
+def test_injected_failures():
+    pages, _ = asyncio.run(fetch_pages(MockConfig(rate_429=1, retry_after=3), ["rider/rider-1"]))
+    assert pages[0][0] == 429
+    assert pages[0][1]["Retry-After"] == "3"
+
+    pages, _ = asyncio.run(fetch_pages(MockConfig(error_rate=1), ["rider/rider-1"]))
+    assert pages[0][0] == 503
+
+def test_load_test_crawls_every_rider(tmp_path):
+    figures = asyncio.run(run_load_test(
+        MockConfig(riders=20, races=60, rate_429=0.05, retry_after=0), workdir=str(tmp_path)
+    ))
+
+    assert figures["returncode"] == 0
+    assert figures["riders"] == 20
+    assert figures["races"] > 0
+    assert figures["failed_pages"] == 0
+    assert figures["requests_per_s"] > 0
@@ -0,0 +1,71 @@
+import pytest
+from src.parsing import Fragment, TableSchema, available_parsers, child_elements, make_soup
+
+HTML = """
+<html><head><title>Race results</title></head><body>
+<div class="header"><ul><li>menu</li></ul></div>
+<div class="borderbox w30 right mb_w100"><ul><li><div class="value">33.7 km</div></li></ul></div>
+<div id="resultsCont"><table><tr><td class="time ar"><span>45:24</span></td></tr></table></div>
+</body></html>
+"""
+FRAGMENTS = ("title", "div.borderbox.w30.right", "#resultsCont")
+
+@pytest.mark.parametrize(
+    "selector, name, attrs, expected",
+    [
+        ("title", "title", {}, True),
+        ("div.borderbox.w30", "div", {"class": "borderbox right w30"}, True),
+        ("div.borderbox.w30", "div", {"class": ["borderbox", "w30"]}, True),
+        ("div.borderbox.w30", "div", {"class": "borderbox"}, False),
+        ("div.borderbox.w30", "span", {"class": "borderbox w30"}, False),
+        ("#resultsCont", "div", {"id": "resultsCont"}, True),
+        ("#resultsCont", "div", {"id": "other"}, False),
+    ]
+)
+def test_fragment_matches(selector : str, name : str, attrs : dict, expected : bool):
+    assert Fragment(selector).matches(name, attrs) == expected
+
+@pytest.mark.parametrize("selector", ["div > a", "li:nth-child(2)", "a[href]", ""])
+def test_unsupported_fragment_selector(selector : str):
+    with pytest.raises(ValueError):
+        Fragment(selector)
+
+@pytest.mark.parametrize("parser", available_parsers())
+def test_fragments_only_keep_requested_subtrees(parser : str):
+    soup = make_soup(HTML, parser, FRAGMENTS)
+    assert soup.select_one("div.header") is None
+    assert soup.select_one("title").get_text() == "Race results"
+    assert soup.select_one("div.borderbox div.value").get_text() == "33.7 km"
+    assert soup.select_one("#resultsCont td.time.ar > span").get_text() == "45:24"
+
+@pytest.mark.parametrize("parser", available_parsers())
+def test_same_fragments_on_every_backend(parser : str):
+    reference = make_soup(HTML, "html.parser", FRAGMENTS)
+    soup = make_soup(HTML, parser, FRAGMENTS)
+    assert [str(tag) for tag in soup.find_all(recursive=False)] == [
+        str(tag) for tag in reference.find_all(recursive=False)
+    ]
+
+TABLE = """
+<table><thead><tr><th>Date</th><th>Race</th><th>Result</th></tr></thead><tbody>
+<tr><td>2024-08-01</td><td><a href="race/a">A</a></td><td>1</td></tr>
+<tr><td colspan="3">No more results</td></tr>
+<tr><td>2023-05-02</td><td><a href="race/b">B</a></td><td>DNF</td></tr>
+</tbody></table>
+"""
+
+@pytest.mark.parametrize("parser", available_parsers())
+def test_table_schema_maps_cells_to_columns(parser : str):
+    table = make_soup(TABLE, parser).table
+    rows = list(TableSchema({"date" : 0, "result" : 2, "race" : 1}).rows(table))
+
+    # The header row and the row spanning the table are skipped
+    assert [
+        (row["date"].get_text(), row["race"].a.get("href"), row["result"].get_text())
+        for row in rows
+    ] == [("2024-08-01", "race/a", "1"), ("2023-05-02", "race/b", "DNF")]
+
+def test_child_elements():
+    ul = make_soup("<ul>\n<li>1</li> text <li>2</li><p>3</p></ul>").ul
+    assert [tag.get_text() for tag in child_elements(ul)] == ["1", "2", "3"]
+    assert [tag.get_text() for tag in child_elements(ul, "li")] == ["1", "2"]
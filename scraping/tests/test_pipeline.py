@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from src import pipeline
+from src.constants import RESULTS_PATH
+from src.pipeline import CrawlPipeline
+from src.tasks import FailureReport, RetryPolicy
+
+RIDERS = [(f"RIDER{i} Name", f"https://pcs/rider/rider-{i}") for i in range(10)]
+
+@pytest.fixture
+def fake_site(monkeypatch):
+    calls = {"races": []}
+
+    async def process_rider(name, url, session, **kwargs):
+        await asyncio.sleep(0.001)
+        if url.endswith("rider-3"):
+            raise IndexError("broken profile")
+        return {"full_name": name, "url": url}
+
+    async def process_results(url, session, **kwargs):
+        await asyncio.sleep(0.001)
+        rider = url.split("/")[4]
+        # Every rider shares race-0, and has one race of its own
+        return [
+            {"rider_url": url, "race_url": "https://pcs/race/race-0"},
+            {"rider_url": url, "race_url": f"https://pcs/race/{rider}-race"},
+        ]
+
+    async def process_race(url, session, **kwargs):
+        calls["races"].append(url)
+        await asyncio.sleep(0.001)
+        return {"url": url}
+
+    monkeypatch.setattr(pipeline, "process_rider", process_rider)
+    monkeypatch.setattr(pipeline, "process_results", process_results)
+    monkeypatch.setattr(pipeline, "process_race", process_race)
+    return calls
+
+def test_pipeline_streams_every_stage(fake_site):
+    report = FailureReport()
+
+    async def run():
+        crawl = CrawlPipeline(None, report, RetryPolicy(attempts=1), concurrency=3, progress=False)
+        return await crawl.run(RIDERS)
+
+    riders, results, races = asyncio.run(run())
+
+    assert len(riders) == 9
+    assert len(results) == 18
+    assert len(races) == 10
+    # Race URLs shared by several riders are only fetched once
+    assert sorted(fake_site["races"]) == sorted(set(fake_site["races"]))
+    assert report.by_stage() == {"riders": 1}
+    assert report.failures[0].url == "https://pcs/rider/rider-3"
+
+def test_race_strategy(fake_site, monkeypatch):
+    profiles = []
+
+    async def process_race(url, session, with_results=False, **kwargs):
+        assert with_results
+        # The whole field : a crawled rider and a rider only seen in race tables
+        return {"url": url, "results": [
+            {"rider_url": "https://pcs/rider/rider-0" + RESULTS_PATH, "race_url": url,
+             "rider_name": "R0"},
+            {"rider_url": "https://pcs/rider/outsider" + RESULTS_PATH, "race_url": url,
+             "rider_name": "OUT"},
+        ]}
+
+    async def process_rider(name, url, session, **kwargs):
+        profiles.append(url)
+        return {"full_name": name, "url": url}
+
+    monkeypatch.setattr(pipeline, "process_race", process_race)
+    monkeypatch.setattr(pipeline, "process_rider", process_rider)
+
+    async def run():
+        crawl = CrawlPipeline(
+            None, FailureReport(), RetryPolicy(attempts=1), concurrency=3, progress=False,
+            strategy="race"
+        )
+        return await crawl.run(RIDERS)
+
+    riders, results, races = asyncio.run(run())
+
+    assert len(races) == 11
+    # Results come from the race tables only
+    assert len(results) == 2 * 11
+    assert len(riders) == 11
+    assert sorted(profiles) == sorted({url for _, url in RIDERS} | {"https://pcs/rider/outsider"})
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        CrawlPipeline(None, FailureReport(), strategy="team")
+
+def test_handler_errors_do_not_stop_the_workers(fake_site, monkeypatch):
+    async def process_results(url, session, **kwargs):
+        if url.split("/")[4] in ("rider-1", "rider-2"):
+            return [{"rider_url": url}]
+        return [{"rider_url": url, "race_url": "https://pcs/race/race-0"}]
+    monkeypatch.setattr(pipeline, "process_results", process_results)
+    report = FailureReport()
+
+    async def run():
+        crawl = CrawlPipeline(None, report, RetryPolicy(attempts=1), concurrency=1, progress=False)
+        # Every worker would die on the missing race_url, and close() would block for ever
+        return await asyncio.wait_for(crawl.run(RIDERS), 5)
+
+    _, results, races = asyncio.run(run())
+
+    assert len(results) == 9
+    assert len(races) == 1
+    assert report.by_stage() == {"riders": 1, "results": 2}
+    assert {failure.error for failure in report.failures if failure.stage == "results"} == {
+        "KeyError"
+    }
@@ -0,0 +1,95 @@
+import asyncio
+import aiohttp
+import numpy as np
+import pandas as pd
+import pytest
+from src.prediction import FEATURES, LinearModel, MicroBatcher, ModelRegistry, train_model
+from src.serving import BATCHER, start_server
+
+COEF = [0.2, -0.01, 0.002, 0.1]
+
+def races(n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "distance": rng.uniform(5, 50, n),
+        "vertical_meters": rng.uniform(0, 800, n),
+        "startlist_quality": rng.uniform(0, 1500, n),
+        "profile_score": rng.uniform(0, 60, n),
+    })
+    df["winner_speed"] = 45 + df[FEATURES].to_numpy() @ COEF
+    return df
+
+ROW = {"distance": 30, "vertical_meters": 200, "startlist_quality": 900, "profile_score": 15}
+MODEL = LinearModel(FEATURES, COEF, 45.0)
+
+def test_train_model():
+    data = races()
+    # Missing values and misparsed speeds are left out
+    data.loc[0, "vertical_meters"] = None
+    data.loc[1, "winner_speed"] = 3060.0
+    model = train_model(data)
+
+    np.testing.assert_allclose(model.coef, COEF, atol=1e-9)
+    assert model.intercept == pytest.approx(45)
+    assert model.rows == 48
+    assert model.rmse == pytest.approx(0, abs=1e-9)
+    np.testing.assert_allclose(model.predict(data.iloc[2:]), data["winner_speed"].iloc[2:])
+    with pytest.raises(ValueError):
+        train_model(data.iloc[:1])
+
+def test_registry(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        registry.load()
+
+    assert registry.save(train_model(races())) == 1
+    assert registry.save(train_model(races(seed=1))) == 2
+    assert registry.versions() == [1, 2]
+
+    loaded = ModelRegistry(str(tmp_path)).load()
+    assert loaded.version == 2
+    assert loaded == registry.load(2)
+    assert ModelRegistry(str(tmp_path)).load(1).predict(np.array([[30, 200, 900, 15]]))[0] \
+        == pytest.approx(MODEL.predict(np.array([[30, 200, 900, 15]]))[0])
+
+def test_batcher_groups_concurrent_requests():
+    batcher = MicroBatcher(MODEL, max_batch=64)
+
+    async def run():
+        return await asyncio.gather(*(
+            batcher.predict({**ROW, "distance": distance}) for distance in range(100)
+        ))
+
+    predictions = asyncio.run(run())
+    expected = MODEL.predict(pd.DataFrame([{**ROW, "distance": d} for d in range(100)]))
+    np.testing.assert_allclose(predictions, expected)
+    assert (batcher.batches, batcher.predictions) == (2, 100)
+
+def test_server():
+    async def run():
+        runner = await start_server(MODEL)
+        host, port = runner.addresses[0][:2]
+        url = f"http://{host}:{port}"
+        try:
+            async with aiohttp.ClientSession() as session:
+                async def post(body):
+                    async with session.post(url + "/predict", json=body) as response:
+                        return response.status, await response.json()
+
+                single = await asyncio.gather(*(post(ROW) for _ in range(20)))
+                rows = await post({"rows": [ROW, {**ROW, "distance": 10}]})
+                missing = await post({"distance": 30})
+                async with session.get(url + "/model") as response:
+                    model = await response.json()
+            return single, rows, missing, model, runner.app[BATCHER]
+        finally:
+            await runner.cleanup()
+
+    single, rows, missing, model, batcher = asyncio.run(run())
+    expected = MODEL.predict(pd.DataFrame([ROW, {**ROW, "distance": 10}])).tolist()
+    assert all(status == 200 for status, _ in single)
+    assert single[0][1] == {"prediction": pytest.approx(expected[0]), "version": 0}
+    assert batcher.predictions == 20
+    assert rows == (200, {"predictions": pytest.approx(expected), "version": 0})
+    assert missing[0] == 400
+    assert model["coef"] == COEF
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.query import QueryEngine, build_index
+
+RIDERS = pd.DataFrame({
+    "full_name": ["Edoardo Affini", "Filippo Ganna"],
+    "url": ["https://pcs/rider/edoardo-affini", "https://pcs/rider/filippo-ganna"],
+})
+RACES = pd.DataFrame({
+    "race_title": ["Worlds ITT", "Giro Stage 7", "Prologue", "Nationals"],
+    "date": pd.to_datetime(["2024-09-22", "2024-05-10", "2023-03-01", "2024-06-20"]),
+    "class": ["WC", "2.UWT", "2.UWT", None],
+    "distance": [46.1, 40.6, 5.0, None],
+    "vertical_meters": [405, 408, 10, 300],
+    "startlist_quality": [1500, 900, 400, None],
+    "profile_score": [10, 20, 0, None],
+    "winner_time": [3181, 3200, 360, None],
+    "winner_speed": [52.172, 45.675, 50.0, None],
+    "url": [f"https://pcs/race/{i}" for i in range(4)],
+})
+RESULTS = pd.DataFrame({
+    "rider_url": [
+        f"https://pcs/rider/{rider}/results/last-tt-results"
+        for rider in ("edoardo-affini", "filippo-ganna", "edoardo-affini", "filippo-ganna",
+                      "edoardo-affini", "stefan-kung")
+    ],
+    "result": [3, 2, 17, 1, 1, 5],
+    "pnt": [100, 150, 0, 80, 50, 30],
+    "seconds_lost": [55, 7, 162, 0, 0, 20],
+    "race_url": [f"https://pcs/race/{i}" for i in (0, 0, 1, 2, 3, 0)],
+})
+
+@pytest.fixture
+def engine(tmp_path):
+    build_index(RIDERS, RESULTS, RACES, str(tmp_path))
+    return QueryEngine(str(tmp_path))
+
+def test_ids_and_csr(engine):
+    # A rider only known from a result gets an id
+    assert engine.meta["riders"] == 3
+    assert isinstance(engine["result_rider"], np.memmap)
+    assert engine["rider_url"][2] == "https://pcs/rider/stefan-kung"
+    # Results of a rider latest first, of a race by rank
+    assert engine.results_frame(engine.find_results("affini"))["race"].tolist() == [
+        "Worlds ITT", "Nationals", "Giro Stage 7"
+    ]
+    assert engine.results_frame(engine.find_results(classes=["WC"]))["result"].tolist() == [
+        2, 3, 5
+    ]
+
+@pytest.mark.parametrize("filters, races", [
+    ({}, [0, 1, 2, 3]),
+    ({"since": "2024-01-01"}, [0, 1, 3]),
+    ({"since": "2024-01-01", "until": "2024-06-20"}, [1, 3]),
+    ({"min_distance": 30}, [0, 1]),
+    ({"max_distance": 41}, [1, 2]),
+    ({"min_climb": 300, "max_climb": 405}, [0, 3]),
+    ({"classes": ["2.UWT"]}, [1, 2]),
+    ({"classes": ["2.UWT", "WC"], "since": "2024-01-01"}, [0, 1]),
+    ({"classes": ["NC"]}, []),
+])
+def test_find_races(engine, filters, races):
+    assert engine.find_races(**filters).tolist() == races
+
+def test_find_results(engine):
+    rows = engine.find_results(
+        "https://pcs/rider/edoardo-affini", min_distance=30, min_climb=300
+    )
+    frame = engine.results_frame(rows)
+    assert frame["race"].tolist() == ["Worlds ITT", "Giro Stage 7"]
+    assert frame["speed"].iloc[0] == round(3600 * 46.1 / (3181 + 55), 3)
+    assert len(engine.find_results()) == len(RESULTS)
+    assert len(engine.find_results("nobody")) == 0
+
+def test_top(engine):
+    fastest = engine.top_races(engine.find_races(), "winner_speed", 2)
+    assert engine.races_frame(fastest)["race"].tolist() == ["Worlds ITT", "Prologue"]
+    assert engine.races_frame(fastest)["results"].tolist() == [3, 1]
+    slowest = engine.top_races(engine.find_races(), "winner_speed", 10, ascending=True)
+    assert slowest.tolist() == [1, 2, 0]
+
+    rows = engine.top_results(engine.find_results(classes=["WC"]), "speed", 1)
+    assert engine.results_frame(rows)["rider"].tolist() == ["Filippo Ganna"]
+
+def test_incomplete_index(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        QueryEngine(str(tmp_path))
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.ratings import RatingConfig, RatingEngine, rate_race, refresh_ratings
+
+RACES = pd.DataFrame({
+    "url": [f"https://pcs/race/{i}" for i in range(4)],
+    "date": pd.to_datetime(["2024-03-01", "2024-01-01", "2024-02-01", "2024-04-01"]),
+    "startlist_quality": [1000, 10, None, 1000],
+    "distance": [30.0, 30.0, 8.0, None],
+})
+RESULTS = pd.DataFrame({
+    "rider_url": [
+        f"https://pcs/rider/{rider}/results/last-tt-results"
+        for rider in ("a", "b", "c", "a", "b", "b", "c", "a", "c")
+    ],
+    "result": [1, 2, 3, 2, 1, 1, 2, 1, None],
+    "race_url": [f"https://pcs/race/{i}" for i in (0, 0, 0, 1, 1, 2, 2, 3, 3)],
+})
+
+def pairwise(ratings, ranks, races, weight, config):
+    # Reference implementation, one pair at a time
+    n = len(ratings)
+    change = np.zeros(n)
+    for i in range(n):
+        for j in range(n):
+            if i != j:
+                expected = 1 / (1 + 10 ** ((ratings[j] - ratings[i]) / config.scale))
+                score = 1.0 if ranks[i] < ranks[j] else 0.5 if ranks[i] == ranks[j] else 0.0
+                factor = max(np.sqrt(config.settle / (config.settle + races[i])), config.min_factor)
+                change[i] += config.k * weight * factor * (score - expected) / (n - 1)
+    return change
+
+def test_rate_race_matches_pairwise():
+    rng = np.random.default_rng(0)
+    config = RatingConfig()
+    ratings = rng.normal(1500, 100, 30)
+    ranks = rng.permutation(30).astype(float)
+    ranks[5] = ranks[6]
+    races = rng.integers(0, 50, 30)
+
+    change = rate_race(ratings, ranks, races, 0.7, config)
+    np.testing.assert_allclose(change, pairwise(ratings, ranks, races, 0.7, config))
+    # Equal ratings : the winner gains what the others lose
+    assert rate_race(np.full(2, 1500.0), np.array([1.0, 2.0]), np.zeros(2)).tolist() == [16, -16]
+    assert rate_race(np.full(1, 1500.0), np.array([1.0]), np.zeros(1)).tolist() == [0]
+
+@pytest.mark.parametrize("quality, distance, weight", [
+    (1000, 30.0, 1.0), (float("nan"), 30.0, 0.25), (1000, 10.0, 0.5), (0, float("nan"), 0.25)
+])
+def test_race_weight(quality, distance, weight):
+    assert RatingConfig().race_weight(quality, distance) == pytest.approx(weight)
+
+def test_races_are_rated_in_date_order():
+    engine = RatingEngine()
+    assert engine.apply(RESULTS, RACES) == 4
+    assert engine.race_urls == [f"https://pcs/race/{i}" for i in (1, 2, 0, 3)]
+
+    history = engine.history("https://pcs/rider/a")
+    assert history["race_url"].tolist() == [f"https://pcs/race/{i}" for i in (1, 0, 3)]
+    assert history["rating"].iloc[-1] == engine.ratings_table().set_index("url").loc[
+        "https://pcs/rider/a", "rating"
+    ]
+    assert history["change"].iloc[-1] == 0
+    assert engine.history("https://pcs/rider/a/results/last-tt-results").equals(history)
+    assert engine.history("https://pcs/rider/z").empty
+    # Races already rated are skipped
+    assert engine.apply(RESULTS, RACES) == 0
+
+def test_incremental_matches_full(tmp_path):
+    full = RatingEngine()
+    full.apply(RESULTS, RACES)
+
+    directory = str(tmp_path / "ratings")
+    _, rated = refresh_ratings(RESULTS, RACES.iloc[1:3], directory)
+    assert rated == 2
+    engine, rated = refresh_ratings(RESULTS, RACES, directory)
+    assert rated == 2
+
+    pd.testing.assert_frame_equal(engine.ratings_table(), full.ratings_table())
+    pd.testing.assert_frame_equal(
+        engine.history("https://pcs/rider/c"), full.history("https://pcs/rider/c")
+    )
+
+def assert_same_ratings(engine, expected):
+    pd.testing.assert_frame_equal(engine.ratings_table(), expected.ratings_table())
+    assert engine.race_urls == expected.race_urls
+    for rider in ("a", "b", "c"):
+        pd.testing.assert_frame_equal(
+            engine.history(f"https://pcs/rider/{rider}"),
+            expected.history(f"https://pcs/rider/{rider}")
+        )
+
+def test_older_race_replays_the_history(tmp_path):
+    full = RatingEngine()
+    full.apply(RESULTS, RACES)
+
+    directory = str(tmp_path / "ratings")
+    # A backfill brings race 1, older than the races rated
+    refresh_ratings(RESULTS, RACES.drop(index=1), directory)
+    engine, rated = refresh_ratings(RESULTS, RACES, directory)
+
+    assert rated == 4
+    assert_same_ratings(engine, full)
+
+def test_race_with_new_results_is_rated_again():
+    full = RatingEngine()
+    full.apply(RESULTS, RACES)
+
+    # Race 0 first known from a top 2, then from its full table
+    engine = RatingEngine()
+    engine.apply(RESULTS.drop(index=2), RACES)
+    assert engine.apply(RESULTS, RACES) == 2
+
+    assert_same_ratings(engine, full)
+
+def test_replay_without_the_rated_results_warns():
+    engine = RatingEngine()
+    engine.apply(RESULTS, RACES.drop(index=1))
+
+    with pytest.warns(UserWarning, match="rebuild the ratings"):
+        assert engine.apply(RESULTS[RESULTS["race_url"] == RACES["url"][1]], RACES.iloc[[1]]) == 1
+    assert engine.race_urls[-1] == RACES["url"][1]
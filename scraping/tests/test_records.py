@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+from src.get_tt_races import RACE_FRAGMENTS, parse_race
+from src.get_tt_results import RESULTS_FRAGMENTS, parse_results
+from src.parsing import make_soup
+from src.records import RecordBuilder
+from tests.fixtures import pages
+
+@pytest.mark.parametrize("values", [[1, 2, 3], [1, None, 3], [1, 2.5], [None, None], [0.5, None]])
+def test_number_column_dtype(values):
+    builder = RecordBuilder({"value" : "number"})
+    builder.extend({"value" : value} for value in values)
+    expected = pd.DataFrame([{"value" : value} for value in values])["value"]
+    pd.testing.assert_series_equal(builder.to_frame()["value"], expected)
+
+def test_category_column():
+    builder = RecordBuilder({"url" : "category", "other" : "object"})
+    builder.extend({"url" : url} for url in ["b", "a", None, "b"])
+    frame = builder.to_frame()
+
+    assert len(builder) == 4
+    assert list(frame["url"].cat.categories) == ["a", "b"]
+    assert frame["url"].astype(object).tolist()[:2] == ["b", "a"]
+    assert frame["url"].isna().tolist() == [False, False, True, False]
+    assert frame["other"].isna().all()
+    assert frame.sort_values("url")["url"].tolist()[:3] == ["a", "b", "b"]
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        RecordBuilder({"value" : "int8"})
+
+def test_for_table_raw():
+    assert RecordBuilder.for_table("races").columns["distance"] == "number"
+    assert RecordBuilder.for_table("races", raw=True).columns["distance"] == "object"
+    assert RecordBuilder.for_table("results").columns["race_url"] == "category"
+
+def test_frames_match_records():
+    races = [
+        dict(parse_race(make_soup(html, fragments=RACE_FRAGMENTS), verbose=False), url=url)
+        for url, html in pages("race")
+    ]
+    (url, html), = pages("results")
+    results = parse_results(url, make_soup(html, fragments=RESULTS_FRAGMENTS), verbose=False)
+
+    for table, records in (("races", races), ("results", results)):
+        builder = RecordBuilder.for_table(table)
+        builder.extend(records)
+        frame = builder.to_frame()
+        assert frame.to_csv(index=False) == pd.DataFrame(records).to_csv(index=False)
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+from src.storage import SQLiteStorage
+
+GANNA = "https://www.procyclingstats.com/rider/filippo-ganna"
+TDF = "https://www.procyclingstats.com/race/tour-de-france/2024/stage-21"
+
+RIDER = {
+    "first_name": "Filippo", "last_name": "Ganna", "full_name": "Filippo Ganna",
+    "nationality": "Italy", "birth_year": 1996, "height": 1.93, "weight": 83.0,
+    "onedayraces": 1000, "gc": 500, "tt": 4000, "sprint": 300, "climber": 10, "hills": 200,
+    "photo_url": "https://www.procyclingstats.com/images/riders/bp/ab/filippo-ganna-2025.png",
+    "url": GANNA
+}
+RACE = {
+    "race_title": "Tour de France 2024 Stage 21 (ITT)", "date": "21 July 2024",
+    "departure": "Monaco", "arrival": "Nice", "class": "2.UWT", "distance": 33.7,
+    "vertical_meters": 720, "startlist_quality": 1344, "profile_score": 73,
+    "temperature": None, "race_ranking": 1, "winner_time": 2724, "winner_speed": 44.537,
+    "profile_image_url": None, "url": TDF
+}
+RESULT = {
+    "rider_url": GANNA + "/results/last-tt-results", "result": 3, "pnt": 50,
+    "seconds_lost": 62, "race_url": TDF
+}
+
+@pytest.fixture
+def storage(tmp_path):
+    with SQLiteStorage(str(tmp_path / "pcs.sqlite")) as storage:
+        yield storage
+
+def test_schema_and_wal_mode(storage):
+    assert storage.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    indexes = {row[0] for row in storage.connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    )}
+    assert {"result_rider_id", "result_race_id", "race_date"} <= indexes
+
+def test_upserts_are_idempotent(storage):
+    for _ in range(2):
+        storage.upsert_riders([RIDER])
+        storage.upsert_races([RACE])
+        storage.upsert_results([RESULT])
+    storage.upsert_riders([{**RIDER, "tt": 4100}])
+
+    assert storage.count("rider") == 1
+    assert storage.count("race") == 1
+    assert storage.count("result") == 1
+    results = storage.load_results()
+    assert results.loc[0, "tt"] == 4100
+    assert results.loc[0, "rider_url"] == RESULT["rider_url"]
+    assert results.loc[0, "date"] == pd.Timestamp("2024-07-21")
+
+def test_results_of_unknown_races_are_skipped(storage):
+    storage.upsert_riders([RIDER])
+    storage.upsert_results([RESULT])
+    assert storage.count("result") == 0
+
+def test_write_dataframes(storage):
+    races = pd.DataFrame([RACE])
+    races["date"] = pd.to_datetime(races["date"])
+    storage.write(pd.DataFrame([RIDER]), pd.DataFrame([RESULT]), races)
+
+    results = storage.load_results("WHERE race.distance > ?", [30])
+    assert results["race_url"].tolist() == [TDF]
+    assert results["vertical_meters"].tolist() == [720]
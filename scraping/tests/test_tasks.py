@@ -0,0 +1,54 @@
+import asyncio
+import aiohttp
+import pytest
+from multidict import CIMultiDict
+from yarl import URL
+from src.tasks import FailureReport, RetryPolicy, gather_stage, retry_after, run_with_retry
+
+FAST = RetryPolicy(attempts=3, timeout=1.0, base_delay=0.0, max_delay=0.0)
+
+def http_error(status : int, headers=None) -> aiohttp.ClientResponseError:
+    request_info = aiohttp.RequestInfo(URL("https://pcs"), "GET", CIMultiDict(), URL("https://pcs"))
+    return aiohttp.ClientResponseError(request_info, (), status=status, headers=headers or {})
+
+def flaky(failures):
+    calls = {"count": 0}
+    async def job():
+        calls["count"] += 1
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+    return job, calls
+
+def test_transient_errors_are_retried():
+    job, calls = flaky([http_error(503), asyncio.TimeoutError()])
+    assert asyncio.run(run_with_retry(job, FAST)) == "ok"
+    assert calls["count"] == 3
+
+@pytest.mark.parametrize("exc", [http_error(404), IndexError("list index out of range")])
+def test_permanent_errors_are_not_retried(exc):
+    job, calls = flaky([exc])
+    report = FailureReport()
+    results = asyncio.run(gather_stage("races", [("url", job)], report, FAST))
+    assert results == []
+    assert calls["count"] == 1
+    assert report.failures[0].error == type(exc).__name__
+    assert report.failures[0].attempts == 1
+
+def test_failures_are_isolated():
+    failing, _ = flaky([http_error(500)] * 3)
+    working, _ = flaky([])
+    report = FailureReport()
+    jobs = [("a", working), ("b", failing), ("c", working)]
+    results = asyncio.run(gather_stage("riders", jobs, report, FAST, concurrency=2))
+    assert results == ["ok", "ok"]
+    assert report.by_stage() == {"riders": 1}
+    assert report.failures[0].url == "b"
+    assert report.failures[0].status == 500
+    assert report.failures[0].attempts == 3
+
+def test_retry_after_is_honored():
+    assert retry_after(http_error(429, {"Retry-After": "7"})) == 7.0
+    assert retry_after(http_error(429)) is None
+    assert FAST.delay(0, retry_after=7.0) == 7.0
+    assert RetryPolicy(max_retry_after=5).delay(0, retry_after=60.0) == 5
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+import main
+from src.metrics import Metrics
+from src.workers import ParsePool
+
+def test_results_round_trip():
+    async def run():
+        async with ParsePool(2, max_pending=1) as pool:
+            return await asyncio.gather(*(pool.run(divmod, i, 3) for i in range(10)))
+
+    assert asyncio.run(run()) == [divmod(i, 3) for i in range(10)]
+
+def test_parse_times_are_measured():
+    metrics = Metrics()
+
+    async def run():
+        async with ParsePool(1) as pool:
+            return await pool.run(sorted, "pool", metrics=metrics, kind="race")
+
+    assert asyncio.run(run()) == ["l", "o", "o", "p"]
+    assert metrics.parse_seconds["race"].count == 1
+
+def test_worker_exceptions_propagate():
+    async def run():
+        async with ParsePool(1) as pool:
+            with pytest.raises(ValueError):
+                await pool.run(int, "not a number")
+            # The worker survives the exception
+            return await pool.run(int, "42")
+
+    assert asyncio.run(run()) == 42
+
+def test_close_is_idempotent():
+    async def run():
+        pool = ParsePool(1)
+        await pool.run(abs, -1)
+        pool.close()
+        pool.close()
+        with pytest.raises(RuntimeError):
+            await pool.run(abs, -1)
+
+    asyncio.run(run())
+
+def test_crawl_stops_the_workers_when_it_raises(monkeypatch):
+    pools = []
+    class RecordingPool(ParsePool):
+        def close(self):
+            pools.append(self)
+            super().close()
+
+    async def discovery(*args, **kwargs):
+        raise ConnectionError("PCS is down")
+
+    monkeypatch.setattr(main, "ParsePool", RecordingPool)
+    monkeypatch.setattr(main, "get_all_tt_specialists_async", discovery)
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await main.main(to_csv=False, parse_workers=1, metrics=Metrics(), live_interval=60)
+        # Only the test's own task is left, the live summary was cancelled
+        await asyncio.sleep(0)
+        return len(asyncio.all_tasks())
+
+    assert asyncio.run(run()) == 1
+    assert len(pools) == 1